@@ -0,0 +1,38 @@
+"""
+dicematcher
+───────────
+Dice face recognition: template matching, CNN detectors, training and
+dataset tools.  The scripts in this folder still run on their own
+(`python detect_cnn.py`); `python -m dicematcher …` is the single entry
+point (see cli.py).
+
+Importing the package is free – no numpy, cv2 or tensorflow.  Helper
+modules are loaded on first attribute access:
+
+    import dicematcher
+    store = dicematcher.template_store.open_store("template_data")
+"""
+
+import importlib
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# importable helpers (the detect_*/train_* scripts run at import, so use the CLI)
+MODULES = ("background_model", "batch_infer", "lite_runtime", "ncc_matcher",
+           "run_config", "shards", "stage_timer", "template_store", "tf_pipeline")
+
+__all__ = list(MODULES)
+
+
+def __getattr__(name):
+    if name not in MODULES:
+        raise AttributeError(f"module 'dicematcher' has no attribute {name!r}")
+    # the modules import each other as top-level names (`from shards import …`),
+    # so load them that way too – one module object per file
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    module = importlib.import_module(name)
+    globals()[name] = module
+    return module
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+background_model.py
+───────────────────
+Online, constant-memory background estimate for the fixed rig tray.
+
+Replaces the "decode everything, average, decode everything again" pass in
+detect_crop_raw.py with a per-frame update:
+
+  • warm-up   – the first WARMUP frames are a plain cumulative mean
+  • steady    – exponential moving average (ALPHA) that only updates
+                pixels within K·σ of the current estimate, so the die
+                (an outlier wherever it lands) never bleeds into the tray
+
+Per-pixel σ is tracked with the same EMA.  Memory is two float32 arrays the
+size of one frame, whatever the run length.
+
+    bg = BackgroundModel()
+    for frame in frames:                 # BGR uint8, e.g. live rig uploads
+        diff_gray = bg.apply(frame)      # diff vs. background *before* update
+        ...
+"""
+
+import os
+import cv2
+import numpy as np
+
+# ───────── defaults ────────────────────────────────────────────────
+ALPHA   = 0.05      # EMA weight of a new frame once warmed up
+WARMUP  = 20        # frames averaged uniformly before switching to EMA
+K_SIGMA = 2.5       # outlier gate, in per-pixel standard deviations
+MIN_DEV = 8.0       # gate floor (grey levels) so a very still tray still adapts
+INIT_SD = 30.0      # σ assumed before any variance is known
+
+
+class BackgroundModel:
+    def __init__(self, alpha=ALPHA, warmup=WARMUP, k_sigma=K_SIGMA,
+                 min_dev=MIN_DEV, init_sd=INIT_SD):
+        self.alpha   = alpha
+        self.warmup  = warmup
+        self.k_sigma = k_sigma
+        self.min_dev = min_dev
+        self.init_sd = init_sd
+        self.reset()
+
+    def reset(self):
+        self.mean  = None           # (H, W, C) float32
+        self.var   = None           # (H, W)    float32
+        self.count = 0
+
+    # ─── state ──────────────────────────────────────────────────
+    @property
+    def ready(self):
+        """True once the estimate has seen a full warm-up."""
+        return self.count >= self.warmup
+
+    @property
+    def background(self):
+        return None if self.mean is None else np.clip(self.mean, 0, 255).astype("uint8")
+
+    def seed(self, background):
+        """Start from a saved background (e.g. background.jpg) – skips warm-up."""
+        self.mean  = background.astype("float32")
+        self.var   = np.full(background.shape[:2], self.init_sd ** 2, "float32")
+        self.count = self.warmup
+
+    def load(self, path):
+        img = cv2.imread(path, cv2.IMREAD_COLOR) if os.path.exists(path) else None
+        if img is not None:
+            self.seed(img)
+        return img is not None
+
+    def save(self, path):
+        if self.mean is not None:
+            cv2.imwrite(path, self.background)
+
+    # ─── per-frame ──────────────────────────────────────────────
+    def diff(self, frame):
+        """Max-over-channels |frame − background| as uint8 (no update)."""
+        if self.mean is None or self.mean.shape != frame.shape:
+            return np.zeros(frame.shape[:2], "uint8")
+        diff_color = cv2.absdiff(frame, self.background)
+        return diff_color.max(axis=2) if diff_color.ndim == 3 else diff_color
+
+    def update(self, frame):
+        f = frame.astype("float32")
+        if self.mean is None or self.mean.shape != f.shape:
+            # first frame, or the rig changed frame size → start over
+            self.mean  = f.copy()
+            self.var   = np.full(f.shape[:2], self.init_sd ** 2, "float32")
+            self.count = 1
+            return
+
+        d = f - self.mean
+        dev = np.abs(d).max(axis=2) if d.ndim == 3 else np.abs(d)
+        self.count += 1
+        if self.count <= self.warmup:
+            # uniform mean – unbiased while there's too little history to gate
+            self.mean += d / self.count
+            self.var  += (dev * dev - self.var) / self.count
+            return
+
+        # EMA only where the pixel looks like tray, not die
+        gate = np.maximum(self.k_sigma * np.sqrt(self.var), self.min_dev)
+        keep = (dev <= gate).astype("float32")
+        a = self.alpha * keep
+        self.mean += (a[..., None] if d.ndim == 3 else a) * d
+        self.var  += a * (dev * dev - self.var)
+
+    def apply(self, frame):
+        """diff() against the current background, then update() with frame."""
+        out = self.diff(frame)
+        self.update(frame)
+        return out
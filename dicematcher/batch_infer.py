@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+batch_infer.py
+──────────────
+Shared batched inference engine for the dicematcher CNN scripts.
+
+Paths are streamed through a pool of decode/resize workers, packed into
+fixed-size batches and run through the model one batch at a time while the
+workers are already decoding the next ones.  Results come back in the same
+order as the input paths, so the per-image annotate/summary code in each
+script stays unchanged:
+
+    engine = BatchPredictor(model, load_fn, batch_size=32, prefetch=2)
+    for path, img, preds in engine.run(paths):
+        ...   # img is whatever load_fn returned, preds is one softmax row
+
+`load_fn(path)` must return a uint8 array of fixed shape (or None if the
+file is unreadable – those are yielded as `(path, None, None)` so callers
+can keep their own "skipped" messages).  `preprocess(batch)` turns the
+stacked uint8 batch into the model input.
+
+`model` is anything with `predict_on_batch(x) -> array`, i.e. a Keras
+model or one of the lighter runtimes that mimic it.
+
+Images that are already decoded (see shards.py) skip the worker pool:
+
+    for path, img, preds in engine.run_arrays(shard.paths, shard.images): ...
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from stage_timer import stage
+
+# ───────── defaults ────────────────────────────────────────────────
+BATCH_SIZE = 32         # images per forward pass
+PREFETCH   = 2          # batches decoded ahead of the model
+WORKERS    = min(8, os.cpu_count() or 1)
+
+
+def _as_float32(batch):
+    return batch.astype("float32")
+
+
+class BatchPredictor:
+    """Ordered, prefetching batch inference over a stream of image paths."""
+
+    def __init__(self, model, load_fn, batch_size=BATCH_SIZE, prefetch=PREFETCH,
+                 workers=WORKERS, preprocess=_as_float32, pad_last=True):
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        if prefetch < 1:
+            raise ValueError("prefetch must be >= 1")
+        self.model      = model
+        self.load_fn    = load_fn
+        self.batch_size = batch_size
+        self.prefetch   = prefetch
+        self.workers    = max(1, workers)
+        self.preprocess = preprocess
+        # pad the final short batch so the model always sees the same shape
+        # (a new shape makes Keras retrace its predict function)
+        self.pad_last   = pad_last
+        self.images     = 0       # images actually run through the model
+
+    # ─── model call ──────────────────────────────────────────────
+    def _predict(self, imgs):
+        n = len(imgs)
+        batch = imgs if isinstance(imgs, np.ndarray) else np.stack(imgs)
+        if self.pad_last and n < self.batch_size:
+            pad = np.repeat(batch[-1:], self.batch_size - n, axis=0)
+            batch = np.concatenate([batch, pad])
+        with stage("predict", items=n):
+            preds = np.asarray(self.model.predict_on_batch(self.preprocess(batch)))
+        self.images += n
+        return preds[:n]
+
+    # ─── main generator ──────────────────────────────────────────
+    def run(self, paths):
+        """Yield `(path, img, preds)` for every path, in input order."""
+        window = self.batch_size * self.prefetch
+        pending = deque()                   # (path, future), submit order
+        batch = []                          # [(path, img)] waiting for model
+        pre_batch = []                      # unreadables ahead of `batch`
+        it = iter(paths)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def fill():
+                while len(pending) < window:
+                    try:
+                        p = next(it)
+                    except StopIteration:
+                        return
+                    pending.append((p, pool.submit(self.load_fn, p)))
+
+            fill()
+            while pending:
+                path, fut = pending.popleft()
+                fill()
+                img = fut.result()
+                if img is None:
+                    # keep order: flush later only if nothing is queued ahead
+                    if batch:
+                        pre_batch.append((len(batch), path))
+                    else:
+                        yield path, None, None
+                    continue
+                batch.append((path, img))
+                if len(batch) == self.batch_size:
+                    yield from self._flush(batch, pre_batch)
+                    batch, pre_batch = [], []
+            if batch:
+                yield from self._flush(batch, pre_batch)
+
+    def run_arrays(self, paths, images):
+        """Yield `(path, img, preds)` for already-decoded images (a Shard).
+
+        `images` is sliced, never copied, so a memory-mapped array feeds
+        the model straight from the page cache; `load_fn` is not used.
+        """
+        for s in range(0, len(paths), self.batch_size):
+            imgs = images[s:s + self.batch_size]
+            for i, p in enumerate(self._predict(imgs)):
+                yield paths[s + i], imgs[i], p
+
+    def _flush(self, batch, skipped):
+        preds = self._predict([img for _, img in batch])
+        skipped = deque(skipped)
+        for i, ((path, img), p) in enumerate(zip(batch, preds)):
+            while skipped and skipped[0][0] == i:
+                yield skipped.popleft()[1], None, None
+            yield path, img, p
+        for _, path in skipped:
+            yield path, None, None
+
+
+def predict_paths(model, paths, load_fn, **kwargs):
+    """Convenience wrapper: `BatchPredictor(model, load_fn, **kw).run(paths)`."""
+    return BatchPredictor(model, load_fn, **kwargs).run(paths)
+
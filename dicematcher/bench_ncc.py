@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+bench_ncc.py
+────────────
+Benchmark + equivalence check: the old coarse/fine `cv2.matchTemplate`
+loop from detect.py vs. the stacked NCCMatcher.
+
+For every query it reports
+  • ms/frame for the loop, the matcher (GEMV) and the batched matcher (GEMM)
+  • the largest |score| difference between NCCMatcher and TM_CCOEFF_NORMED
+    over *all* templates (must stay at float32 round-off, ~1e-5)
+  • how often the matcher's best score is at least the loop's best
+
+    python bench_ncc.py            # uses TEMPLATE_DIR / TEST_DIR below
+"""
+
+import glob, os, time
+import cv2
+import numpy as np
+from ncc_matcher import NCCMatcher
+from template_store import load_templates
+
+# ───────── config ──────────────────────────────────────────────────
+TEMPLATE_DIR = "template_data"
+TEST_DIR     = "tests/"
+ANGLE_STEP   = 10
+COARSE_STEP  = 5
+FINE_RANGE   = 0.1
+TARGET_SIZE  = (256, 256)
+MAX_QUERIES  = 50           # keep the (slow) reference loop bounded
+SCORE_TOL    = 1e-4
+
+# ───────── reference: detect.py coarse/fine loop (pre-NCCMatcher) ──
+def coarse_fine(img_gray, template_data, angles):
+    coarse_idxs = [i for i, a in enumerate(angles) if a % COARSE_STEP == 0]
+    best_side, best_ang, best_score = None, None, -1.0
+    for side, tmpls in template_data.items():
+        for idx in coarse_idxs:
+            res = cv2.matchTemplate(img_gray, tmpls[idx], cv2.TM_CCOEFF_NORMED)
+            _, score, _, _ = cv2.minMaxLoc(res)
+            if score > best_score:
+                best_score, best_side, best_ang = score, side, angles[idx]
+    if best_score >= 0.95:
+        return best_side, best_ang, best_score
+
+    def within(a, center, rng):
+        return abs((a - center + 180) % 360 - 180) <= rng
+
+    final_score, final_ang = -1.0, None
+    for idx, ang in enumerate(angles):
+        if not within(ang, best_ang, FINE_RANGE):
+            continue
+        res = cv2.matchTemplate(img_gray, template_data[best_side][idx],
+                                cv2.TM_CCOEFF_NORMED)
+        _, score, _, _ = cv2.minMaxLoc(res)
+        if score > final_score:
+            final_score, final_ang = score, ang
+    return best_side, final_ang, final_score
+
+def all_scores(img_gray, template_data):
+    """TM_CCOEFF_NORMED for every template, in NCCMatcher row order."""
+    return np.array([cv2.matchTemplate(img_gray, t, cv2.TM_CCOEFF_NORMED)[0, 0]
+                     for tmpls in template_data.values() for t in tmpls])
+
+def load_queries():
+    grays = []
+    for p in sorted(glob.glob(os.path.join(TEST_DIR, "*.*")))[:MAX_QUERIES]:
+        img = cv2.imread(p)
+        if img is None:
+            continue
+        img = cv2.resize(img, TARGET_SIZE, interpolation=cv2.INTER_AREA)
+        grays.append(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    return grays
+
+# ───────── main ────────────────────────────────────────────────────
+if __name__ == "__main__":
+    angles = list(range(0, 360, ANGLE_STEP))
+    template_data = load_templates(TEMPLATE_DIR, ANGLE_STEP).side_lists()
+    grays = load_queries()
+    if not grays:
+        raise SystemExit(f"need query images in {TEST_DIR}")
+
+    t0 = time.perf_counter()
+    matcher = NCCMatcher.from_side_lists(template_data, angles)
+    t_build = time.perf_counter() - t0
+    print(f"templates: {len(matcher)}   queries: {len(grays)}   "
+          f"matrix build: {t_build*1e3:.0f} ms ({matcher.matrix.nbytes/2**20:.0f} MiB)")
+
+    t0 = time.perf_counter()
+    ref = [coarse_fine(g, template_data, angles) for g in grays]
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    gemv = [matcher.best(g) for g in grays]
+    t_gemv = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    gemm = matcher.best_batch(np.stack(grays))
+    t_gemm = time.perf_counter() - t0
+
+    # exhaustive equivalence check against OpenCV
+    max_diff = max(float(np.abs(all_scores(g, template_data) - matcher.score(g)).max())
+                   for g in grays)
+    # the loop only sees each side's first base image; compare on score
+    agree = sum(abs(r[2] - m[2]) < SCORE_TOL or m[2] > r[2] for r, m in zip(ref, gemv))
+
+    n = len(grays)
+    print("\n=== NCC benchmark ===")
+    print(f"coarse/fine loop : {t_loop / n * 1e3:8.2f} ms/frame")
+    print(f"NCCMatcher GEMV  : {t_gemv / n * 1e3:8.2f} ms/frame  ({t_loop / t_gemv:.1f}×)")
+    print(f"NCCMatcher GEMM  : {t_gemm / n * 1e3:8.2f} ms/frame  ({t_loop / t_gemm:.1f}×)")
+    print(f"max |Δscore|     : {max_diff:.2e}  ({'OK' if max_diff < SCORE_TOL else 'MISMATCH'})")
+    print(f"best ≥ loop best : {agree}/{n}")
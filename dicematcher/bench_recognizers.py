@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# bench_recognizers.py
+# —————————————————————————————————————————
+# Accuracy vs. cost for every dicematcher recognizer on one labeled set
+# (class folders side_01 … side_06, like dataset/ or new_dataset/valid).
+#
+#   template   detect.py              NCC template matcher
+#   cnn        detect_cnn.py          full-image CNN
+#   crop_cnn   detect_crop_cnn.py     Canny crop + CNN
+#   crop_raw   detect_crop_raw.py     background-diff crop + CNN
+#   recheck    detect_and_recheck.py  CNN + TTA retries
+#
+# Each script runs unchanged in a subprocess, pointed at the data through
+# run_config (DICEMATCHER_CONFIG) and writing into a temp dir; stage_timer
+# (DICEMATCHER_BENCH_OUT) hands back per-stage timings, every prediction
+# and peak RSS.  Scripts that read a flat directory are run once per class
+# folder.  Results go to a JSON file meant to be diffed between commits:
+#
+#   python bench_recognizers.py                          # all five on dataset/
+#   python bench_recognizers.py --data new_dataset/valid --only cnn recheck
+#   python bench_recognizers.py --set cnn.MODEL_PATH=exported/dice_mobilenetv2.int8.tflite
+#   python bench_recognizers.py --compare bench_results.old.json
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# CONFIG
+DATA_DIR = "dataset"
+OUT_PATH = "bench_results.json"
+STAGES   = ["decode", "locate", "resize", "predict", "annotate", "write"]
+
+# name → (script, layout, extra config); "flat" scripts glob TEST_DIR/*.*
+RECOGNIZERS = {
+    "template": ("detect.py",             "flat",   {}),
+    "cnn":      ("detect_cnn.py",         "nested", {"OUTPUT_MODE": "all"}),
+    "crop_cnn": ("detect_crop_cnn.py",    "nested", {}),
+    "crop_raw": ("detect_crop_raw.py",    "flat",   {}),
+    "recheck":  ("detect_and_recheck.py", "flat",   {}),
+}
+
+
+def class_dirs(data):
+    return sorted(d for d in os.listdir(data)
+                  if os.path.isdir(os.path.join(data, d)) and d.split("_")[-1].isdigit())
+
+
+def label_of(folder):
+    return int(os.path.basename(os.path.normpath(folder)).split("_")[-1])
+
+
+def run_script(script, config, verbose):
+    """Run one script; (bench dict, wall seconds, return code, stderr tail)."""
+    fd, out = tempfile.mkstemp(suffix=".json")
+    os.close(fd)
+    env = dict(os.environ,
+               DICEMATCHER_CONFIG=json.dumps(config),
+               DICEMATCHER_BENCH_OUT=out)
+    t = time.perf_counter()
+    proc = subprocess.run([sys.executable, script], cwd=HERE, env=env,
+                          stdout=None if verbose else subprocess.DEVNULL,
+                          stderr=None if verbose else subprocess.PIPE, text=True)
+    wall = time.perf_counter() - t
+    try:
+        with open(out) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = None
+    finally:
+        os.remove(out)
+    return data, wall, proc.returncode, (proc.stderr or "")[-2000:]
+
+
+def summarize_stages(samples):
+    out = {}
+    for name in STAGES + sorted(set(samples) - set(STAGES)):
+        s = samples.get(name)
+        if not s:
+            continue
+        secs = np.array([t for t, _ in s]) * 1000
+        items = sum(n for _, n in s)
+        p50, p95, p99 = np.percentile(secs, [50, 95, 99])
+        out[name] = {"calls": len(s), "items": items,
+                     "total_s": round(float(secs.sum() / 1000), 4),
+                     "ms_per_item": round(float(secs.sum() / items), 4) if items else None,
+                     "p50_ms": round(float(p50), 4), "p95_ms": round(float(p95), 4),
+                     "p99_ms": round(float(p99), 4)}
+    return out
+
+
+def bench(name, data, overrides, verbose):
+    script, layout, extra = RECOGNIZERS[name]
+    tmp = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    base = {"OUTPUT_DIR": os.path.join(tmp, "out") + os.sep,
+            "CROPS_DIR": os.path.join(tmp, "crops"),
+            "BACKGROUND_PATH": os.path.join(tmp, "background.jpg"),
+            **extra, **overrides}
+    data = os.path.abspath(data)
+    runs = ([(data, None)] if layout == "nested"
+            else [(os.path.join(data, d), label_of(d)) for d in class_dirs(data)])
+
+    samples, preds, wall, loop, rss, failed = {}, [], 0.0, 0.0, 0.0, 0
+    for test_dir, label in runs:
+        res, w, rc, err = run_script(script, {**base, "TEST_DIR": test_dir}, verbose)
+        wall += w
+        if rc or res is None:
+            if not failed:
+                sys.stderr.write(err)                  # once per recognizer
+            failed += 1
+            continue
+        loop += res["loop_seconds"]
+        rss = max(rss, res["peak_rss_mb"])
+        for k, v in res["stages"].items():
+            samples.setdefault(k, []).extend(v)
+        for path, face, conf in res["predictions"]:
+            truth = label if label is not None else label_of(os.path.dirname(path))
+            preds.append((face, truth, conf))
+
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    n = len(preds)
+    correct = sum(1 for face, truth, _ in preds if face == truth)
+    return {
+        "script": script,
+        "runs": len(runs), "failed_runs": failed,
+        "images": n, "correct": correct,
+        "accuracy": round(correct / n, 4) if n else None,
+        "unrecognized": sum(1 for face, _, _ in preds if face is None),
+        "img_per_s": round(n / loop, 2) if loop else None,
+        "loop_s": round(loop, 3), "wall_s": round(wall, 3),
+        "peak_rss_mb": round(rss, 1),
+        "stages": summarize_stages(samples),
+        "config": {k: v for k, v in overrides.items()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_table(results, previous=None):
+    print(f"\n{'recognizer':10s} {'acc':>6s} {'img/s':>8s} {'RSS MB':>7s}  "
+          + " ".join(f"{s[:8]:>8s}" for s in STAGES) + "   (p50 ms)")
+    for name, r in results.items():
+        acc = "-" if r["accuracy"] is None else f"{r['accuracy']:.3f}"
+        ips = "-" if r["img_per_s"] is None else f"{r['img_per_s']:.1f}"
+        st = " ".join(f"{r['stages'][s]['p50_ms']:8.2f}" if s in r["stages"] else f"{'-':>8s}"
+                      for s in STAGES)
+        print(f"{name:10s} {acc:>6s} {ips:>8s} {r['peak_rss_mb']:7.0f}  {st}")
+        old = (previous or {}).get(name)
+        if old and old.get("img_per_s") and r["img_per_s"] and old.get("accuracy") is not None \
+                and r["accuracy"] is not None:
+            print(f"{'  vs old':10s} {r['accuracy'] - old['accuracy']:+6.3f} "
+                  f"{(r['img_per_s'] / old['img_per_s'] - 1) * 100:+7.1f}% "
+                  f"{r['peak_rss_mb'] - old['peak_rss_mb']:+7.0f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark every dicematcher recognizer")
+    ap.add_argument("--data", default=DATA_DIR, help="labeled dir with side_XX folders")
+    ap.add_argument("--only", nargs="+", choices=list(RECOGNIZERS), default=list(RECOGNIZERS))
+    ap.add_argument("--set", action="append", default=[], metavar="NAME.KEY=JSON",
+                    help="config override for one recognizer, e.g. cnn.BATCH_SIZE=64")
+    ap.add_argument("--out", default=OUT_PATH)
+    ap.add_argument("--compare", help="previous results file to print deltas against")
+    ap.add_argument("--verbose", "-v", action="store_true", help="show script output")
+    args = ap.parse_args()
+
+    overrides = {n: {} for n in RECOGNIZERS}
+    for item in args.set:
+        key, _, value = item.partition("=")
+        name, _, const = key.partition(".")
+        if name not in overrides or not const:
+            ap.error(f"--set {item}: expected one of {', '.join(RECOGNIZERS)} followed by .CONSTANT")
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass                                   # bare strings (paths)
+        overrides[name][const] = value
+
+    results = {}
+    for name in args.only:
+        print(f"→ {name} ({RECOGNIZERS[name][0]}) …", flush=True)
+        results[name] = bench(name, args.data, overrides[name], args.verbose)
+        if results[name]["failed_runs"]:
+            print(f"  [!] {results[name]['failed_runs']} run(s) failed (use -v for output)")
+
+    report = {"commit": git_commit(), "timestamp": time.time(),
+              "host": {"platform": platform.platform(), "python": platform.python_version(),
+                       "cpus": os.cpu_count()},
+              "data": os.path.abspath(args.data), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    print_table(results, previous)
+    print(f"\n📝 results → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# bench_startup.py
+# —————————————————————————————————————————
+# Cold-start cost of the dicematcher CLI, per subcommand.
+#
+#   cli        python -m dicematcher CMD --print-config   (argv → config, no work)
+#   script     python -m dicematcher CMD -- --help         (argparse scripts only:
+#                                                           the script's own imports)
+#   reference  python -c "import numpy" / cv2 / tensorflow  (what used to be paid
+#                                                           up front)
+#
+# Each command line runs in a fresh interpreter --repeat times; the table
+# shows the median and the part above a bare `python -c pass`.  The run
+# also checks, with -X importtime, that no heavy module is imported before
+# a subcommand starts its script.  Exits non-zero if any `cli` row is over
+# --budget-ms or imports something heavy, or if any `script` row is over
+# --script-budget-ms (they need numpy / cv2, so it is looser) or pulls in
+# a model runtime or plotting (SCRIPT_FORBIDDEN).
+#
+#   python bench_startup.py
+#   python bench_startup.py --repeat 20 --json startup.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from cli import COMMANDS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)            # so `-m dicematcher` resolves
+
+# CONFIG
+REPEAT    = 10
+BUDGET_MS = 200
+SCRIPT_BUDGET_MS = 400          # numpy + cv2 alone are ~2× a bare interpreter
+HEAVY     = ("numpy", "cv2", "tensorflow", "matplotlib", "onnxruntime", "tflite_runtime")
+SCRIPT_FORBIDDEN = ("tensorflow", "matplotlib", "onnxruntime", "tflite_runtime")
+
+
+def wall_ms(argv, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        proc = subprocess.run(argv, cwd=ROOT, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - t) * 1000)
+        if proc.returncode:
+            return None
+    return statistics.median(times)
+
+
+def heavy_imports(argv):
+    """Heavy top-level packages imported while running argv (-X importtime)."""
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + argv[1:], cwd=ROOT,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    found = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") < 2:
+            continue
+        name = line.rsplit("|", 1)[1].strip().split(".")[0]
+        if name in HEAVY:
+            found.add(name)
+    return sorted(found)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure dicematcher CLI cold start")
+    ap.add_argument("--repeat", type=int, default=REPEAT)
+    ap.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    ap.add_argument("--script-budget-ms", type=float, default=SCRIPT_BUDGET_MS)
+    ap.add_argument("--json", help="also write the rows here")
+    args = ap.parse_args()
+
+    py = sys.executable
+    base = wall_ms([py, "-c", "pass"], args.repeat)
+    rows = []
+
+    def add(kind, label, argv, check=False):
+        ms = wall_ms(argv, args.repeat)
+        heavy = heavy_imports(argv) if check else []
+        rows.append({"kind": kind, "label": label, "median_ms": ms,
+                     "over_python_ms": None if ms is None else ms - base,
+                     "heavy_imports": heavy})
+
+    add("cli", "dicematcher --help", [py, "-m", "dicematcher", "--help"], check=True)
+    for name in COMMANDS:
+        add("cli", f"{name} --print-config",
+            [py, "-m", "dicematcher", name, "--print-config"], check=True)
+    for name, (_, _, _, passthrough) in COMMANDS.items():
+        if passthrough:
+            add("script", f"{name} -- --help", [py, "-m", "dicematcher", name, "--", "--help"],
+                check=True)
+    for mod in ("numpy", "cv2", "tensorflow"):
+        add("reference", f"import {mod}", [py, "-c", f"import {mod}"])
+
+    print(f"python -c pass: {base:.0f} ms (median of {args.repeat})\n")
+    print(f"{'kind':9s} {'command':34s} {'median':>8s} {'+python':>8s}  heavy imports")
+    failed = False
+    for r in rows:
+        if r["median_ms"] is None:
+            print(f"{r['kind']:9s} {r['label']:34s} {'failed':>8s}")
+            failed |= r["kind"] != "reference"
+            continue
+        if r["kind"] == "cli":
+            over = r["median_ms"] > args.budget_ms or r["heavy_imports"]
+        elif r["kind"] == "script":
+            over = (r["median_ms"] > args.script_budget_ms
+                    or any(m in SCRIPT_FORBIDDEN for m in r["heavy_imports"]))
+        else:
+            over = False
+        failed |= bool(over)
+        print(f"{r['kind']:9s} {r['label']:34s} {r['median_ms']:6.0f}ms {r['over_python_ms']:+6.0f}ms"
+              f"  {', '.join(r['heavy_imports']) or '-'}{'   [!] over budget' if over else ''}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python_ms": base, "budget_ms": args.budget_ms,
+                       "script_budget_ms": args.script_budget_ms, "rows": rows}, f, indent=2)
+        print(f"\n📝 results → {args.json}")
+    print(f"\n{'❌' if failed else '✅'} cli budget {args.budget_ms:.0f} ms, "
+          f"script budget {args.script_budget_ms:.0f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,6 +11,9 @@
 #  REQUIRES
 #      • coreutils sha256sum
 #      • ripgrep (rg)
+#
+#  See dedup.py for a cached, parallel version that also catches
+#  re-encoded / resized near duplicates (and has --dry-run).
 #  --------------------------------------------------------------
 
 set -euo pipefail
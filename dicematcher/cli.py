@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# cli.py
+# —————————————————————————————————————————
+# One entry point for the dicematcher scripts:
+#
+#   python -m dicematcher precompute --yes
+#   python -m dicematcher detect-template --test-dir tests/side_03
+#   python -m dicematcher detect-cnn --model exported/dice_mobilenetv2.int8.tflite
+#   python -m dicematcher audit --config audit.json --set CONF_THRESH=0.9
+#   python -m dicematcher recheck --test-dir fair_roller_tests/crop
+#   python -m dicematcher extract-crops --workers 4
+#   python -m dicematcher train --recipe custom --epochs 5
+#   python -m dicematcher serve --preload dice_cnn_custom_978.h5
+#
+# Every subcommand runs its script unchanged, in this process (runpy), with
+# the flags turned into CONFIG overrides via run_config (DICEMATCHER_CONFIG).
+# Precedence: DICEMATCHER_CONFIG < --config files (in order) < flags < --set.
+# Scripts that have their own argparse (precompute, extract-crops) also get
+# any unrecognised arguments passed straight through (put them after `--`
+# to reach the script's own --help).
+#
+# This module imports only the standard library: numpy, cv2, the model
+# runtimes and tensorflow are loaded by the script that needs them, so
+# `--help`, `--print-config` and the non-TF commands start fast
+# (measured by bench_startup.py).
+#
+# Relative paths given as flags are resolved against the directory you run
+# from; the scripts themselves run inside --workdir (default: this folder),
+# where their default paths (template_data/, new_dataset/, *.h5) live.
+
+import argparse
+import json
+import os
+import runpy
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ENV_VAR = "DICEMATCHER_CONFIG"          # same variable run_config reads
+
+
+def _path(value):
+    return os.path.abspath(value)
+
+
+def _size(value):
+    """"N" or "WxH" → [w, h], as cv2.resize takes it (the detect scripts)."""
+    w, _, h = value.lower().partition("x")
+    return [int(w), int(h or w)]
+
+
+def _keras_size(value):
+    """"N" or "WxH" → [h, w], as Keras' target_size takes it (the train scripts)."""
+    return _size(value)[::-1]
+
+
+# name → (script, help, [(flag, CONSTANT, type, help)], passthrough argv?)
+COMMANDS = {
+    "precompute": ("pregenerate.py", "rotate templates into the template store", [], True),
+    "detect-template": ("detect.py", "NCC template matcher", [
+        ("--test-dir",   "TEST_DIR",     _path, "flat folder of query images"),
+        ("--output-dir", "OUTPUT_DIR",   _path, "annotated output"),
+        ("--templates",  "TEMPLATE_DIR", _path, "template store (pregenerate output)"),
+        ("--threshold",  "THRESHOLD",    float, "min NCC score to accept"),
+        ("--output-mode", "OUTPUT_MODE", str,   "all | errors | none"),
+    ], False),
+    "detect-cnn": ("detect_cnn.py", "full-image CNN over side_XX folders", [
+        ("--model",      "MODEL_PATH",   _path, ".h5 / .keras / .tflite / .onnx"),
+        ("--test-dir",   "TEST_DIR",     _path, "folder with side_XX subfolders"),
+        ("--output-dir", "OUTPUT_DIR",   _path, "annotated output"),
+        ("--img-size",   "IMG_SIZE",     _size, "model input, e.g. 256 or 256x256"),
+        ("--batch-size", "BATCH_SIZE",   int,   "images per model call"),
+        ("--shards",     "SHARD_DIR",    _path, "read pre-decoded shards (shards.py)"),
+        ("--output-mode", "OUTPUT_MODE", str,   "all | errors | none"),
+    ], False),
+    "detect-crop": ("detect_crop_cnn.py", "Canny crop + CNN over side_XX folders", [
+        ("--model",      "MODEL_PATH",   _path, ".h5 / .keras / .tflite / .onnx"),
+        ("--test-dir",   "TEST_DIR",     _path, "folder with side_XX subfolders"),
+        ("--output-dir", "OUTPUT_DIR",   _path, "annotated output"),
+        ("--img-size",   "IMG_SIZE",     _size, "model input, e.g. 256 or 256x256"),
+        ("--batch-size", "BATCH_SIZE",   int,   "crops per model call"),
+        ("--output-mode", "OUTPUT_MODE", str,   "all | errors | none"),
+    ], False),
+    "detect-raw": ("detect_crop_raw.py", "background-diff crop + CNN on rig frames", [
+        ("--model",      "MODEL_PATH",      _path, ".h5 / .keras / .tflite / .onnx"),
+        ("--test-dir",   "TEST_DIR",        _path, "flat folder of frames"),
+        ("--crops-dir",  "CROPS_DIR",       _path, "where crops are written"),
+        ("--background", "BACKGROUND_PATH", _path, "background image to seed / save"),
+        ("--conf",       "CONF_THRESHOLD",  float, "min confidence to count"),
+        ("--output-mode", "OUTPUT_MODE",    str,   "all | errors | none"),
+        ("--quality-gate", "QUALITY_GATE",  str,   "off | flag | reject (blur / motion / exposure)"),
+    ], False),
+    "audit": ("detect_audit.py", "accuracy audit; saves incorrect / low-confidence images", [
+        ("--model",      "MODEL_PATH",   _path, ".h5 / .keras / .tflite / .onnx"),
+        ("--test-dir",   "TEST_DIR",     _path, "folder with side_XX subfolders"),
+        ("--output-dir", "OUTPUT_DIR",   _path, "incorrect/ and lowconf/ go here"),
+        ("--img-size",   "IMG_SIZE",     _size, "model input, e.g. 150 or 150x150"),
+        ("--conf",       "CONF_THRESH",  float, "low-confidence threshold"),
+        ("--batch-size", "BATCH_SIZE",   int,   "images per model call"),
+        ("--shards",     "SHARD_DIR",    _path, "read pre-decoded shards (shards.py)"),
+        ("--output-mode", "OUTPUT_MODE", str,   "all | errors | none"),
+    ], False),
+    "recheck": ("detect_and_recheck.py", "CNN with TTA retries on low confidence", [
+        ("--model",      "MODEL_PATH",   _path, ".h5 / .keras / .tflite / .onnx"),
+        ("--test-dir",   "TEST_DIR",     _path, "flat folder of crops"),
+        ("--output-dir", "OUTPUT_DIR",   _path, "annotated output"),
+        ("--img-size",   "IMG_SIZE",     _size, "model input, e.g. 256 or 256x256"),
+        ("--conf",       "CONF_THRESH",  float, "retry below this confidence"),
+        ("--tta-mode",   "TTA_MODE",     str,   "tiered | batch | serial"),
+        ("--output-mode", "OUTPUT_MODE", str,   "all | errors | none"),
+    ], False),
+    "extract-crops": ("extract_die_crops.py", "COCO boxes → side_XX crop folders", [
+        ("--img-size",   "IMG_SIZE",     _size, "crop size, e.g. 256"),
+    ], True),
+    "serve": ("model_server.py", "keep models warm for DICEMATCHER_MODEL_SERVER clients", [], True),
+    "train": (None, "train a classifier (tensorflow)", [
+        ("--train-dir",  "TRAIN_DIR",    _path, "side_XX training folders"),
+        ("--val-dir",    "VAL_DIR",      _path, "side_XX validation folders"),
+        ("--img-size",   "IMG_SIZE",     _keras_size, "input size, e.g. 150 or 256x192 (WxH)"),
+        ("--batch-size", "BATCH_SIZE",   int,   "batch size"),
+        ("--pipeline",   "PIPELINE",     str,   "keras (default) | tfdata"),
+        ("--shards",     "SHARD_DIR",    _path, "train from pre-decoded shards"),
+    ], False),
+}
+
+# train recipes → script + the constants that differ between them
+RECIPES = {
+    "mobilenet": ("train_cnn.py",     {"epochs": "EPOCHS",      "model": "MODEL_PATH"}),
+    "custom":    ("train_cnn_new.py", {"epochs": "EPOCHS_HEAD", "model": "MODEL_FINAL_PATH"}),
+}
+
+
+def parse_set(item):
+    key, sep, value = item.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {item!r}")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value                       # bare strings (paths, modes)
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="dicematcher",
+                                 description="Dice face recognition tools")
+    sub = ap.add_subparsers(dest="command", metavar="COMMAND")
+    sub.required = True
+    for name, (script, help_, flags, _) in COMMANDS.items():
+        p = sub.add_parser(name, help=help_, description=help_)
+        for flag, const, type_, fhelp in flags:
+            p.add_argument(flag, dest=const, type=type_, help=fhelp, metavar=const)
+        if name == "train":
+            p.add_argument("--recipe", choices=list(RECIPES), default="custom",
+                           help="custom = train_cnn_new.py, mobilenet = train_cnn.py")
+            p.add_argument("--epochs", type=int, help="training epochs")
+            p.add_argument("--model", type=_path, help="where to save the final model")
+        p.add_argument("--config", action="append", default=[], metavar="FILE",
+                       help="JSON file of CONSTANT: value overrides (repeatable)")
+        p.add_argument("--set", action="append", default=[], type=parse_set,
+                       metavar="KEY=JSON", help="one CONSTANT override (repeatable)")
+        p.add_argument("--workdir", default=HERE, type=_path,
+                       help="directory the script runs in (default: %(default)s)")
+        p.add_argument("--print-config", action="store_true",
+                       help="show the script, overrides and argv, then exit")
+    return ap
+
+
+def collect_overrides(args, flags):
+    """Merge env, --config files, flags and --set, lowest precedence first."""
+    overrides = {}
+    env = os.environ.get(ENV_VAR, "").strip()
+    if env:
+        if env.startswith("{"):
+            overrides.update(json.loads(env))
+        else:
+            with open(env) as f:
+                overrides.update(json.load(f))
+    for path in args.config:
+        with open(path) as f:
+            overrides.update(json.load(f))
+    for _, const, _, _ in flags:
+        value = getattr(args, const)
+        if value is not None:
+            overrides[const] = value
+    overrides.update(args.set)
+    return overrides
+
+
+def resolve(argv=None):
+    """(script path, overrides, script argv, workdir) for a command line."""
+    ap = build_parser()
+    args, extra = ap.parse_known_args(argv)
+    if extra[:1] == ["--"]:
+        extra = extra[1:]                       # `precompute -- --help` → the script's help
+    script, _, flags, passthrough = COMMANDS[args.command]
+    if extra and not passthrough:
+        ap.error(f"unrecognized arguments: {' '.join(extra)}")
+    if args.command == "train":
+        script, names = RECIPES[args.recipe]
+        flags = flags + [(f"--{opt}", const, None, None) for opt, const in names.items()]
+        for opt, const in names.items():
+            setattr(args, const, getattr(args, opt))
+    overrides = collect_overrides(args, flags)
+    return args, os.path.join(HERE, script), overrides, extra
+
+
+def run(script, overrides, extra, workdir):
+    """Execute a script as __main__ with the overrides applied."""
+    os.environ[ENV_VAR] = json.dumps(overrides)
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)                # sibling imports (run_config, …)
+    sys.argv = [script] + list(extra)
+    os.chdir(workdir)
+    runpy.run_path(script, run_name="__main__")
+
+
+def main(argv=None):
+    args, script, overrides, extra = resolve(argv)
+    if args.print_config:
+        print(json.dumps({"script": script, "workdir": args.workdir,
+                          "argv": extra, "config": overrides}, indent=2))
+        return 0
+    run(script, overrides, extra, args.workdir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
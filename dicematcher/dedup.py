@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# dedup.py
+# —————————————————————————————————————————
+# Python take on check_split_duplicates.sh: find validation images whose
+# contents also live in train/ and redistribute them 60 / 40.
+#
+#   • exact duplicates  – sha256, hashed across a process pool
+#   • near duplicates   – 64-bit DCT perceptual hash, looked up in a BK-tree
+#                         (re-encoded or resized copies)
+#
+# Only exact duplicates are redistributed (deleted from one side), as the
+# shell script did.  Near duplicates are reported for review: photos of
+# the same die face are often that close without being the same sample.
+# Pass --delete-near to redistribute them as well.
+#
+# Digests are cached in DEDUP_CACHE keyed by path + size + mtime, so a
+# re-check after adding a few images only hashes those few.
+#
+#   python dedup.py --dry-run                      # report only
+#   python dedup.py new_dataset/train new_dataset/valid
+#   python dedup.py --near 0                       # exact matches only
+#   python dedup.py --dry-run --report dups.json
+#   python dedup.py --delete-near                  # near pairs too – review first
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# CONFIG
+TRAIN_DIR   = "new_dataset/train"
+VAL_DIR     = "new_dataset/valid"
+DEDUP_CACHE = ".dedup_cache.json"
+EXTS        = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tif", ".tiff"}
+NEAR_DIST   = 4          # max Hamming distance between perceptual hashes
+TRAIN_FRAC  = 0.60       # share of duplicate pairs resolved in favour of train
+WORKERS     = os.cpu_count() or 1
+
+
+# ─── hashing ─────────────────────────────────────────────────────────────────
+
+def phash(path):
+    """64-bit DCT hash (low 8×8 frequencies vs. their median), or None."""
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+    if img is None:
+        return None
+    small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])            # DC term would skew the median
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def digest(path):
+    """(path, sha256, phash) – runs in a pool worker."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return path, h.hexdigest(), phash(path)
+
+
+def list_images(root):
+    out = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in EXTS:
+                out.append(os.path.join(dirpath, name))
+    return sorted(out)
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"ℹ ignoring unreadable cache {path}")
+        return {}
+
+
+def save_cache(path, cache):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+
+def hash_all(paths, cache, workers):
+    """{path: (sha256, phash)}; only files whose size/mtime changed are read."""
+    out, stale = {}, []
+    for p in paths:
+        st = os.stat(p)
+        key = os.path.abspath(p)
+        e = cache.get(key)
+        if e and e["size"] == st.st_size and e["mtime_ns"] == st.st_mtime_ns:
+            out[p] = (e["sha256"], e["phash"])
+        else:
+            stale.append(p)
+    if stale:
+        chunk = max(1, len(stale) // (workers * 8))
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            for p, sha, ph in pool.map(digest, stale, chunksize=chunk):
+                st = os.stat(p)
+                cache[os.path.abspath(p)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                                             "sha256": sha, "phash": ph}
+                out[p] = (sha, ph)
+    return out, len(stale)
+
+
+# ─── near-duplicate index ────────────────────────────────────────────────────
+
+class BKTree:
+    """Burkhard–Keller tree over Hamming distance of int hashes."""
+
+    def __init__(self):
+        self.root = None          # [hash, [items], {dist: child}]
+        self.size = 0
+
+    def add(self, h, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [h, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = bin(h ^ node[0]).count("1")
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [item], {}]
+                return
+            node = child
+
+    def query(self, h, radius):
+        """[(dist, item)] for every stored hash within `radius` of h."""
+        out, stack = [], [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = bin(h ^ node[0]).count("1")
+            if d <= radius:
+                out.extend((d, it) for it in node[1])
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:     # triangle inequality
+                    stack.append(child)
+        return out
+
+
+# ─── matching / redistribution ───────────────────────────────────────────────
+
+def find_pairs(train, val, near):
+    """[(kind, dist, val_path, train_path)] – exact first, then near."""
+    by_sha = {}
+    for p, (sha, _) in train.items():
+        by_sha.setdefault(sha, []).append(p)
+
+    pairs, exact_val = [], set()
+    for vp, (sha, _) in val.items():
+        for tp in by_sha.get(sha, ()):
+            pairs.append(("exact", 0, vp, tp))
+            exact_val.add(vp)
+
+    if near > 0:
+        tree = BKTree()
+        for p, (_, ph) in train.items():
+            if ph is not None:
+                tree.add(ph, p)
+        for vp, (_, ph) in val.items():
+            if ph is None or vp in exact_val:
+                continue
+            for d, tp in sorted(tree.query(ph, near)):
+                pairs.append(("near", d, vp, tp))
+    return pairs
+
+
+def redistribute(pairs, train_frac, seed, dry_run):
+    """Drop one side of every pair: train_frac keep train, the rest keep valid."""
+    order = pairs[:]
+    random.Random(seed).shuffle(order)
+    keep_train = int(len(order) * train_frac)
+    removed, actions = set(), []
+    for i, (kind, d, vp, tp) in enumerate(order):
+        if vp in removed or tp in removed:
+            continue                       # already resolved via another pair
+        victim = vp if i < keep_train else tp
+        if victim == vp:
+            print(f"train ✔︎ | valid ✗  : {os.path.basename(vp)}")
+        else:
+            print(f"valid ✔︎ | train ✗  : {os.path.basename(tp)}")
+        if not dry_run:
+            try:
+                os.remove(victim)
+            except FileNotFoundError:
+                pass
+        removed.add(victim)
+        actions.append({"kind": kind, "dist": d, "val": vp, "train": tp, "removed": victim})
+    return actions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Find and redistribute train/valid duplicates")
+    ap.add_argument("train_dir", nargs="?", default=TRAIN_DIR)
+    ap.add_argument("val_dir", nargs="?", default=VAL_DIR)
+    ap.add_argument("--near", type=int, default=NEAR_DIST,
+                    help="perceptual-hash distance for near duplicates (0 = exact only)")
+    ap.add_argument("--train-frac", type=float, default=TRAIN_FRAC)
+    ap.add_argument("--dry-run", action="store_true", help="report, don't delete anything")
+    ap.add_argument("--delete-near", action="store_true",
+                    help="redistribute near duplicates too (default: report them only)")
+    ap.add_argument("--report", help="write the pairs / planned removals as JSON")
+    ap.add_argument("--cache", default=DEDUP_CACHE)
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    cache = load_cache(args.cache)
+    train_paths, val_paths = list_images(args.train_dir), list_images(args.val_dir)
+    print("🟢  hashing TRAIN images …")
+    train, n_train = hash_all(train_paths, cache, args.workers)
+    print("🔵  hashing VAL images …")
+    val, n_val = hash_all(val_paths, cache, args.workers)
+    print(f"    {len(train)} train / {len(val)} valid, "
+          f"{n_train + n_val} (re)hashed, {time.perf_counter() - t0:.2f}s")
+
+    print()
+    print("🔍  scanning for duplicates …")
+    print("--------------------------------------------------------------")
+    pairs = find_pairs(train, val, args.near)
+    for kind, d, vp, tp in pairs:
+        tag = "DUPLICATE" if kind == "exact" else f"NEAR DUPLICATE (d={d})"
+        print(f"⚠️  {tag}:")
+        print(f"    VAL  : {vp}")
+        print(f"    TRAIN: {tp}")
+        print()
+
+    n_exact = sum(1 for p in pairs if p[0] == "exact")
+    fix = [p for p in pairs if p[0] == "exact" or args.delete_near]
+    keep_train = int(len(fix) * args.train_frac)
+    print()
+    print("🔀  Redistributing duplicates …" + ("  (dry run)" if args.dry_run else ""))
+    print(f"    total pairs : {len(pairs)}  ({n_exact} exact, {len(pairs) - n_exact} near)")
+    if len(fix) < len(pairs):
+        print("    near pairs reported only (--delete-near to redistribute them)")
+    print(f"    keep in train: {keep_train}")
+    print(f"    keep in valid: {len(fix) - keep_train}")
+    print("--------------------------------------------------------------")
+    actions = redistribute(fix, args.train_frac, args.seed, args.dry_run)
+
+    if not args.dry_run:
+        for a in actions:
+            cache.pop(os.path.abspath(a["removed"]), None)
+    # forget files that vanished from the scanned dirs since the last run
+    live = {os.path.abspath(p) for p in train_paths + val_paths}
+    roots = tuple(os.path.abspath(d) + os.sep for d in (args.train_dir, args.val_dir))
+    for key in [k for k in cache if k.startswith(roots) and k not in live]:
+        del cache[key]
+    save_cache(args.cache, cache)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"train_dir": args.train_dir, "val_dir": args.val_dir,
+                       "near": args.near, "delete_near": args.delete_near,
+                       "dry_run": args.dry_run,
+                       "pairs": [dict(zip(("kind", "dist", "val", "train"), p)) for p in pairs],
+                       "actions": actions}, f, indent=2)
+        print(f"📝  report → {args.report}")
+    verb = "would remove" if args.dry_run else "removed"
+    print(f"✅  Done: {verb} {len(actions)} file(s) in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,11 @@ annotated images in OUTPUT_DIR.
 
 import os, glob, cv2
 import numpy as np
-import tensorflow as tf
 import itertools
+from lite_runtime import load_model
+from output_writer import OutputWriter
+from run_config import apply_overrides
+from stage_timer import stage, record
 
 # ──────────────────────────────────────────────── CONFIG ──
 MODEL_PATH       = "dice_cnn_custom_978.h5"
@@ -24,11 +27,15 @@ ROTATION_DEGREES = [15, 45, 90, 135, 180, 225, 270, 315]
 BRIGHT_ALPHAS    = [0.40, 0.80, 1.00, 1.60, 1.80]
 BRIGHT_BETAS     = [-20, 0, 10, 20, 50, 70]
 SKEW_PIXELS      = [5, 10, 30, 50]
+TTA_MODE         = "tiered"   # "tiered" | "batch" | "serial" (one predict per variant)
+TTA_BATCH        = 64         # max variants per forward pass
+OUTPUT_MODE      = "all"      # "all" | "errors" (still below CONF_THRESH) | "none"
+apply_overrides(globals())
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # ────────────────────────────────────── load model ──
-model = tf.keras.models.load_model(MODEL_PATH)
+model = load_model(MODEL_PATH)   # .h5, or an exported .tflite / .onnx
 
 # ────────────────────────── helper: single prediction ──
 def _predict(img):
@@ -37,8 +44,8 @@ def _predict(img):
     p = model.predict(x, verbose=0)[0]
     return int(p.argmax() + 1), float(p.max()), r
 
-# ────────────────────────────── helper: robust predict ──
-def best_prediction(rgb_img):
+# ──────────────────────── helper: robust predict (serial) ──
+def _best_prediction_serial(rgb_img):
     best_cls, best_prob, best_img = _predict(rgb_img)
     if best_prob >= CONF_THRESH:
         return best_cls, best_prob, best_img
@@ -91,23 +98,121 @@ def best_prediction(rgb_img):
             best_cls, best_prob, best_img = cls, prob, img_r
     return best_cls, best_prob, best_img
 
+# ───────────────────────── helper: batched TTA variants ──
+WHITE = (255, 255, 255)
+
+def _conj(M, sx, sy):
+    """Express a full-res 2×3/3×3 transform in IMG_SIZE pixel coordinates."""
+    S = np.diag([sx, sy, 1.0])
+    M3 = np.vstack([M, [0, 0, 1]]) if M.shape[0] == 2 else M
+    return S @ M3 @ np.linalg.inv(S)
+
+def _rotation_variants(base, w, h, sx, sy):
+    W, H = IMG_SIZE
+    out = []
+    for deg in ROTATION_DEGREES:
+        M = _conj(cv2.getRotationMatrix2D((w//2, h//2), deg, 1.0), sx, sy)
+        out.append(cv2.warpAffine(base, M[:2], (W, H),
+                                  flags=cv2.INTER_LINEAR,
+                                  borderMode=cv2.BORDER_CONSTANT,
+                                  borderValue=WHITE))
+    return np.stack(out)
+
+def _brightness_variants(base):
+    # every (α, β) pair in one broadcast: (A*B, H, W, C)
+    pairs  = np.array(list(itertools.product(BRIGHT_ALPHAS, BRIGHT_BETAS)),
+                      dtype="float32")
+    alphas = pairs[:, 0, None, None, None]
+    betas  = pairs[:, 1, None, None, None]
+    # convertScaleAbs = saturate(|α·x + β|)
+    out = np.abs(base[None].astype("float32") * alphas + betas)
+    return np.clip(np.rint(out), 0, 255).astype("uint8")
+
+def _skew_variants(base, w, h, sx, sy):
+    W, H = IMG_SIZE
+    pts1 = np.float32([[0,0],[w,0],[w,h],[0,h]])
+    out = []
+    for dx in SKEW_PIXELS:
+        for idx in range(4):
+            pts2 = pts1.copy()
+            pts2[idx] += (-dx if idx in (0,3) else dx,
+                          -dx if idx in (0,1) else dx)
+            M = _conj(cv2.getPerspectiveTransform(pts1, pts2), sx, sy)
+            out.append(cv2.warpPerspective(base, M, (W, H),
+                                           flags=cv2.INTER_LINEAR,
+                                           borderMode=cv2.BORDER_CONSTANT,
+                                           borderValue=WHITE))
+    return np.stack(out)
+
+def _tta_tiers(rgb_img, base):
+    """Variant batches in the same order the serial loop tries them."""
+    h, w = rgb_img.shape[:2]
+    sx, sy = IMG_SIZE[0] / w, IMG_SIZE[1] / h
+    yield lambda: _rotation_variants(base, w, h, sx, sy)
+    yield lambda: _brightness_variants(base)
+    yield lambda: _skew_variants(base, w, h, sx, sy)
+    if rgb_img.mean() > 170:
+        yield lambda: (255 - base)[None]
+
+def _predict_many(imgs):
+    probs = [model.predict_on_batch(imgs[i:i + TTA_BATCH].astype("float32"))
+             for i in range(0, len(imgs), TTA_BATCH)]
+    return np.concatenate([np.asarray(p) for p in probs])
+
+# ──────────────────────────────── helper: robust predict ──
+def best_prediction(rgb_img):
+    if TTA_MODE == "serial":
+        return _best_prediction_serial(rgb_img)
+
+    best_cls, best_prob, best_img = _predict(rgb_img)
+    if best_prob >= CONF_THRESH:
+        return best_cls, best_prob, best_img
+
+    # all variants are built from one resize of the input; the geometric
+    # ones warp straight into IMG_SIZE with the transform rescaled to match
+    tiers = (make() for make in _tta_tiers(rgb_img, best_img))
+    if TTA_MODE == "batch":
+        # one (or a few, see TTA_BATCH) forward pass over everything
+        tiers = [np.concatenate(list(tiers))]
+    # "tiered": one pass per family (rotations → brightness → skews →
+    # negative), built lazily so an early exit skips the later ones
+
+    for imgs in tiers:
+        preds = _predict_many(imgs)
+        # same acceptance rule as the serial loop, applied in variant order
+        for img_r, p in zip(imgs, preds):
+            prob = float(p.max())
+            if prob > best_prob + MARGIN:
+                best_cls, best_prob, best_img = int(p.argmax() + 1), prob, img_r
+                if best_prob >= CONF_THRESH:
+                    return best_cls, best_prob, best_img
+    return best_cls, best_prob, best_img
+
+def draw_overlay(best_rgb, txt):
+    canvas = cv2.cvtColor(best_rgb, cv2.COLOR_RGB2BGR)
+    cv2.putText(canvas, txt, (5,20), cv2.FONT_HERSHEY_SIMPLEX,
+                0.5, (0,255,0), 1, cv2.LINE_AA)
+    return canvas
+
 # ─────────────────────────────────────────── main loop ──
+writer = OutputWriter(OUTPUT_MODE, conf_thresh=CONF_THRESH)   # annotate + save off-loop
 for path in sorted(glob.glob(os.path.join(TEST_DIR, "*.*"))):
-    bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+    with stage("decode"):
+        bgr = cv2.imread(path, cv2.IMREAD_COLOR)
     if bgr is None:
         print(f"⚠ Skipped unreadable {path}")
         continue
     rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
 
-    cls_num, prob, best_rgb = best_prediction(rgb)
+    with stage("predict"):          # resize + TTA retries included
+        cls_num, prob, best_rgb = best_prediction(rgb)
+    record(path, cls_num, prob)
 
-    # annotate
-    canvas = cv2.cvtColor(best_rgb, cv2.COLOR_RGB2BGR)
+    # annotate + save (writer thread)
+    if not writer.wants(True, prob):
+        continue
     txt = f"class_{cls_num:02d} ({prob:.2f})"
-    cv2.putText(canvas, txt, (5,20), cv2.FONT_HERSHEY_SIMPLEX,
-                0.5, (0,255,0), 1, cv2.LINE_AA)
-
-    # save
     out_name = f"class_{cls_num:02d}_{prob:.2f}_{os.path.basename(path)}"
-    cv2.imwrite(os.path.join(OUTPUT_DIR, out_name), canvas)
+    writer.submit(os.path.join(OUTPUT_DIR, out_name), draw_overlay, best_rgb, txt)
     print(f"Processed {os.path.basename(path)} → {out_name}")
+writer.close()
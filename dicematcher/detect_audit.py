@@ -10,12 +10,18 @@ Each saved image has an overlay (top-left) showing:
   • predicted class + prob
   • true class (and "LOW CONF" tag if applicable)
 
-Perfect/certain hits are skipped to avoid clutter.
+Perfect/certain hits are skipped to avoid clutter (OUTPUT_MODE "all"
+writes them to OUTPUT_DIR/correct/, "none" writes nothing).  Overlays
+are drawn and saved on output_writer's threads.
 """
 
-import os, glob, cv2
+import os, glob, cv2, time
 import numpy as np
-import tensorflow as tf
+from batch_infer import BatchPredictor
+from lite_runtime import load_model
+from output_writer import OutputWriter
+from run_config import apply_overrides
+from shards import open_shard
 
 # ───────── config ──────────────────────────────────────────────────
 MODEL_PATH  = "dice_cnn_custom_978.h5"
@@ -23,14 +29,21 @@ TEST_DIR    = "new_dataset/valid"
 OUTPUT_DIR  = "output_cnn"
 IMG_SIZE    = (150, 150)
 CONF_THRESH = 0.85
+BATCH_SIZE  = 64        # images per model call
+PREFETCH    = 2         # batches decoded ahead of the model
+SHARD_DIR   = None      # e.g. "shards" → read pre-decoded tensors (shards.py)
+OUTPUT_MODE = "errors"  # "errors" (incorrect / low conf) | "all" | "none"
+apply_overrides(globals())
 
 INC_DIR     = os.path.join(OUTPUT_DIR, "incorrect")
 LOW_DIR     = os.path.join(OUTPUT_DIR, "lowconf")
-os.makedirs(INC_DIR, exist_ok=True)
-os.makedirs(LOW_DIR, exist_ok=True)
+OK_DIR      = os.path.join(OUTPUT_DIR, "correct")
+for d in ((INC_DIR, LOW_DIR, OK_DIR) if OUTPUT_MODE == "all" else
+          (INC_DIR, LOW_DIR) if OUTPUT_MODE == "errors" else ()):
+    os.makedirs(d, exist_ok=True)
 
 # ───────── network ─────────────────────────────────────────────────
-model = tf.keras.models.load_model(MODEL_PATH)
+model = load_model(MODEL_PATH)   # .h5, or an exported .tflite / .onnx
 
 # ───────── helpers ────────────────────────────────────────────────
 FONT = cv2.FONT_HERSHEY_SIMPLEX
@@ -46,28 +59,49 @@ def put_multiline(img_bgr, lines, color):
         cv2.putText(img_bgr, text, (5, y + h), FONT, FONT_SCALE, color, THICK, cv2.LINE_AA)
         y += h + LINE_GAP
 
+def draw_overlay(crop_rgb, lines, color):
+    canvas = cv2.cvtColor(crop_rgb, cv2.COLOR_RGB2BGR)
+    put_multiline(canvas, lines, color)
+    return canvas
+
+def load_crop(path):
+    """Decode + resize one image (runs on a batch_infer worker thread)."""
+    bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+    if bgr is None:
+        return None
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    return cv2.resize(rgb, IMG_SIZE)
+
 # ───────── main loop ──────────────────────────────────────────────
 total = wrong = low = 0
-
-for path in sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*"))):
+writer  = OutputWriter(OUTPUT_MODE, conf_thresh=CONF_THRESH)
+engine  = BatchPredictor(model, load_crop, batch_size=BATCH_SIZE, prefetch=PREFETCH)
+if SHARD_DIR:
+    # pre-decoded uint8 tensors (python shards.py) – no JPEG decode at all
+    shard  = open_shard(SHARD_DIR, TEST_DIR, IMG_SIZE)
+    stream = engine.run_arrays(shard.paths, shard.images)
+else:
+    stream = engine.run(sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*"))))
+t_start = time.perf_counter()
+
+for path, crop, preds in stream:
     total += 1
     true_num = int(os.path.basename(os.path.dirname(path)).split("_")[1])
 
-    bgr = cv2.imread(path, cv2.IMREAD_COLOR)
-    if bgr is None:
+    if crop is None:
         print(f"⚠︎ unreadable {path}")
         continue
-    rgb  = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-    crop = cv2.resize(rgb, IMG_SIZE)
 
-    preds   = model.predict(crop.astype("float32")[None, ...], verbose=0)[0]
     prob    = float(preds.max())
     pred_num= int(preds.argmax() + 1)
     correct = (pred_num == true_num)
     lowconf = (prob < CONF_THRESH)
 
     if correct and not lowconf:
-        # confident & correct → skip saving
+        # confident & correct → skip saving (unless OUTPUT_MODE "all")
+        if writer.wants(correct, prob):
+            writer.submit(os.path.join(OK_DIR, os.path.basename(path)), draw_overlay,
+                          crop, [f"pred {pred_num} ({prob:.2f})"], (0,255,0))
         continue
 
     # decide folder & overlay
@@ -83,18 +117,20 @@ for path in sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*"))):
         text = [f"pred {pred_num} ({prob:.2f})",
                 f"true {true_num} {tag}"]
 
-    # draw overlay (BGR)
-    canvas = cv2.cvtColor(crop, cv2.COLOR_RGB2BGR)
-    put_multiline(canvas, text, color)
+    if not writer.wants(correct, prob):
+        continue
 
-    # save with original filename
+    # draw overlay (BGR) + save with original filename, on the writer threads
     out_path = os.path.join(dest_dir, os.path.basename(path))
-    cv2.imwrite(out_path, canvas)
+    writer.submit(out_path, draw_overlay, crop, text, color)
     print(f"[saved] {path}  →  {out_path}")
 
 # ───────── summary ────────────────────────────────────────────────
+elapsed = time.perf_counter() - t_start
+writer.close()
 print("\n=== Audit summary ===")
 print(f"Total images    : {total}")
 print(f"Incorrect       : {wrong}")
 print(f"Low confidence  : {low}")
 print(f"Skipped (clean) : {total - wrong - low}")
+print(f"Throughput      : {engine.images / elapsed if elapsed else 0.0:.1f} img/s")
@@ -1,40 +1,78 @@
 #!/usr/bin/env python3
-import tensorflow as tf
 import numpy as np
-import cv2, glob, os
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+import cv2, glob, os, time
+from batch_infer import BatchPredictor
+from lite_runtime import load_model
+from output_writer import OutputWriter
+from run_config import apply_overrides
+from stage_timer import stage, record
+from shards import open_shard
 # 1) Config
 MODEL_PATH         = "dice_mobilenetv2.h5"
 TEST_DIR           = "new_dataset/train"    # your cropped test set
 OUTPUT_DIR         = "output_cnn/"
 IMG_SIZE           = (256, 256)
-SAVE_CORRECT_IMGS  = False  # ← set to True to write correct images as well
+OUTPUT_MODE        = "errors"  # "all" | "errors" (incorrect / below CONF_THRESH) | "none"
+CONF_THRESH        = 0.0     # "errors" also keeps correct hits below this
+BATCH_SIZE         = 32     # images per model call
+PREFETCH           = 2      # batches decoded ahead of the model
+SHARD_DIR          = None   # e.g. "shards" → read pre-decoded tensors (shards.py)
+apply_overrides(globals())
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # 2) Load model
-model = tf.keras.models.load_model(MODEL_PATH)
+model = load_model(MODEL_PATH)   # .h5, or an exported .tflite / .onnx
 
 # 3) Process each test image, track correctness
+def load_rgb(path):
+    with stage("decode"):
+        img = cv2.imread(path, cv2.IMREAD_COLOR)      # 3-channel BGR
+    if img is None:
+        return None
+    with stage("resize"):
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)    # BGR ➜ RGB
+        return cv2.resize(img, IMG_SIZE)
+
+def prepare(batch):
+    # Prepare for prediction  (match training pipeline!)
+    # mobilenet_v2.preprocess_input without importing TensorFlow
+    return batch.astype("float32") / 127.5 - 1.0      # 0-255 → [-1,1]
+
+def draw_overlay(img_rgb, label_text, color):
+    out = img_rgb.copy()                              # already RGB
+    cv2.putText(
+        out,
+        label_text,
+        (5, 20),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        0.5,
+        color,
+        1,
+        cv2.LINE_AA
+    )
+    return out
+
 results = []
+writer  = OutputWriter(OUTPUT_MODE, conf_thresh=CONF_THRESH)   # annotate + save off-loop
+engine  = BatchPredictor(model, load_rgb, batch_size=BATCH_SIZE,
+                         prefetch=PREFETCH, preprocess=prepare)
+if SHARD_DIR:
+    # pre-decoded uint8 tensors (python shards.py) – no JPEG decode at all
+    shard  = open_shard(SHARD_DIR, TEST_DIR, IMG_SIZE)
+    stream = engine.run_arrays(shard.paths, shard.images)
+else:
+    stream = engine.run(sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*"))))
+t_start = time.perf_counter()
+
+for path, img_resized, preds in stream:
+    if img_resized is None:
+        continue
 
-for path in sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*"))):
     # True label from folder name e.g. "side_02" → 2
     true_folder = os.path.basename(os.path.dirname(path))
     true_num    = int(true_folder.split("_")[1])
 
-    img = cv2.imread(path, cv2.IMREAD_COLOR)          # 3-channel BGR
-    if img is None:
-        continue
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)        # BGR ➜ RGB
-    img_resized = cv2.resize(img, IMG_SIZE)
-
-    # Prepare for prediction  (match training pipeline!)
-    x = preprocess_input(img_resized.astype("float32"))  # 0-255 → [-1,1]
-    x = np.expand_dims(x, axis=0)                        # (1,256,256,3)
-
-    # Predict
-    preds  = model.predict(x, verbose=0)[0]           # e.g. [0.1, 0.7, …]
     picked = int(np.argmax(preds))                    # index 0–5
     prob   = preds[picked]
 
@@ -45,37 +83,27 @@ for path in sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*"))):
     # Determine correctness
     is_correct = (cls_num == true_num)
     results.append(is_correct)
+    record(path, cls_num, prob)
 
-    # 4) Annotate overlay
-    out = img_resized.copy()                          # already RGB
-    label_text = f"class_{cls_num:02d} ({prob:.2f})"
-    if not is_correct:
-        label_text += " incorrect"
-    color = (0, 255, 0) if is_correct else (0, 0, 255)
-    cv2.putText(
-        out,
-        label_text,
-        (5, 20),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        0.5,
-        color,
-        1,
-        cv2.LINE_AA
-    )
-
-    # 5) Save with new filename (optionally skip correct ones)
-    if (is_correct and SAVE_CORRECT_IMGS) or not is_correct:
+    # 4) Annotate overlay + save with new filename (per OUTPUT_MODE)
+    if writer.wants(is_correct, prob):
+        label_text = f"class_{cls_num:02d} ({prob:.2f})"
+        if not is_correct:
+            label_text += " incorrect"
+        color = (0, 255, 0) if is_correct else (0, 0, 255)
         orig_name = os.path.basename(path)
         prefix = "class" if is_correct else "incorrect"
         new_name = f"{prefix}_{cls_num:02d}_{score_str}_{orig_name}"
-        out_path = os.path.join(OUTPUT_DIR, new_name)
-        cv2.imwrite(out_path, out)
+        writer.submit(os.path.join(OUTPUT_DIR, new_name), draw_overlay,
+                      img_resized, label_text, color)
         print(f"[{prefix} {cls_num:02d} ({prob:.2f})] {path} → {new_name}")
     # else:
         # still print something brief so you know it was processed
         # print(f"[skip   {cls_num:02d} ({prob:.2f})] {path}")
 
 # 4) Compute & print accuracy stats
+elapsed   = time.perf_counter() - t_start
+writer.close()
 total     = len(results)
 correct   = sum(results)
 incorrect = total - correct
@@ -88,3 +116,4 @@ print(f"Correct:         {correct}")
 print(f"Incorrect:       {incorrect}")
 print(f"Accuracy:        {accuracy:.3f}")
 print(f"Std. deviation:  {std_dev:.3f}")
+print(f"Throughput:      {total / elapsed if elapsed else 0.0:.1f} img/s")
@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
-import tensorflow as tf
 import numpy as np
-import cv2, glob, os
+import cv2, glob, os, time
+from batch_infer import WORKERS, BatchPredictor
+from lite_runtime import load_model
+from output_writer import OutputWriter
+from roi_tracker import ROITracker, rig_of
+from run_config import apply_overrides
+from stage_timer import stage, record
 
 # ─── CONFIG ─────────────────────────────────────────────────────────────────────
 MODEL_PATH     = "dice_cnn.h5"
@@ -9,23 +14,28 @@ TEST_DIR       = "tests"        # your test set organized as tests/side_XX/*.jpg
 OUTPUT_DIR     = "output_cnn/"  # where to save annotated + renamed crops
 IMG_SIZE       = (256, 256)
 MIN_AREA_RATIO = 0.01           # ignore tiny contours (<1% of image area)
+BATCH_SIZE     = 32             # crops per model call
+PREFETCH       = 2              # batches decoded + cropped ahead of the model
+OUTPUT_MODE    = "all"          # "all" | "errors" (incorrect / below CONF_THRESH) | "none"
+CONF_THRESH    = 0.0            # "errors" also keeps correct hits below this
+ROI_TRACKING   = False          # True for consecutive rig frames: search near the last die first
+RIG_PATTERN    = None           # regex with a (?P<rig>…) group over the file name, e.g. r"^(?P<rig>rig\d+)_"
 # ────────────────────────────────────────────────────────────────────────────────
+apply_overrides(globals())
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # 1) Load model
-model = tf.keras.models.load_model(MODEL_PATH)
+model = load_model(MODEL_PATH)   # .h5, or an exported .tflite / .onnx
 
-# 2) Helper: find the die bounding box in a grayscale image
-def detect_die_bbox(gray):
+# 2) Helper: find the die bounding box in a grayscale image (or a window of it)
+def find_die(gray, min_area):
     blur = cv2.GaussianBlur(gray, (5,5), 0)
     v = np.median(blur)
     lo = int(max(0, 0.66 * v))
     hi = int(min(255, 1.33 * v))
     edges = cv2.Canny(blur, lo, hi)
     cnts, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    H, W = gray.shape
-    min_area = MIN_AREA_RATIO * W * H
     best_box = None
     best_area = 0
     for c in cnts:
@@ -34,6 +44,17 @@ def detect_die_bbox(gray):
         if area >= min_area and area > best_area:
             best_area = area
             best_box = (x,y,w,h)
+    return best_box
+
+roi = ROITracker(find_die)
+
+def detect_die_bbox(gray, rig="default"):
+    H, W = gray.shape
+    min_area = MIN_AREA_RATIO * W * H
+    if ROI_TRACKING:
+        best_box = roi.locate(gray, min_area, rig)
+    else:
+        best_box = find_die(gray, min_area)
     # fallback to center crop if nothing found
     if best_box is None:
         margin = 0.1
@@ -43,58 +64,83 @@ def detect_die_bbox(gray):
         )
     return best_box
 
-# 3) Process each test image, collect correctness
-results = []  # list of booleans: True if correct, False if incorrect
-
-for path in sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*"))):
-    # derive true label from folder name, e.g. "side_02" → 2
-    true_folder = os.path.basename(os.path.dirname(path))
-    true_num    = int(true_folder.split("_")[1])
-
+# 3) Helper: decode, locate & crop one image (runs on a batch_infer worker)
+def load_crop(path):
     # a) load as grayscale
-    img_gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    with stage("decode"):
+        img_gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
     if img_gray is None:
-        continue
+        return None
 
     # b) detect & crop
-    x,y,w,h = detect_die_bbox(img_gray)
-    crop = img_gray[y:y+h, x:x+w]
+    with stage("locate"):
+        x,y,w,h = detect_die_bbox(img_gray, rig_of(path, RIG_PATTERN))
+        crop = img_gray[y:y+h, x:x+w]
+
+    # c) resize for model
+    with stage("resize"):
+        return cv2.resize(crop, IMG_SIZE, interpolation=cv2.INTER_AREA)
+
+def draw_overlay(crop_gray, label_text, color):
+    out = cv2.cvtColor(crop_gray, cv2.COLOR_GRAY2BGR)
+    cv2.putText(
+        out, label_text, (5,20),
+        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA
+    )
+    return out
 
-    # c) resize & normalize for model
-    img_resized = cv2.resize(crop, IMG_SIZE, interpolation=cv2.INTER_AREA)
-    x_input = img_resized.astype("float32") / 255.0
-    x_input = np.expand_dims(x_input, axis=(0, -1))  # (1,256,256,1)
+def prepare(batch):
+    # normalize for model: (N,256,256) uint8 → (N,256,256,1) float
+    return (batch.astype("float32") / 255.0)[..., None]
+
+# 4) Process each test image, collect correctness
+results = []  # list of booleans: True if correct, False if incorrect
+writer  = OutputWriter(OUTPUT_MODE, conf_thresh=CONF_THRESH)   # annotate + save off-loop
+paths   = sorted(glob.glob(os.path.join(TEST_DIR, "*", "*.*")))
+# The tracker follows each rig frame to frame, so it must see the frames in
+# path order: one loader thread (still prefetching ahead of the model).
+workers = 1 if ROI_TRACKING else WORKERS
+if ROI_TRACKING and WORKERS > 1:
+    print(f"ℹ ROI_TRACKING: locating on 1 loader thread instead of {WORKERS} to keep frame order")
+engine  = BatchPredictor(model, load_crop, batch_size=BATCH_SIZE,
+                         prefetch=PREFETCH, workers=workers, preprocess=prepare)
+t_start = time.perf_counter()
 
-    # d) predict
-    preds    = model.predict(x_input, verbose=0)[0]
+for path, img_resized, preds in engine.run(paths):
+    if img_resized is None:
+        continue
+
+    # derive true label from folder name, e.g. "side_02" → 2
+    true_folder = os.path.basename(os.path.dirname(path))
+    true_num    = int(true_folder.split("_")[1])
+
+    # d) predict (done in batches by the engine)
     picked   = int(np.argmax(preds))
     prob     = preds[picked]
     cls_num  = picked + 1
     score_str = f"{prob:.2f}".replace('.', '_')
     is_correct = (cls_num == true_num)
     results.append(is_correct)
+    record(path, cls_num, prob)
 
-    # e) annotate overlay
-    out = cv2.cvtColor(img_resized, cv2.COLOR_GRAY2BGR)
+    # e) annotate overlay + save with new filename (writer thread, per OUTPUT_MODE)
+    if not writer.wants(is_correct, prob):
+        continue
     label_text = f"class_{cls_num:02d} ({prob:.2f})"
     if not is_correct:
         label_text += " incorrect"
     color = (0,255,0) if is_correct else (0,0,255)
-    cv2.putText(
-        out, label_text, (5,20),
-        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA
-    )
-
-    # f) save with new filename
     orig_name = os.path.basename(path)
     prefix = "class" if is_correct else "incorrect"
     new_name = f"{prefix}_{cls_num:02d}_{score_str}_{orig_name}"
-    out_path = os.path.join(OUTPUT_DIR, new_name)
-    cv2.imwrite(out_path, out)
+    writer.submit(os.path.join(OUTPUT_DIR, new_name), draw_overlay,
+                  img_resized, label_text, color)
 
     print(f"[{prefix} {cls_num:02d} ({prob:.2f})] {path} → {new_name}")
 
-# 4) Compute & print accuracy stats
+# 5) Compute & print accuracy stats
+elapsed = time.perf_counter() - t_start
+writer.close()
 total = len(results)
 correct = sum(results)
 incorrect = total - correct
@@ -107,3 +153,6 @@ print(f"Correct:         {correct}")
 print(f"Incorrect:       {incorrect}")
 print(f"Accuracy:        {accuracy:.3f}")
 print(f"Std. deviation:  {std_dev:.3f}")
+print(f"Throughput:      {total / elapsed if elapsed else 0.0:.1f} img/s")
+if ROI_TRACKING:
+    print(roi.summary())
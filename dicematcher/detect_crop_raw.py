@@ -1,9 +1,15 @@
 #!/usr/bin/env python3
-import tensorflow as tf
 import numpy as np
 import cv2
 import glob
 import os
+from background_model import BackgroundModel
+from frame_quality import WIDTH as QUALITY_WIDTH, QualityGate
+from lite_runtime import load_model
+from output_writer import OutputWriter
+from roi_tracker import ROITracker, rig_of
+from run_config import apply_overrides
+from stage_timer import stage, record
 
 # ─── CONFIG ─────────────────────────────────────────────────────────────────────
 MODEL_PATH       = "dice_cnn_custom.h5"
@@ -11,41 +17,34 @@ TEST_DIR         = "fair_roller_tests"   # flat directory of images
 MIN_AREA_RATIO   = 0.01                   # ignore tiny contours (<1% of image area)
 CONF_THRESHOLD   = 0.50                   # only count predictions above this confidence
 CROPS_DIR        = "fair_roller_tests/crops"  # where to save cropped images
-BACKGROUND_PATH  = "background.jpg"     # where to save the averaged background
+BACKGROUND_PATH  = "background.jpg"     # seeds / saves the running background
+BG_WARMUP        = 20                    # frames buffered to build a background from scratch
 MIN_CROP_RATIO   = 60 / 360.0            # minimum crop size ratio (60px @ 360px)
 MAX_CROP_RATIO   = 80 / 360.0            # maximum crop size ratio (80px @ 360px)
+OUTPUT_MODE      = "all"                 # crops to save: "all" | "errors" (≤ CONF_THRESHOLD) | "none"
+ROI_TRACKING     = False                 # True for consecutive rig frames: search near the last die first
+RIG_PATTERN      = None                  # regex with a (?P<rig>…) group over the file name
+QUALITY_GATE     = "flag"                # blurry / moving / badly exposed frames: "off" | "flag" | "reject"
 # ────────────────────────────────────────────────────────────────────────────────
+apply_overrides(globals())
 
 # 1) Prepare output directory for crops
 os.makedirs(CROPS_DIR, exist_ok=True)
 
 # 2) Load model and infer its expected input size & channels
-model = tf.keras.models.load_model(MODEL_PATH)
+model = load_model(MODEL_PATH)   # .h5, or an exported .tflite / .onnx
 _, H, W, C = model.input_shape     # e.g. (None, 128, 128, 3)
 IMG_SIZE = (W, H)                  # cv2.resize expects (width, height)
 num_sides = model.output_shape[-1]
 
-# 3) Compute background by averaging all color images
-bg_sum = None
-count = 0
-for path in sorted(glob.glob(os.path.join(TEST_DIR, "*.*"))):
-    img = cv2.imread(path, cv2.IMREAD_COLOR)
-    if img is None:
-        continue
-    img_f = img.astype('float32')
-    bg_sum = img_f if bg_sum is None else bg_sum + img_f
-    count += 1
-if count > 0:
-    background = (bg_sum / count).astype('uint8')
-    cv2.imwrite(BACKGROUND_PATH, background)
-    print(f"Saved averaged background to {BACKGROUND_PATH}")
-else:
-    background = None
-    print("No images found; background not computed.")
+# 3) Online background model (one decode per frame, constant memory)
+bg_model = BackgroundModel(warmup=BG_WARMUP)
+if bg_model.load(BACKGROUND_PATH):
+    print(f"Seeded background from {BACKGROUND_PATH}")
 
 # 4) Improved die detection using threshold + morphology
 
-def detect_die_bbox(diff_gray):
+def find_die(diff_gray, min_area):
     # 4.1) Blur to reduce noise
     blur = cv2.GaussianBlur(diff_gray, (5,5), 0)
     # 4.2) Binary threshold via Otsu
@@ -57,14 +56,24 @@ def detect_die_bbox(diff_gray):
 
     # 4.4) Find contours on cleaned mask
     cnts, _ = cv2.findContours(opened, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    H0, W0 = diff_gray.shape
-    min_area = MIN_AREA_RATIO * W0 * H0
     best_box, best_area = None, 0
     for c in cnts:
         x,y,w,h = cv2.boundingRect(c)
         area = w * h
         if area >= min_area and area > best_area:
             best_box, best_area = (x, y, w, h), area
+    return best_box
+
+# Per-rig search window around the last die (see roi_tracker.py)
+roi = ROITracker(find_die)
+
+def detect_die_bbox(diff_gray, rig="default"):
+    H0, W0 = diff_gray.shape
+    min_area = MIN_AREA_RATIO * W0 * H0
+    if ROI_TRACKING:
+        best_box = roi.locate(diff_gray, min_area, rig)
+    else:
+        best_box = find_die(diff_gray, min_area)
 
     # 4.5) Fallback if nothing found
     if best_box is None:
@@ -90,31 +99,88 @@ def detect_die_bbox(diff_gray):
 
 # 5) Initialize tally
 counts = {i+1: 0 for i in range(num_sides)}
-
-# 6) Process each image with improved detection
-for path in sorted(glob.glob(os.path.join(TEST_DIR, "*.*"))):
-    img = cv2.imread(path, cv2.IMREAD_COLOR)
-    if img is None or background is None:
-        continue
-
-    # Compute color diff and collapse to gray by max channel
-    diff_color = cv2.absdiff(img, background)
-    diff_gray = np.max(diff_color, axis=2).astype('uint8')
-
-    # Detect and crop
-    x, y, w, h = detect_die_bbox(diff_gray)
-    crop = img[y:y+h, x:x+w]
-
-    # Save crop and perform prediction
-    base = os.path.splitext(os.path.basename(path))[0]
-    cv2.imwrite(os.path.join(CROPS_DIR, f"{base}_crop.jpg"), crop)
-    resized = cv2.resize(crop, IMG_SIZE, interpolation=cv2.INTER_AREA)
-    x_input = np.expand_dims(resized.astype("float32")/255.0, axis=0)
-    preds = model.predict(x_input, verbose=0)[0]
+gate = QualityGate()                # see frame_quality.py
+gate_hits = 0
+writer = OutputWriter(OUTPUT_MODE, conf_thresh=CONF_THRESHOLD)   # crops saved off-loop
+
+# 6) Per-frame detection – usable live, one frame at a time
+def process_frame(img, base, learn=True):
+    global gate_hits
+    rig = rig_of(base, RIG_PATTERN)
+    # Compute color diff (max channel) against the running background
+    with stage("locate"):
+        diff_gray = bg_model.diff(img)
+
+        # Detect and crop
+        x, y, w, h = detect_die_bbox(diff_gray, rig)
+        crop = img[y:y+h, x:x+w]
+
+    # Cheap blur / motion / exposure check on a thumbnail, sharpness inside
+    # the die's box; a rejected frame never reaches the background model or
+    # the CNN
+    if QUALITY_GATE != "off":
+        with stage("quality"):
+            h0, w0 = img.shape[:2]
+            small = cv2.resize(img, (QUALITY_WIDTH, max(1, h0 * QUALITY_WIDTH // w0)),
+                               interpolation=cv2.INTER_AREA)
+            sy, sx = small.shape[0] / h0, small.shape[1] / w0
+            verdict = gate.check(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), rig,
+                                 roi=(x * sx, y * sy, w * sx, h * sy))
+        if not verdict.ok:
+            gate_hits += 1
+            print(f"🚫 {base}: {', '.join(verdict.reasons)}")
+            if QUALITY_GATE == "reject":
+                record(base, None)
+                return
+    if learn:
+        with stage("locate"):
+            bg_model.update(img)
+
+    # Predict, then hand the crop to the writer threads
+    with stage("resize"):
+        resized = cv2.resize(crop, IMG_SIZE, interpolation=cv2.INTER_AREA)
+        x_input = np.expand_dims(resized.astype("float32")/255.0, axis=0)
+    with stage("predict"):
+        preds = model.predict(x_input, verbose=0)[0]
     choice, prob = int(np.argmax(preds)), np.max(preds)
     side = choice + 1
+    record(base, side, prob)
     if prob > CONF_THRESHOLD:
         counts[side] += 1
+    if writer.wants(prob > CONF_THRESHOLD, prob):
+        writer.submit(os.path.join(CROPS_DIR, f"{base}_crop.jpg"), None, crop)
+
+# Single pass over TEST_DIR.  Without a seeded background the first
+# BG_WARMUP frames are held back (bounded buffer) until the model has
+# enough history, then processed against it.
+pending = []
+for path in sorted(glob.glob(os.path.join(TEST_DIR, "*.*"))):
+    with stage("decode"):
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        continue
+    base = os.path.splitext(os.path.basename(path))[0]
+    if not bg_model.ready:
+        bg_model.update(img)
+        pending.append((img, base))
+        continue
+    for held in pending:            # already folded into the background
+        process_frame(*held, learn=False)
+    pending = []
+    process_frame(img, base)
+for held in pending:                # short run: never reached BG_WARMUP
+    process_frame(*held, learn=False)
+writer.close()
+if ROI_TRACKING:
+    print(roi.summary())
+if gate_hits:
+    print(f"Quality gate: {gate_hits} frame(s) {'rejected' if QUALITY_GATE == 'reject' else 'flagged'}")
+
+if bg_model.background is not None:
+    bg_model.save(BACKGROUND_PATH)
+    print(f"Saved running background to {BACKGROUND_PATH}")
+else:
+    print("No images found; background not computed.")
 
 # 7) Print final tally
 print(f"\n=== Detection Tally (confidence > {CONF_THRESHOLD:.0%}) ===")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# export_model.py
+# —————————————————————————————————————————
+# Export a Keras .h5 dice classifier to CPU-friendly artifacts and report
+# what each one costs in accuracy and buys in latency:
+#
+#   exported/<stem>.fp16.tflite   float16 weights
+#   exported/<stem>.int8.tflite   full-integer ops, float32 in/out
+#   exported/<stem>.fp32.onnx     (tf2onnx)
+#   exported/<stem>.fp16.onnx     (onnxconverter-common)
+#   exported/<stem>.int8.onnx     static QDQ quantisation (onnxruntime)
+#   exported/<stem>.report.json   accuracy / agreement / latency / size
+#
+# int8 calibration uses images from CALIB_DIR, preprocessed exactly as the
+# model expects, so every artifact takes the same input as the .h5.  Load
+# any of them with lite_runtime.load_model().  Accuracy / agreement are
+# measured on EVAL_DIR (default: the rest of CALIB_DIR – the calibration
+# images themselves are left out).
+#
+#   python export_model.py dice_cnn_custom_978.h5
+#   python export_model.py dice_mobilenetv2.h5 --preprocess mobilenet --formats tflite
+#   python export_model.py dice_cnn_custom_978.h5 --calib new_dataset/train --eval new_dataset/valid
+
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from lite_runtime import load_model
+from shards import list_directory
+
+# CONFIG
+CALIB_DIR    = "new_dataset/valid"
+OUT_DIR      = "exported"
+CALIB_N      = 200           # representative images for int8 calibration
+EVAL_DIR     = None          # None = CALIB_DIR minus the calibration images
+EVAL_N       = 0             # 0 = evaluate on every eligible image
+LAT_BATCHES  = [1, 32]       # batch sizes to time
+LAT_REPS     = 30
+
+
+# ─── data ─────────────────────────────────────────────────────────────────────
+
+def preprocess_fn(mode):
+    if mode == "mobilenet":
+        return lambda x: x.astype("float32") / 127.5 - 1.0    # mobilenet_v2.preprocess_input
+    return lambda x: x.astype("float32")                      # custom CNNs: raw 0-255
+
+
+def load_images(directory, size, limit=0, seed=0, exclude=()):
+    """(uint8 RGB batch, labels, chosen indices) resized the way the detect
+    scripts do; indices in `exclude` are never picked."""
+    paths, labels, _ = list_directory(directory)
+    idx = np.setdiff1d(np.arange(len(paths)), np.asarray(list(exclude), dtype=int))
+    if limit and limit < len(idx):
+        idx = np.sort(np.random.default_rng(seed).choice(idx, limit, replace=False))
+    imgs, keep = [], []
+    for i in idx:
+        bgr = cv2.imread(paths[i], cv2.IMREAD_COLOR)
+        if bgr is None:
+            continue
+        imgs.append(cv2.resize(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), size))
+        keep.append(labels[i])
+    if not imgs:
+        raise SystemExit(f"[!] no usable images in {directory}"
+                         + (" after leaving out the calibration set – pass --eval DIR "
+                            "or a smaller --calib-n" if len(exclude) else ""))
+    return np.stack(imgs), np.asarray(keep), idx
+
+
+# ─── exporters ────────────────────────────────────────────────────────────────
+
+def export_tflite(model, quant, calib, out_path):
+    import tensorflow as tf
+    conv = tf.lite.TFLiteConverter.from_keras_model(model)
+    conv.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quant == "fp16":
+        conv.target_spec.supported_types = [tf.float16]
+    else:
+        conv.representative_dataset = lambda: ([calib[i:i + 1]] for i in range(len(calib)))
+        conv.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # float32 in/out: callers keep passing what they pass to the .h5
+    with open(out_path, "wb") as f:
+        f.write(conv.convert())
+
+
+def export_onnx_fp32(model, out_path):
+    import tensorflow as tf
+    import tf2onnx
+    spec = (tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input"),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=out_path)
+
+
+def export_onnx(fp32_path, quant, calib, out_path):
+    import onnx
+    if quant == "fp16":
+        from onnxconverter_common import float16
+        m = float16.convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True)
+        onnx.save(m, out_path)
+        return
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat,
+                                          QuantType, quantize_static)
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            name = onnx.load(fp32_path).graph.input[0].name
+            self._it = iter([{name: calib[i:i + 1]} for i in range(len(calib))])
+
+        def get_next(self):
+            return next(self._it, None)
+
+    quantize_static(fp32_path, out_path, Reader(), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+
+
+# ─── report ───────────────────────────────────────────────────────────────────
+
+def predict_all(model, x, batch=32):
+    out = []
+    for s in range(0, len(x), batch):
+        xb = x[s:s + batch]
+        k = len(xb)
+        if k < batch:                                  # fixed shape, like batch_infer
+            xb = np.concatenate([xb, np.repeat(xb[-1:], batch - k, axis=0)])
+        out.append(np.asarray(model.predict_on_batch(xb))[:k])
+    return np.concatenate(out)
+
+
+def latency(model, x, batch, reps=LAT_REPS):
+    xb = np.repeat(x[:1], batch, axis=0) if len(x) < batch else x[:batch]
+    model.predict_on_batch(xb)                         # warm-up / allocate
+    times = []
+    for _ in range(reps):
+        t = time.perf_counter()
+        model.predict_on_batch(xb)
+        times.append((time.perf_counter() - t) * 1000)
+    p50, p95 = np.percentile(times, [50, 95])
+    return {"batch": batch, "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "img_per_s": round(batch / (p50 / 1000), 1)}
+
+
+def evaluate(name, model, x, y, ref_probs=None):
+    probs = predict_all(model, x)
+    pred = probs.argmax(1)
+    row = {"artifact": name, "accuracy": round(float((pred == y).mean()), 4)}
+    if ref_probs is not None:
+        row["agreement"] = round(float((pred == ref_probs.argmax(1)).mean()), 4)
+        row["max_abs_prob_delta"] = round(float(np.abs(probs - ref_probs).max()), 4)
+    row["latency"] = [latency(model, x, b) for b in LAT_BATCHES]
+    if os.path.exists(name):
+        row["size_mb"] = round(os.path.getsize(name) / 1e6, 2)
+    return row, probs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export a Keras dice model to TFLite / ONNX")
+    ap.add_argument("model")
+    ap.add_argument("--out", default=OUT_DIR)
+    ap.add_argument("--calib", default=CALIB_DIR)
+    ap.add_argument("--calib-n", type=int, default=CALIB_N)
+    ap.add_argument("--eval", default=EVAL_DIR,
+                    help="evaluation folder (default: --calib minus the calibration images)")
+    ap.add_argument("--eval-n", type=int, default=EVAL_N)
+    ap.add_argument("--formats", nargs="+", default=["tflite", "onnx"], choices=["tflite", "onnx"])
+    ap.add_argument("--quant", nargs="+", default=["fp16", "int8"], choices=["fp16", "int8"])
+    ap.add_argument("--preprocess", choices=["raw", "mobilenet"], default=None,
+                    help="model input scaling (default: guessed from the file name)")
+    args = ap.parse_args()
+
+    mode = args.preprocess or ("mobilenet" if "mobilenet" in args.model.lower() else "raw")
+    prep = preprocess_fn(mode)
+    os.makedirs(args.out, exist_ok=True)
+    stem = os.path.join(args.out, os.path.splitext(os.path.basename(args.model))[0])
+
+    keras_model = load_model(args.model)
+    _, h, w, _ = keras_model.input_shape
+    calib_u8, _, calib_idx = load_images(args.calib, (w, h), args.calib_n)
+    calib = prep(calib_u8)
+    eval_dir = args.eval or args.calib
+    same = os.path.normpath(eval_dir) == os.path.normpath(args.calib)
+    x_u8, y, _ = load_images(eval_dir, (w, h), args.eval_n,
+                             exclude=calib_idx if same else ())
+    x = prep(x_u8)
+    print(f"→ {args.model}: input {h}×{w}, preprocess={mode}, "
+          f"{len(calib)} calibration / {len(x)} eval images")
+
+    artifacts = []
+    if "tflite" in args.formats:
+        for q in args.quant:
+            path = f"{stem}.{q}.tflite"
+            export_tflite(keras_model, q, calib, path)
+            artifacts.append(path)
+            print(f"  ✅ {path}")
+    if "onnx" in args.formats:
+        fp32 = f"{stem}.fp32.onnx"
+        try:
+            export_onnx_fp32(keras_model, fp32)
+            artifacts.append(fp32)
+            print(f"  ✅ {fp32}")
+            for q in args.quant:
+                path = f"{stem}.{q}.onnx"
+                export_onnx(fp32, q, calib, path)
+                artifacts.append(path)
+                print(f"  ✅ {path}")
+        except ImportError as ex:
+            print(f"  [!] ONNX export skipped: {ex} (pip install tf2onnx onnxruntime onnxconverter-common)")
+
+    print("\n=== Report ===")
+    rows = []
+    ref, ref_probs = evaluate(args.model, keras_model, x, y)
+    rows.append(ref)
+    for path in artifacts:
+        row, _ = evaluate(path, load_model(path), x, y, ref_probs)
+        row["accuracy_delta"] = round(row["accuracy"] - ref["accuracy"], 4)
+        rows.append(row)
+
+    print(f"{'artifact':48s} {'acc':>6s} {'Δacc':>7s} {'agree':>6s} "
+          + " ".join(f"{'p50@' + str(b):>9s}" for b in LAT_BATCHES) + f" {'MB':>7s}")
+    for r in rows:
+        lat = " ".join(f"{l['p50_ms']:8.2f}m" for l in r["latency"])
+        print(f"{os.path.basename(r['artifact']):48s} {r['accuracy']:6.3f} "
+              f"{r.get('accuracy_delta', 0):+7.3f} {r.get('agreement', 1):6.3f} {lat} "
+              f"{r.get('size_mb', 0):7.2f}")
+
+    report = f"{stem}.report.json"
+    with open(report, "w") as f:
+        json.dump({"model": args.model, "preprocess": mode, "calib_dir": args.calib,
+                   "calib_n": len(calib), "eval_dir": eval_dir,
+                   "eval_excludes_calib": same, "eval_n": len(x), "results": rows}, f, indent=2)
+    print(f"📝 report → {report}")
+
+
+if __name__ == "__main__":
+    main()
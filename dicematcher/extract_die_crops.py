@@ -1,7 +1,28 @@
 #!/usr/bin/env python3
-import os, json, cv2
+# extract_die_crops.py
+# —————————————————————————————————————————
+# COCO detection set → per-class crop folders for the CNN.
+#
+# Annotations are grouped by image so every source image is decoded once,
+# and images are spread over a process pool.  Resumable: a crop that
+# already exists as {base}_ann{id}.jpg is skipped, and an image whose
+# crops all exist is not decoded at all.
+#
+#   python extract_die_crops.py                 # all splits, all cores
+#   python extract_die_crops.py --workers 4 --force
+
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 
+import cv2
+
+from run_config import apply_overrides
+
 # ─── USER CONFIG ───────────────────────────────────────────────────────────────
 DATA_ROOT      = "big_dataset"       # contains 'train', 'valid', 'test' subfolders
 SPLITS         = ["train", "valid", "test"]
@@ -9,24 +30,64 @@ NEW_DATA_ROOT  = "big_dataset_cropped"   # where to write your cropped classific
 IMG_SIZE       = (256, 256)      # match your CNN input
 # map COCO category_id → folder name
 CLASS_MAP = {i: f"side_{i:02d}" for i in range(1, 7)}
+WORKERS        = os.cpu_count() or 1
+JPEG_QUALITY   = 95              # cv2.imwrite default
+apply_overrides(globals())
 # ────────────────────────────────────────────────────────────────────────────────
 
-# make sure output dirs exist
-for split in SPLITS:
-    for cls in CLASS_MAP.values():
-        os.makedirs(os.path.join(NEW_DATA_ROOT, split, cls), exist_ok=True)
 
-for split in SPLITS:
-    split_dir = os.path.join(DATA_ROOT, split)
+def crop_path(out_root, split, cls_name, fname, ann_id):
+    base = os.path.splitext(fname)[0]
+    return os.path.join(out_root, split, cls_name, f"{base}_ann{ann_id}.jpg")
+
+
+def _init_worker():
+    cv2.setNumThreads(1)         # one image per process; don't oversubscribe
+
+
+def extract_image(job):
+    """Decode one image, write its pending crops. Runs in a pool worker.
+
+    job = (img_path, [(bbox, out_path), …]) → (saved, [warnings])
+    """
+    img_path, crops = job
+    img = cv2.imread(img_path)
+    if img is None:
+        return 0, [f"Could not load {img_path}"]
+    saved, warnings = 0, []
+    for (x, y, w, h), out_path in crops:
+        crop = img[max(y, 0):y + h, max(x, 0):x + w]
+        if crop.size == 0:
+            warnings.append(f"Empty crop for {os.path.basename(out_path)}, skipping")
+            continue
+        out = cv2.resize(crop, IMG_SIZE, interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", out, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ok:
+            warnings.append(f"Could not encode {out_path}")
+            continue
+        # write-then-rename: an interrupted run never leaves a truncated crop
+        # behind that the resume check would mistake for a finished one
+        tmp = out_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.tobytes())
+        os.replace(tmp, out_path)
+        saved += 1
+    return saved, warnings
+
+
+def plan_split(split, data_root, out_root, force):
+    """([(img_path, pending crops)], n already on disk) for one split."""
+    split_dir = os.path.join(data_root, split)
     # find the one JSON file
     json_paths = glob(os.path.join(split_dir, "*.json"))
     if not json_paths:
         print(f"[!] No .json in {split_dir}, skipping")
-        continue
+        return [], 0
     ann_path = json_paths[0]
     print(f"→ Processing {split}: reading {os.path.basename(ann_path)}")
 
-    coco = json.load(open(ann_path, "r"))
+    with open(ann_path, "r") as f:
+        coco = json.load(f)
     # images may live in split/images/ or directly in split/
     img_root = os.path.join(split_dir, "images")
     if not os.path.isdir(img_root):
@@ -35,38 +96,59 @@ for split in SPLITS:
     # build id → filename map
     id2file = {img["id"]: img["file_name"] for img in coco["images"]}
 
+    by_image = defaultdict(list)
+    skipped = 0
     for ann in coco["annotations"]:
         cid = ann["category_id"]
         # skip background or other categories
         if cid not in CLASS_MAP:
             continue
-
-        cls_name = CLASS_MAP[cid]
-        img_id   = ann["image_id"]
-        fname    = id2file.get(img_id)
+        fname = id2file.get(ann["image_id"])
         if not fname:
-            print(f"  [!] Missing file for image_id {img_id}")
+            print(f"  [!] Missing file for image_id {ann['image_id']}")
             continue
-
-        img_path = os.path.join(img_root, fname)
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"  [!] Could not load {img_path}")
+        out_path = crop_path(out_root, split, CLASS_MAP[cid], fname, ann["id"])
+        if not force and os.path.exists(out_path):
+            skipped += 1
             continue
+        bbox = tuple(map(int, ann["bbox"]))
+        by_image[os.path.join(img_root, fname)].append((bbox, out_path))
+    return list(by_image.items()), skipped
 
-        x, y, w, h = map(int, ann["bbox"])
-        crop = img[y:y+h, x:x+w]
-        if crop.size == 0:
-            print(f"  [!] Empty crop for ann {ann['id']}, skipping")
-            continue
 
-        # resize & save
-        out = cv2.resize(crop, IMG_SIZE, interpolation=cv2.INTER_AREA)
-        base = os.path.splitext(fname)[0]
-        out_name = f"{base}_ann{ann['id']}.jpg"
-        out_path = os.path.join(NEW_DATA_ROOT, split, cls_name, out_name)
-        cv2.imwrite(out_path, out)
+def main():
+    ap = argparse.ArgumentParser(description="Crop COCO die annotations into class folders")
+    ap.add_argument("--data", default=DATA_ROOT)
+    ap.add_argument("--out", default=NEW_DATA_ROOT)
+    ap.add_argument("--splits", nargs="+", default=SPLITS)
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--force", action="store_true",
+                    help="rewrite crops that already exist")
+    args = ap.parse_args()
+
+    # make sure output dirs exist
+    for split in args.splits:
+        for cls in CLASS_MAP.values():
+            os.makedirs(os.path.join(args.out, split, cls), exist_ok=True)
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers),
+                             initializer=_init_worker) as pool:
+        for split in args.splits:
+            jobs, skipped = plan_split(split, args.data, args.out, args.force)
+            # images with the most crops first keeps the pool busy at the tail
+            jobs.sort(key=lambda j: len(j[1]), reverse=True)
+            saved = 0
+            chunk = max(1, len(jobs) // (args.workers * 8))
+            for n, warnings in pool.map(extract_image, jobs, chunksize=chunk):
+                saved += n
+                for w in warnings:
+                    print(f"  [!] {w}")
+            print(f"  ✅ {split}: {saved} crops from {len(jobs)} images "
+                  f"({skipped} already present) → '{args.out}/{split}/'")
+
+    print(f"🎉 All done in {time.perf_counter() - t0:.1f}s")
 
-    print(f"  ✅ Saved crops for split '{split}' into '{NEW_DATA_ROOT}/{split}/'")
 
-print("🎉 All done!")
+if __name__ == "__main__":
+    main()
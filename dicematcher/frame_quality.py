@@ -0,0 +1,106 @@
+"""
+frame_quality.py
+────────────────
+Cheap "is this frame worth classifying?" check, run on a ~160 px grey
+thumbnail before any classifier work.
+
+    gate = QualityGate()
+    v = gate.check(downscale(gray), rig="rig1", roi=(x, y, w, h))   # roi optional
+    if not v.ok:
+        print(v.reasons)               # e.g. ['blurry (sharpness 6.1 < 15)']
+
+Metrics (all on the thumbnail):
+  sharpness   variance of the 4-neighbour Laplacian – low when the die was
+              still spinning or the camera is out of focus.  Taken inside
+              `roi` (the die's box, thumbnail px) when the caller has one,
+              so a sharp tray can't hide a blurred die
+  motion      fraction of pixels that changed by > DIFF_LEVEL since this
+              rig's previous frame.  Only the die moves between rolls, so
+              a new roll stays under MAX_MOTION; a shaking tray, moving
+              camera or flicker does not
+  brightness  mean grey level, and the fraction of clipped pixels
+
+numpy only, so the roll server (Pillow, no OpenCV) uses it as well:
+decode with `img.draft("L", …)` at 1/8 scale and pass the array.
+Thresholds depend on the rig's lighting; check a few good frames with
+measure() before tightening them.
+"""
+
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+WIDTH         = 160          # px the metrics are computed at
+MIN_SHARPNESS = 15.0         # Laplacian variance, grey levels²
+MAX_MOTION    = 0.25         # changed-pixel fraction vs. the previous frame
+DIFF_LEVEL    = 25           # grey levels that count as "changed"
+EXPOSURE      = (40, 215)    # acceptable mean brightness
+MAX_CLIPPED   = 0.20         # fraction of pixels ≤ 5 or ≥ 250
+
+Verdict = namedtuple("Verdict", "ok reasons metrics")
+
+
+def downscale(gray, width=WIDTH):
+    """Block-mean a 2-D uint8 image down to about `width` px wide."""
+    f = max(1, gray.shape[1] // width)
+    if f == 1:
+        return np.asarray(gray, dtype=np.float32)
+    h, w = gray.shape[0] // f * f, gray.shape[1] // f * f
+    g = np.asarray(gray[:h, :w], dtype=np.float32)
+    return g.reshape(h // f, f, w // f, f).mean(axis=(1, 3))
+
+
+def _laplacian_var(s):
+    lap = s[1:-1, :-2] + s[1:-1, 2:] + s[:-2, 1:-1] + s[2:, 1:-1] - 4 * s[1:-1, 1:-1]
+    return float(lap.var())
+
+
+def measure(small, prev=None, roi=None):
+    """Metrics dict for one thumbnail (float32, from downscale()).
+
+    `roi` is an optional (x, y, w, h) box in thumbnail pixels that the
+    sharpness is taken over; the other metrics always cover the frame."""
+    s = np.asarray(small, dtype=np.float32)
+    region = s
+    if roi is not None:
+        x, y, w, h = (int(round(v)) for v in roi)
+        x, y = max(0, x), max(0, y)
+        if min(s[y:y + h, x:x + w].shape) >= 3:
+            region = s[y:y + h, x:x + w]
+    m = {"sharpness":  _laplacian_var(region),
+         "brightness": float(s.mean()),
+         "clipped":    float(((s <= 5) | (s >= 250)).mean()),
+         "motion":     None}
+    if prev is not None and prev.shape == s.shape:
+        m["motion"] = float((np.abs(s - prev) > DIFF_LEVEL).mean())
+    return m
+
+
+class QualityGate:
+    """Thresholds + each rig's previous thumbnail.  Thread-safe."""
+
+    def __init__(self, min_sharpness=MIN_SHARPNESS, max_motion=MAX_MOTION,
+                 exposure=EXPOSURE, max_clipped=MAX_CLIPPED):
+        self.min_sharpness, self.max_motion = min_sharpness, max_motion
+        self.exposure, self.max_clipped = exposure, max_clipped
+        self._prev = {}
+        self._lock = threading.Lock()
+
+    def check(self, small, rig="default", roi=None):
+        small = np.asarray(small, dtype=np.float32)
+        with self._lock:
+            prev, self._prev[rig] = self._prev.get(rig), small
+        m = measure(small, prev, roi)
+        reasons = []
+        if m["sharpness"] < self.min_sharpness:
+            reasons.append(f"blurry (sharpness {m['sharpness']:.1f} < {self.min_sharpness:g})")
+        if m["motion"] is not None and m["motion"] > self.max_motion:
+            reasons.append(f"moving ({m['motion']:.0%} of frame changed)")
+        lo, hi = self.exposure
+        if not lo <= m["brightness"] <= hi:
+            reasons.append(f"{'under' if m['brightness'] < lo else 'over'}exposed "
+                           f"(mean {m['brightness']:.0f})")
+        if m["clipped"] > self.max_clipped:
+            reasons.append(f"clipped ({m['clipped']:.0%} of pixels)")
+        return Verdict(not reasons, reasons, m)
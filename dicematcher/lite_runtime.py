@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+lite_runtime.py
+───────────────
+Load a dice classifier without importing full TensorFlow.
+
+    from lite_runtime import load_model
+    model = load_model("exported/dice_cnn_custom_978.int8.tflite")
+    probs = model.predict_on_batch(batch)       # same call as a Keras model
+
+The backend is picked by file extension:
+
+  .tflite   tflite_runtime / ai_edge_litert interpreter (falls back to
+            tf.lite when only TensorFlow is installed)
+  .onnx     onnxruntime
+  .h5/.keras  tf.keras.models.load_model, imported only in that case
+
+Every wrapper exposes the bits of the Keras model API the detect scripts
+and batch_infer use: `predict_on_batch`, `predict(x, verbose=0)`,
+`input_shape` and `output_shape` (batch dimension None).
+
+Artifacts come from export_model.py; they take the same float32 input the
+.h5 they were exported from takes (quantisation happens inside).
+
+When DICEMATCHER_MODEL_SERVER is set and model_server.py is running there,
+load_model hands back a RemoteModel instead: the daemon keeps the model
+warm and batches requests from every script that uses it.
+"""
+
+import os
+
+import numpy as np
+
+THREADS      = os.cpu_count() or 1
+MODEL_SERVER = os.environ.get("DICEMATCHER_MODEL_SERVER")   # see model_server.py
+
+
+def _tflite_interpreter():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf           # last resort: the heavy import
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    def __init__(self, path, num_threads=THREADS):
+        self.path = path
+        self._it = _tflite_interpreter()(model_path=path, num_threads=num_threads)
+        self._it.allocate_tensors()
+        self._in = self._it.get_input_details()[0]
+        self._out = self._it.get_output_details()[0]
+        self._batch = int(self._in["shape"][0])
+        self.input_shape = (None, *map(int, self._in["shape"][1:]))
+        self.output_shape = (None, *map(int, self._out["shape"][1:]))
+
+    def _quantize(self, x):
+        dtype = self._in["dtype"]
+        if dtype == np.float32:
+            return x.astype(np.float32, copy=False)
+        scale, zero = self._in["quantization"]           # int8 / uint8 input
+        info = np.iinfo(dtype)
+        return np.clip(np.round(x / scale + zero), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, y):
+        if self._out["dtype"] == np.float32:
+            return y
+        scale, zero = self._out["quantization"]
+        return (y.astype(np.float32) - zero) * scale
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x)
+        if x.shape[0] != self._batch:
+            # resizing reallocates – batch_infer keeps the batch size fixed
+            self._it.resize_tensor_input(self._in["index"], list(x.shape))
+            self._it.allocate_tensors()
+            self._in = self._it.get_input_details()[0]
+            self._out = self._it.get_output_details()[0]
+            self._batch = x.shape[0]
+        self._it.set_tensor(self._in["index"], self._quantize(x))
+        self._it.invoke()
+        return self._dequantize(self._it.get_tensor(self._out["index"]))
+
+    def predict(self, x, verbose=0, batch_size=None):
+        return self.predict_on_batch(x)
+
+
+class ONNXModel:
+    def __init__(self, path, num_threads=THREADS):
+        import onnxruntime as ort
+        self.path = path
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = num_threads
+        self._sess = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        inp, out = self._sess.get_inputs()[0], self._sess.get_outputs()[0]
+        self._in_name = inp.name
+        self._in_type = np.float16 if inp.type == "tensor(float16)" else np.float32
+        self.input_shape = (None, *[d if isinstance(d, int) else None for d in inp.shape[1:]])
+        self.output_shape = (None, *[d if isinstance(d, int) else None for d in out.shape[1:]])
+
+    def predict_on_batch(self, x):
+        x = np.asarray(x, dtype=self._in_type)
+        y = self._sess.run(None, {self._in_name: x})[0]
+        return y.astype(np.float32, copy=False)
+
+    def predict(self, x, verbose=0, batch_size=None):
+        return self.predict_on_batch(x)
+
+
+def load_model(path, num_threads=THREADS, server=MODEL_SERVER):
+    """Keras-compatible model object for a .tflite, .onnx or .h5/.keras file."""
+    if server:
+        from model_server import RemoteModel
+        try:
+            return RemoteModel(path, server)
+        except OSError as ex:              # daemon not running – load it here
+            print(f"⚠️ model server {server} unavailable ({ex}); loading {path} locally")
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".tflite":
+        return TFLiteModel(path, num_threads)
+    if ext == ".onnx":
+        return ONNXModel(path, num_threads)
+    import tensorflow as tf
+    return tf.keras.models.load_model(path)
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+model_server.py
+───────────────
+Keep dice classifiers warm in one long-running process and serve batched
+predictions to the detect scripts over a Unix socket (or localhost TCP).
+
+    python model_server.py                           # listen on the default socket
+    python model_server.py --preload dice_cnn_custom_978.h5 dice_mobilenetv2.h5
+    python model_server.py --listen 127.0.0.1:8765
+
+    DICEMATCHER_MODEL_SERVER=default python detect_audit.py
+    python model_server.py --status | --stop
+
+With DICEMATCHER_MODEL_SERVER set (a socket path, host:port, or "default"),
+lite_runtime.load_model returns a RemoteModel instead of loading the file:
+same `predict_on_batch` / `predict` / `input_shape` / `output_shape`, but
+no TensorFlow import and no load_model cost in the script.  If the daemon
+isn't running the script loads the model itself, as before.
+
+Models are keyed by absolute path and mtime: the first request loads one,
+a newer file on disk is picked up on the next request (in-flight work
+finishes on the old copy).  Requests for the same model that arrive within
+WINDOW_MS of each other – from any number of client processes – are
+concatenated into one predict call of up to MAX_BATCH rows on that model's
+inference thread, then split back per caller.
+
+Wire format, both directions: 4-byte big-endian header length, a JSON
+header, then `nbytes` of raw array data (C order, dtype/shape in header).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ENV_VAR        = "DICEMATCHER_MODEL_SERVER"
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"dicematcher-{os.getuid()}.sock")
+WINDOW_MS      = 5       # how long the first request waits for company
+MAX_BATCH      = 64      # rows per coalesced predict call
+_HEADER        = struct.Struct(">I")
+
+
+def resolve_address(value=None):
+    """"default" / socket path / host:port → ("unix", path) | ("tcp", (host, port))."""
+    value = (value or "default").strip()
+    if value == "default":
+        return "unix", DEFAULT_SOCKET
+    if value.startswith("unix:"):
+        return "unix", value[5:]
+    host, sep, port = value.rpartition(":")
+    if sep and port.isdigit() and "/" not in value:
+        return "tcp", (host or "127.0.0.1", int(port))
+    return "unix", value
+
+
+# ─── wire format ─────────────────────────────────────────────────────────────
+
+def _pack(header, array=None):
+    payload = b""
+    if array is not None:
+        array = np.ascontiguousarray(array)
+        header = dict(header, shape=list(array.shape), dtype=array.dtype.str,
+                      nbytes=array.nbytes)
+        payload = array.tobytes()
+    head = json.dumps(header).encode()
+    return _HEADER.pack(len(head)) + head + payload
+
+
+def _unpack(header, payload):
+    if not header.get("nbytes"):
+        return None
+    return np.frombuffer(payload, dtype=np.dtype(header["dtype"])).reshape(header["shape"])
+
+
+async def _read_message(reader):
+    (n,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    header = json.loads(await reader.readexactly(n))
+    payload = await reader.readexactly(header.get("nbytes", 0))
+    return header, _unpack(header, payload)
+
+
+# ─── server side ─────────────────────────────────────────────────────────────
+
+class Retired(Exception):
+    """The ServedModel was replaced; resolve the path again."""
+
+
+class ServedModel:
+    """One loaded model file: its own inference thread and request queue."""
+
+    def __init__(self, path, mtime_ns, window, max_batch):
+        self.path, self.mtime_ns = path, mtime_ns
+        self.window, self.max_batch = window, max_batch
+        self.model = None
+        self.calls = self.rows = self.requests = 0
+        self.loaded_at = None
+        # Keras / TFLite models aren't meant to be driven from several threads
+        self._infer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infer")
+        self._queue = asyncio.Queue()
+        self._task = None
+        self.retired = False
+
+    def _load(self):
+        from lite_runtime import load_model
+        model = load_model(self.path, server=None)          # never ourselves
+        shape = [1] + [d or 1 for d in model.input_shape[1:]]
+        model.predict_on_batch(np.zeros(shape, "float32"))  # warm-up
+        return model
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        t = time.perf_counter()
+        self.model = await loop.run_in_executor(self._infer, self._load)
+        self.loaded_at = time.time()
+        print(f"🧠 loaded {self.path} in {time.perf_counter() - t:.1f}s "
+              f"{tuple(self.model.input_shape)} → {tuple(self.model.output_shape)}")
+        self._task = asyncio.create_task(self._batcher())
+
+    def retire(self):
+        """Finish what's queued, then release the thread (file changed on disk)."""
+        self.retired = True
+        self._queue.put_nowait(None)
+
+    async def predict(self, x):
+        if self.retired:
+            raise Retired(self.path)
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((x, fut))
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        first = await self._queue.get()
+        if first is None:
+            return None
+        items, rows = [first], len(first[0])
+        deadline = loop.time() + self.window
+        while rows < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                self._queue.put_nowait(None)                # stop after this batch
+                break
+            items.append(item)
+            rows += len(item[0])
+        return items
+
+    async def _batcher(self):
+        try:
+            await self._serve_batches()
+        finally:
+            # anything still queued would wait forever: send it back to get()
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None and not item[1].done():
+                    item[1].set_exception(Retired(self.path))
+            self._infer.shutdown(wait=False)
+
+    async def _serve_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = await self._collect()
+            if items is None:
+                break
+            # callers with the same sample shape share one predict call
+            groups = {}
+            for x, fut in items:
+                groups.setdefault((x.shape[1:], x.dtype.str), []).append((x, fut))
+            for group in groups.values():
+                batch = np.concatenate([x for x, _ in group]) if len(group) > 1 else group[0][0]
+                try:
+                    preds = await loop.run_in_executor(
+                        self._infer, self.model.predict_on_batch, batch)
+                except Exception as ex:
+                    for _, fut in group:
+                        if not fut.done():
+                            fut.set_exception(ex)
+                    continue
+                preds = np.asarray(preds, dtype=np.float32)
+                self.calls += 1
+                self.rows += len(batch)
+                self.requests += len(group)
+                start = 0
+                for x, fut in group:
+                    if not fut.done():
+                        fut.set_result(preds[start:start + len(x)])
+                    start += len(x)
+
+    def status(self):
+        return {"path": self.path, "mtime_ns": self.mtime_ns,
+                "input_shape": list(self.model.input_shape),
+                "output_shape": list(self.model.output_shape),
+                "requests": self.requests, "calls": self.calls, "rows": self.rows,
+                "rows_per_call": round(self.rows / self.calls, 2) if self.calls else None,
+                "queued": self._queue.qsize()}
+
+
+def _clear_stale_socket(path):
+    """Remove a socket left by a dead server; refuse if one still answers."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)                      # nobody listening: stale
+        return
+    except FileNotFoundError:
+        return
+    finally:
+        probe.close()
+    raise SystemExit(f"❌ a model server is already listening on {path} "
+                     f"(python model_server.py --stop --listen {path})")
+
+
+class ModelServer:
+    def __init__(self, window_ms=WINDOW_MS, max_batch=MAX_BATCH):
+        self.window, self.max_batch = window_ms / 1000.0, max_batch
+        self.models = {}                    # abs path → ServedModel (current mtime)
+        self._loading = {}                  # (path, mtime_ns) → Task
+        self.started_at = time.time()
+        self._clients = set()               # open connections, closed on shutdown
+        self._stop = None
+
+    async def get(self, path):
+        path = os.path.abspath(path)
+        mtime = os.stat(path).st_mtime_ns    # FileNotFoundError → client error
+        served = self.models.get(path)
+        if served is not None and served.mtime_ns == mtime:
+            return served
+        key = (path, mtime)
+        task = self._loading.get(key)
+        if task is None:                     # concurrent first requests load once
+            task = self._loading[key] = asyncio.create_task(self._load(path, mtime))
+        return await task
+
+    async def _load(self, path, mtime):
+        try:
+            served = ServedModel(path, mtime, self.window, self.max_batch)
+            await served.start()
+            old = self.models.get(path)
+            if old is not None and old.mtime_ns > mtime:
+                served.retire()              # a newer file finished loading first
+                return old
+            self.models[path] = served
+            if old is not None:
+                print(f"♻️ {path} changed on disk – reloaded")
+                old.retire()
+            return served
+        finally:
+            self._loading.pop((path, mtime), None)
+
+    async def handle(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while True:
+                try:
+                    header, x = await _read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                try:
+                    reply, y = await self.dispatch(header, x)
+                except Exception as ex:
+                    reply, y = {"error": f"{type(ex).__name__}: {ex}"}, None
+                writer.write(_pack(reply, y))
+                await writer.drain()
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def dispatch(self, header, x):
+        op = header.get("op")
+        if op == "predict":
+            if x is None or x.ndim < 2:
+                raise ValueError("predict needs a batch array")
+            while True:
+                served = await self.get(header["model"])
+                try:
+                    return {"ok": True}, await served.predict(x)
+                except Retired:
+                    continue                 # reloaded meanwhile: use the new one
+        if op == "load":
+            served = await self.get(header["model"])
+            return {"ok": True, "input_shape": list(served.model.input_shape),
+                    "output_shape": list(served.model.output_shape)}, None
+        if op == "status":
+            return {"ok": True, "pid": os.getpid(),
+                    "uptime_s": round(time.time() - self.started_at, 1),
+                    "models": [m.status() for m in self.models.values()]}, None
+        if op == "shutdown":
+            self._stop.set()
+            return {"ok": True}, None
+        raise ValueError(f"unknown op {op!r}")
+
+    async def serve(self, address, preload=()):
+        self._stop = asyncio.Event()
+        kind, addr = resolve_address(address)
+        if kind == "unix":
+            if os.path.exists(addr):
+                _clear_stale_socket(addr)
+            server = await asyncio.start_unix_server(self.handle, path=addr)
+        else:
+            server = await asyncio.start_server(self.handle, *addr)
+        for path in preload:
+            await self.get(path)
+        print(f"🛰️ model server listening on {addr} (window {self.window * 1000:.0f} ms, "
+              f"max batch {self.max_batch})")
+        try:
+            async with server:
+                await self._stop.wait()
+                for writer in list(self._clients):
+                    writer.close()           # idle clients see EOF, handlers return
+                await asyncio.sleep(0.1)
+        finally:
+            if kind == "unix" and os.path.exists(addr):
+                os.unlink(addr)
+
+
+# ─── client side ─────────────────────────────────────────────────────────────
+
+class Connection:
+    """Blocking request/response over one socket; safe to share between threads."""
+
+    def __init__(self, address=None, timeout=None):
+        kind, addr = resolve_address(address)
+        family = socket.AF_UNIX if kind == "unix" else socket.AF_INET
+        self._sock = socket.socket(family, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(addr)
+        self._file = self._sock.makefile("rb")
+        self._lock = threading.Lock()
+
+    def request(self, header, array=None):
+        with self._lock:
+            self._sock.sendall(_pack(header, array))
+            raw = self._file.read(_HEADER.size)
+            if len(raw) < _HEADER.size:
+                raise ConnectionError("model server closed the connection")
+            reply = json.loads(self._file.read(_HEADER.unpack(raw)[0]))
+            payload = self._file.read(reply.get("nbytes", 0))
+        if "error" in reply:
+            raise RuntimeError(f"model server: {reply['error']}")
+        return reply, _unpack(reply, payload)
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+class RemoteModel:
+    """Keras-style model whose predictions run in the model server."""
+
+    def __init__(self, path, address=None):
+        self.path = os.path.abspath(path)
+        self._conn = Connection(address)
+        reply, _ = self._conn.request({"op": "load", "model": self.path})
+        self.input_shape = tuple(reply["input_shape"])
+        self.output_shape = tuple(reply["output_shape"])
+
+    def predict_on_batch(self, x):
+        _, y = self._conn.request({"op": "predict", "model": self.path},
+                                  np.asarray(x, dtype=np.float32))
+        return y
+
+    def predict(self, x, verbose=0, batch_size=None):
+        return self.predict_on_batch(x)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve dice classifiers to the detect scripts")
+    ap.add_argument("--listen", default=os.environ.get(ENV_VAR, "default"),
+                    help="socket path, host:port or 'default' (%(default)s)")
+    ap.add_argument("--preload", nargs="*", default=[], help="models to load at startup")
+    ap.add_argument("--window-ms", type=float, default=WINDOW_MS)
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    ap.add_argument("--status", action="store_true", help="print a running server's state")
+    ap.add_argument("--stop", action="store_true", help="shut a running server down")
+    args = ap.parse_args()
+
+    if args.status or args.stop:
+        conn = Connection(args.listen, timeout=10)
+        reply, _ = conn.request({"op": "status" if args.status else "shutdown"})
+        print(json.dumps(reply, indent=2))
+        return
+
+    server = ModelServer(args.window_ms, args.max_batch)
+    try:
+        asyncio.run(server.serve(args.listen, args.preload))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+ncc_matcher.py
+──────────────
+All-templates normalized cross-correlation in one BLAS call.
+
+`detect.py` matches a 256×256 query against 256×256 templates, so every
+`cv2.matchTemplate(..., TM_CCOEFF_NORMED)` call returns a single number:
+
+    score = Σ (T - T̄)(I - Ī) / sqrt(Σ (T - T̄)² · Σ (I - Ī)²)
+
+That is a dot product of two zero-mean, unit-norm vectors.  NCCMatcher
+pre-normalizes every template once and stacks them into one contiguous
+(K, H·W) float32 matrix; scoring a query is then one matrix–vector product,
+and a batch of queries one matrix–matrix product.
+
+Row i of the matrix carries `side[i]`, `angle[i]` and `base[i]` (index of
+the source image within the side), so a winning row maps straight back to
+the label detect.py prints.
+"""
+
+import numpy as np
+
+EPS = 1e-12
+
+
+def _normalize_rows(flat):
+    """Zero-mean, unit-norm rows (float64 math, float32 result)."""
+    x = flat.astype("float64")
+    x -= x.mean(axis=1, keepdims=True)
+    norm = np.sqrt((x * x).sum(axis=1, keepdims=True))
+    # flat (constant) images have no defined correlation → score 0
+    x /= np.where(norm > EPS, norm, np.inf)
+    return x.astype("float32")
+
+
+class NCCMatcher:
+    """Stacked, pre-normalized templates scored with a single GEMV/GEMM."""
+
+    def __init__(self, templates, sides, angles, bases=None, chunk=256):
+        templates = np.asarray(templates)
+        if templates.ndim != 3:
+            raise ValueError("templates must be (K, H, W) grayscale")
+        K, H, W = templates.shape
+        self.shape = (H, W)
+        self.side  = np.asarray(sides)
+        self.angle = np.asarray(angles)
+        self.base  = np.zeros(K, dtype=int) if bases is None else np.asarray(bases)
+        if not (len(self.side) == len(self.angle) == len(self.base) == K):
+            raise ValueError("sides/angles/bases must have one entry per template")
+
+        # normalize in chunks so float64 scratch stays small
+        self.matrix = np.empty((K, H * W), dtype="float32")
+        for i in range(0, K, chunk):
+            self.matrix[i:i + chunk] = _normalize_rows(
+                templates[i:i + chunk].reshape(-1, H * W))
+
+    @classmethod
+    def from_side_lists(cls, template_data, angles):
+        """Build from {side: [rot_0, rot_1, …]} as written by pregenerate.py.
+
+        Each side list is `len(angles)` rotations per base image, base images
+        back to back (the order pregenerate.py appends them in).
+        """
+        tmpls, sides, angs, bases = [], [], [], []
+        n = len(angles)
+        for side, rots in template_data.items():
+            for i, t in enumerate(rots):
+                tmpls.append(t)
+                sides.append(side)
+                angs.append(angles[i % n])
+                bases.append(i // n)
+        return cls(np.stack(tmpls), sides, angs, bases)
+
+    @classmethod
+    def from_matrix(cls, matrix, shape, sides, angles, bases=None):
+        """Wrap an already-normalized (K, H·W) matrix (e.g. a memmap)."""
+        self = cls.__new__(cls)
+        self.shape  = tuple(shape)
+        self.matrix = matrix
+        self.side   = np.asarray(sides)
+        self.angle  = np.asarray(angles)
+        self.base   = np.zeros(len(matrix), dtype=int) if bases is None else np.asarray(bases)
+        return self
+
+    def __len__(self):
+        return len(self.matrix)
+
+    # ─── scoring ─────────────────────────────────────────────────
+    def _queries(self, grays):
+        q = np.asarray(grays)
+        if q.shape[-2:] != self.shape:
+            raise ValueError(f"query must be {self.shape}, got {q.shape[-2:]}")
+        return _normalize_rows(q.reshape(-1, self.matrix.shape[1]))
+
+    def score(self, gray):
+        """(K,) TM_CCOEFF_NORMED scores of one query against every template."""
+        return self.matrix @ self._queries(gray)[0]
+
+    def score_batch(self, grays):
+        """(B, K) scores for a (B, H, W) stack of queries."""
+        return self._queries(grays) @ self.matrix.T
+
+    def best(self, gray):
+        """(side, angle, score) of the best template for one query."""
+        return self._pick(self.score(gray))
+
+    def best_batch(self, grays):
+        return [self._pick(s) for s in self.score_batch(grays)]
+
+    def _pick(self, scores):
+        i = int(np.argmax(scores))
+        return str(self.side[i]), int(self.angle[i]), float(scores[i])
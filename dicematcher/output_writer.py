@@ -0,0 +1,107 @@
+"""
+output_writer.py
+────────────────
+Annotated-image output off the inference loop, for the detect scripts.
+
+    from output_writer import OutputWriter
+
+    writer = OutputWriter(OUTPUT_MODE, conf_thresh=CONF_THRESH)
+    for path, img, preds in engine.run(paths):
+        ...
+        if writer.wants(is_correct, prob):
+            writer.submit(out_path, draw_overlay, img, label, color)
+    writer.close()                       # waits for the last files
+
+`submit` hands the drawing function and its arguments to a small thread
+pool: the overlay, JPEG encode and file write all happen there (cv2
+releases the GIL for those), so the main loop goes straight back to the
+next batch.  At most MAX_PENDING images are in flight; past that `submit`
+blocks, so a slow disk throttles the run instead of filling memory.  The
+arrays passed to `submit` must not be modified afterwards; the
+BatchPredictor hands out a fresh image per result, so that holds.
+On a single-core machine there is no spare core to hide the work on, so
+the writer runs inline (workers=0) rather than adding thread switches.
+
+Modes (OUTPUT_MODE in the scripts):
+  "all"     every image
+  "errors"  incorrect, or confidence below conf_thresh (what detect_audit keeps)
+  "none"    nothing; only the summary
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from stage_timer import stage
+
+MODES       = ("all", "errors", "none")
+WORKERS     = min(2, (os.cpu_count() or 1) - 1)   # encode + write threads (0 = inline)
+MAX_PENDING = 64         # images queued or being written
+
+
+class OutputWriter:
+    def __init__(self, mode="all", conf_thresh=0.0, workers=WORKERS, max_pending=MAX_PENDING):
+        if mode not in MODES:
+            raise ValueError(f"output mode must be one of {MODES}, got {mode!r}")
+        self.mode = mode
+        self.conf_thresh = conf_thresh
+        self.written = self.failed = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = (ThreadPoolExecutor(max_workers=workers, thread_name_prefix="writer")
+                      if mode != "none" and workers > 0 else None)
+
+    def wants(self, correct=False, conf=0.0):
+        """Should this result be written under the current mode?"""
+        if self.mode == "all":
+            return True
+        if self.mode == "errors":
+            return not correct or conf < self.conf_thresh
+        return False
+
+    def submit(self, out_path, draw, *args):
+        """Queue `cv2.imwrite(out_path, draw(*args))`; blocks while the queue is full.
+
+        draw=None writes args[0] as it is (e.g. a raw crop)."""
+        if self.mode == "none":
+            return
+        if self._pool is None:
+            self._write(out_path, draw, args)
+            return
+        with stage("write_wait"):
+            self._slots.acquire()
+        fut = self._pool.submit(self._write, out_path, draw, args)
+        fut.add_done_callback(lambda _: self._slots.release())
+
+    def _write(self, out_path, draw, args):
+        why = ""
+        try:
+            if draw is None:
+                img = args[0]
+            else:
+                with stage("annotate"):
+                    img = draw(*args)
+            with stage("write"):
+                ok = cv2.imwrite(out_path, img)
+        except Exception as ex:               # bad overlay args, unknown extension …
+            ok, why = False, f" ({ex})"
+        with self._lock:
+            if ok:
+                self.written += 1
+            else:
+                self.failed += 1
+                print(f"⚠️ could not write {out_path}{why}")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        if self.failed:
+            print(f"⚠️ {self.failed} output image(s) failed to write")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -2,66 +2,177 @@
 # precompute_templates.py
 # —————————————————————————————————————————
 # Reads all template images under templates/side_XX/,
-# generates 10°-increment rotations, and pickles each side
-# into its own file: side_01.pkl, side_02.pkl, … side_06.pkl
+# generates 10°-increment rotations, and writes them all into one
+# memory-mapped template store (see template_store.py):
+# template_data/templates.<id>.npy + templates.json
+#
+# Incremental: template_data/manifest.json remembers the sha256 of every
+# base image and the ANGLE_STEP it was rotated with, so only new or
+# changed images are rotated again (across a process pool).
+#
+#   python pregenerate.py            # asks per side, like before
+#   python pregenerate.py --yes      # headless: all sides, no prompts
+#   python pregenerate.py --yes --full --workers 4
 
+import argparse
 import cv2
 import glob
+import hashlib
+import json
 import os
-import pickle
+from concurrent.futures import ProcessPoolExecutor
+from run_config import apply_overrides
+from template_store import INDEX_NAME, open_store, write_store
 
 # CONFIG
 TEMPLATE_ROOT = "templates"     # contains side_01, side_02, … side_06
 ANGLE_STEP    = 10              # degrees between rotations
-OUTPUT_DIR    = "template_data" # where to write individual .pkl files
+OUTPUT_DIR    = "template_data" # where to write the template store
+MANIFEST_NAME = "manifest.json" # source hashes + rotation params
+WORKERS       = os.cpu_count() or 1
+apply_overrides(globals())
 
-# ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-print(f"🔄 Precompute templates: will rotate every {ANGLE_STEP}° and save per-side .pkl files\n")
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-# for each side folder, e.g. templates/side_01
-for side_dir in sorted(glob.glob(os.path.join(TEMPLATE_ROOT, "side_*"))):
-    label = os.path.basename(side_dir)   # "side_01", …
-    base_paths = sorted(glob.glob(os.path.join(side_dir, "*.*")))
 
-    # confirm with user
-    resp = input(f"Process templates for '{label}'? [Y/n]: ").strip().lower()
-    if resp in ("n", "no"):
-        print(f"⏭ Skipping {label}\n")
-        continue
+def rotate_all(img_path, angle_step):
+    """All rotations of one base image (runs in a pool worker)."""
+    base = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    if base is None:
+        return None
+    h, w = base.shape
+    cx, cy = w // 2, h // 2
+    rots = []
+    for angle in range(0, 360, angle_step):
+        M = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
+        rots.append(cv2.warpAffine(base, M, (w, h)))
+    return rots
 
-    print(f"\n✅ Processing '{label}': found {len(base_paths)} base image(s):")
-    for p in base_paths:
-        print(f"   • {p}")
 
-    rotations = []
-    angles = list(range(0, 360, ANGLE_STEP))
-    print(f"\n➡ Generating {len(angles)} rotations per template:")
+def load_previous(out_dir, angle_step):
+    """(store, manifest) from the last run, or (None, {}) if unusable."""
+    if not os.path.exists(os.path.join(out_dir, INDEX_NAME)):
+        return None, {}
+    store = open_store(out_dir)
+    if store.angle_step != angle_step:
+        print(f"ℹ ANGLE_STEP changed ({store.angle_step}° → {angle_step}°): full rebuild")
+        return None, {}
+    manifest = {}
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            m = json.load(f)
+        if m.get("angle_step") == angle_step:
+            manifest = m.get("sources", {})
+    return store, manifest
 
-    for img_path in base_paths:
-        base = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-        if base is None:
-            print(f"   [!] Could not read '{img_path}', skipping")
-            continue
 
-        h, w = base.shape
-        cx, cy = w // 2, h // 2
-        print(f"   – Rotating '{os.path.basename(img_path)}':")
+def stored_rows(store):
+    """{source: [(template, side, angle, source), …]} from a previous store."""
+    rows = {}
+    for i in range(len(store)):
+        src = str(store.source[i])
+        rows.setdefault(src, []).append(
+            (store.templates[i], str(store.side[i]), int(store.angle[i]), src))
+    return rows
 
-        for angle in angles:
-            M = cv2.getRotationMatrix2D((cx, cy), angle, 1.0)
-            rot = cv2.warpAffine(base, M, (w, h))
-            rotations.append(rot)
-        print(f"       generated {len(angles)} rotations")
 
-    print(f"\n🔢 Total rotations for {label}: {len(rotations)}")
+def main():
+    ap = argparse.ArgumentParser(description="Precompute rotated templates")
+    ap.add_argument("--yes", "-y", action="store_true",
+                    help="headless: process every side without prompting")
+    ap.add_argument("--full", action="store_true",
+                    help="ignore the manifest and rotate every image again")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--templates", default=TEMPLATE_ROOT)
+    ap.add_argument("--out", default=OUTPUT_DIR)
+    ap.add_argument("--angle-step", type=int, default=ANGLE_STEP)
+    args = ap.parse_args()
 
-    # write out this side's rotations
-    out_path = os.path.join(OUTPUT_DIR, f"{label}.pkl")
-    with open(out_path, "wb") as f:
-        pickle.dump(rotations, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.makedirs(args.out, exist_ok=True)
+    print(f"🔄 Precompute templates: will rotate every {args.angle_step}° and save a template store\n")
 
-    print(f"💾 Saved {len(rotations)} templates to '{out_path}'\n")
+    store, manifest = load_previous(args.out, args.angle_step)
+    previous = stored_rows(store) if store is not None else {}
+    if args.full:
+        manifest = {}
 
-print("🎉 Precomputation complete!")  
+    plan = []          # (side, path, sha) in output order
+    jobs = []          # paths that need rotating
+    processed = set()
+
+    # for each side folder, e.g. templates/side_01
+    for side_dir in sorted(glob.glob(os.path.join(args.templates, "side_*"))):
+        label = os.path.basename(side_dir)   # "side_01", …
+        base_paths = sorted(glob.glob(os.path.join(side_dir, "*.*")))
+
+        if not args.yes:
+            resp = input(f"Process templates for '{label}'? [Y/n]: ").strip().lower()
+            if resp in ("n", "no"):
+                print(f"⏭ Skipping {label}\n")
+                continue
+        processed.add(label)
+
+        stale = 0
+        for p in base_paths:
+            sha = file_sha256(p)
+            plan.append((label, p, sha))
+            if manifest.get(p, {}).get("sha256") != sha or p not in previous:
+                jobs.append(p)
+                stale += 1
+        print(f"✅ '{label}': {len(base_paths)} base image(s), {stale} to rotate")
+
+    # rotate new/changed base images across the pool
+    rotated = {}
+    if jobs:
+        print(f"\n➡ Rotating {len(jobs)} image(s) on {args.workers} worker(s) …")
+        with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            for p, rots in zip(jobs, pool.map(rotate_all, jobs,
+                                              [args.angle_step] * len(jobs))):
+                if rots is None:
+                    print(f"   [!] Could not read '{p}', skipping")
+                else:
+                    rotated[p] = rots
+
+    rows, new_manifest = [], {}
+    for label, p, sha in plan:
+        if p in rotated:
+            angles = range(0, 360, args.angle_step)
+            rows.extend((rot, label, a, p) for rot, a in zip(rotated[p], angles))
+        elif p in previous and p not in jobs:
+            rows.extend(previous[p])
+        else:
+            continue                         # unreadable
+        new_manifest[p] = {"sha256": sha, "side": label}
+
+    # carry over stored sides that were skipped
+    for src, src_rows in previous.items():
+        if src_rows[0][1] not in processed:
+            rows.extend(src_rows)
+            if src in manifest:
+                new_manifest[src] = manifest[src]
+    rows.sort(key=lambda r: r[1])   # stable: keeps source/angle order per side
+
+    unchanged = (store is not None and not rotated
+                 and [r[3] for r in rows] == store.source.tolist())
+    if unchanged:
+        print("\n✔ Templates up to date, nothing to write")
+    elif rows:
+        tmpls, sides, angs, sources = zip(*rows)
+        write_store(args.out, tmpls, sides, angs, sources, args.angle_step)
+        print(f"\n💾 Saved {len(rows)} templates to '{args.out}' "
+              f"({sum(len(r) for r in rotated.values())} newly rotated)")
+    with open(os.path.join(args.out, MANIFEST_NAME), "w") as f:
+        json.dump({"angle_step": args.angle_step, "sources": new_manifest}, f, indent=1)
+
+    print("🎉 Precomputation complete!")
+
+
+if __name__ == "__main__":
+    main()
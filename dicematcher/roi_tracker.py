@@ -0,0 +1,117 @@
+"""
+roi_tracker.py
+──────────────
+Search for the die near where it landed last time before scanning the
+whole frame.
+
+The rig's tray is fixed, so over a run the die only ever lands in a small
+part of the frame.  ROITracker keeps, per rig, the last HISTORY boxes it
+accepted and runs the script's own finder on their bounding rectangle
+grown by PAD die-sides.  A window result is trusted when
+
+  • the finder found something (area ≥ the script's full-frame min_area),
+  • the box doesn't touch a window edge that is inside the frame (the die
+    may continue past it), and
+  • its size is within SIZE_TOL of the previous die;
+
+otherwise the frame is searched in full, as before, and that result
+(re)seeds the window.  Blur / Canny / Otsu / morphology / findContours
+all scale with pixel count, and at UXGA the window is typically a fifth
+of the frame or less.
+
+    tracker = ROITracker(find_die)                 # find_die(img, min_area) → box | None
+    box = tracker.locate(gray, min_area, rig_of(path, RIG_PATTERN))
+
+locate() must be called in frame order per rig – "the last die" means
+nothing otherwise – so detect_crop_cnn drops to one batch_infer loader
+thread while tracking.  The counters and history are lock-guarded.
+"""
+
+import os
+import re
+import threading
+from collections import deque
+
+HISTORY  = 8      # accepted boxes per rig that shape the window
+PAD      = 0.5    # window margin around them, in die sides
+SIZE_TOL = 1.5    # accepted size change vs. the last die (×/÷)
+EDGE     = 2      # px: a box this close to an inner window edge is cut off
+
+
+def rig_of(path, pattern=None):
+    """Rig id from a file name via a regex with a `rig` group; "default" if none."""
+    if pattern:
+        m = re.search(pattern, os.path.basename(path))
+        if m:
+            return m.group("rig")
+    return "default"
+
+
+class ROITracker:
+    def __init__(self, find, history=HISTORY, pad=PAD, size_tol=SIZE_TOL):
+        self.find = find
+        self.history, self.pad, self.size_tol = history, pad, size_tol
+        self.hits = self.fallbacks = 0
+        self._boxes = {}                 # rig → deque of recent (x, y, w, h)
+        self._lock = threading.Lock()
+
+    def window(self, rig, shape):
+        """(x0, y0, x1, y1) to search first for this rig, or None."""
+        with self._lock:
+            boxes = list(self._boxes.get(rig, ()))
+        if not boxes:
+            return None
+        H, W = shape[:2]
+        side = max(max(w, h) for _, _, w, h in boxes)
+        m = int(self.pad * side)
+        x0 = max(0, min(x for x, _, _, _ in boxes) - m)
+        y0 = max(0, min(y for _, y, _, _ in boxes) - m)
+        x1 = min(W, max(x + w for x, _, w, _ in boxes) + m)
+        y1 = min(H, max(y + h for _, y, _, h in boxes) + m)
+        return x0, y0, x1, y1
+
+    def _trusted(self, box, win, shape, rig):
+        x, y, w, h = box
+        x0, y0, x1, y1 = win
+        H, W = shape[:2]
+        if (x0 > 0 and x < x0 + EDGE) or (y0 > 0 and y < y0 + EDGE) or \
+           (x1 < W and x + w > x1 - EDGE) or (y1 < H and y + h > y1 - EDGE):
+            return False
+        with self._lock:
+            recent = self._boxes.get(rig)
+            if not recent:
+                return True
+            _, _, lw, lh = recent[-1]
+        ratio = max(w, h) / max(lw, lh, 1)
+        return 1 / self.size_tol <= ratio <= self.size_tol
+
+    def _remember(self, rig, box):
+        with self._lock:
+            if box is None:
+                self._boxes.pop(rig, None)       # lost it: next frame searches in full
+            else:
+                self._boxes.setdefault(rig, deque(maxlen=self.history)).append(box)
+
+    def locate(self, img, min_area, rig="default"):
+        """Die box in full-frame coordinates, or None if the finder sees nothing."""
+        win = self.window(rig, img.shape)
+        if win is not None:
+            x0, y0, x1, y1 = win
+            box = self.find(img[y0:y1, x0:x1], min_area)
+            if box is not None:
+                box = (box[0] + x0, box[1] + y0, box[2], box[3])
+                if self._trusted(box, win, img.shape, rig):
+                    self._remember(rig, box)
+                    with self._lock:
+                        self.hits += 1
+                    return box
+        box = self.find(img, min_area)
+        self._remember(rig, box)
+        with self._lock:
+            self.fallbacks += 1
+        return box
+
+    def summary(self):
+        n = self.hits + self.fallbacks
+        return (f"ROI: {self.hits}/{n} frames located in the window, "
+                f"{self.fallbacks} full-frame searches")
@@ -0,0 +1,45 @@
+"""
+run_config.py
+─────────────
+Override a script's CONFIG constants without editing the file.
+
+Each detect_* script calls `apply_overrides(globals())` right after its
+CONFIG block.  Overrides come from the DICEMATCHER_CONFIG environment
+variable, which holds either a JSON object or the path of a .json file:
+
+    DICEMATCHER_CONFIG='{"TEST_DIR": "dataset/side_03", "BATCH_SIZE": 64}' \
+        python detect_cnn.py
+
+Only names the script already defines are replaced; lists become tuples
+where the original value was a tuple (IMG_SIZE and friends).
+"""
+
+import json
+import os
+
+ENV_VAR = "DICEMATCHER_CONFIG"
+
+
+def load_overrides(value=None):
+    value = os.environ.get(ENV_VAR, "") if value is None else value
+    value = value.strip()
+    if not value:
+        return {}
+    if not value.startswith("{"):
+        with open(value) as f:
+            return json.load(f)
+    return json.loads(value)
+
+
+def apply_overrides(namespace, overrides=None):
+    """Update upper-case names in `namespace`; returns the names applied."""
+    overrides = load_overrides() if overrides is None else overrides
+    applied = []
+    for name, value in overrides.items():
+        if not name.isupper() or name not in namespace:
+            continue               # meant for another script
+        if isinstance(namespace[name], tuple) and isinstance(value, list):
+            value = tuple(value)
+        namespace[name] = value
+        applied.append(name)
+    return applied
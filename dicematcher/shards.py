@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# shards.py
+# —————————————————————————————————————————
+# Pre-decoded dataset shards: every image of a class-folder dataset
+# (new_dataset/train, …) decoded once, resized to a fixed size and packed
+# into memory-mappable .npy files, one shard per split and resolution:
+#
+#   shards/valid_150x150/images.npy   (N, 150, 150, 3) uint8, RGB
+#                        labels.npy   (N,) int32, flow_from_directory indices
+#                        index.json   source dir, size, classes, paths
+#
+# Readers np.load(mmap_mode="r") them, so a batch is a zero-copy slice and
+# repeated evaluation sweeps cost inference, not JPEG decoding.
+#
+#   python shards.py                                   # train + valid at 150 & 256
+#   python shards.py new_dataset/valid --sizes 150
+#
+#   shard = open_shard("shards", "new_dataset/valid", (150, 150))
+#   for start, x, y in shard.batches(64): ...
+#
+# Sizes are (w, h) – the detect scripts' cv2-style IMG_SIZE – or "WxH" on
+# the command line; Keras-style (h, w) sizes must be reversed first.
+# Shard.size and index.json keep the array's own (h, w) order.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# CONFIG
+SHARD_ROOT = "shards"
+SOURCES    = ["new_dataset/train", "new_dataset/valid"]
+SIZES      = [150, 256]          # detect_audit / train_cnn_new, detect_cnn / train_cnn
+WORKERS    = os.cpu_count() or 1
+VERSION    = 1
+# what keras' DirectoryIterator accepts
+WHITE_LIST = {".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff"}
+
+
+def list_directory(directory):
+    """(paths, labels, class_indices) in flow_from_directory order."""
+    classes = sorted(d for d in os.listdir(directory)
+                     if os.path.isdir(os.path.join(directory, d)))
+    class_indices = {c: i for i, c in enumerate(classes)}
+    paths, labels = [], []
+    for c in classes:
+        for dirpath, dirnames, files in os.walk(os.path.join(directory, c)):
+            dirnames.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in WHITE_LIST:
+                    paths.append(os.path.join(dirpath, name))
+                    labels.append(class_indices[c])
+    return paths, np.asarray(labels, "int32"), class_indices
+
+
+def _wh(size):
+    return (size, size) if isinstance(size, int) else tuple(size)
+
+
+def shard_dir(root, source, size):
+    w, h = _wh(size)
+    name = os.path.basename(os.path.normpath(source))
+    return os.path.join(root, f"{name}_{w}x{h}")
+
+
+# ─── reading ──────────────────────────────────────────────────────────────────
+
+class Shard:
+    """Memory-mapped images/labels plus the index they were packed with."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        self.images  = np.load(os.path.join(path, "images.npy"), mmap_mode="r")
+        self.labels  = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+        self.paths   = self.index["paths"]
+        self.classes = self.index["classes"]          # {"side_01": 0, …}
+        self.size    = tuple(self.index["size"])      # (h, w)
+        self.source  = self.index["source"]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def batches(self, batch_size):
+        """Yield (start, images, labels) – contiguous mmap views, no copies."""
+        for s in range(0, len(self), batch_size):
+            yield s, self.images[s:s + batch_size], self.labels[s:s + batch_size]
+
+
+def open_shard(root, source, size):
+    """Shard for `source` at `size` (w, h); FileNotFoundError with a hint if missing."""
+    path = shard_dir(root, source, size)
+    if not os.path.exists(os.path.join(path, "index.json")):
+        w, h = _wh(size)
+        raise FileNotFoundError(f"no shard at {path} – run: python shards.py {source} --sizes {w}"
+                                + ("" if h == w else f"x{h}"))
+    shard = Shard(path)
+    if os.path.normpath(shard.source) != os.path.normpath(source):
+        print(f"ℹ shard {path} was packed from {shard.source}, not {source}")
+    return shard
+
+
+# ─── packing ──────────────────────────────────────────────────────────────────
+
+def _init_worker():
+    cv2.setNumThreads(1)
+
+
+def decode_sizes(job):
+    """Decode one image once, resize to every size (runs in a pool worker)."""
+    path, sizes = job
+    bgr = cv2.imread(path, cv2.IMREAD_COLOR)
+    if bgr is None:
+        return None
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    # same call the detect_* loaders make
+    return [cv2.resize(rgb, (w, h)) for w, h in sizes]
+
+
+def pack(source, root, sizes, workers):
+    sizes = [_wh(s) for s in sizes]
+    paths, labels, classes = list_directory(source)
+    print(f"→ {source}: {len(paths)} images, {len(classes)} classes")
+
+    outs, tmps = [], []
+    for w, h in sizes:
+        d = shard_dir(root, source, (w, h))
+        os.makedirs(d, exist_ok=True)
+        tmp = os.path.join(d, "images.npy.tmp")
+        tmps.append(tmp)
+        outs.append(np.lib.format.open_memmap(tmp, mode="w+", dtype=np.uint8,
+                                              shape=(len(paths), h, w, 3)))
+
+    keep = np.ones(len(paths), bool)
+    chunk = max(1, len(paths) // (max(1, workers) * 8))
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_worker) as pool:
+        jobs = ((p, sizes) for p in paths)
+        for i, imgs in enumerate(pool.map(decode_sizes, jobs, chunksize=chunk)):
+            if imgs is None:
+                print(f"  [!] Could not load {paths[i]}")
+                keep[i] = False
+                continue
+            for out, img in zip(outs, imgs):
+                out[i] = img
+
+    good = [p for p, k in zip(paths, keep) if k]
+    for (w, h), out, tmp in zip(sizes, outs, tmps):
+        d = shard_dir(root, source, (w, h))
+        if not keep.all():
+            # drop unreadable rows so images[i] ↔ paths[i] stays dense
+            out.flush()
+            packed = np.lib.format.open_memmap(tmp + "2", mode="w+", dtype=np.uint8,
+                                               shape=(len(good), h, w, 3))
+            packed[:] = out[keep]
+            packed.flush()
+            del out
+            os.replace(tmp + "2", tmp)
+        else:
+            out.flush()
+            del out
+        # index.json goes last and only ever whole: until it exists again an
+        # interrupted run reads as "no shard" (with the hint), not a torn one
+        index = os.path.join(d, "index.json")
+        if os.path.exists(index):
+            os.remove(index)
+        np.save(os.path.join(d, "labels.tmp.npy"), labels[keep])
+        os.replace(os.path.join(d, "labels.tmp.npy"), os.path.join(d, "labels.npy"))
+        os.replace(tmp, os.path.join(d, "images.npy"))
+        with open(index + ".tmp", "w") as f:
+            json.dump({"version": VERSION, "source": source, "size": [h, w],
+                       "classes": classes, "paths": good}, f)
+        os.replace(index + ".tmp", index)
+        mb = len(good) * h * w * 3 / 1e6
+        print(f"  ✅ {d}  ({len(good)} × {w}×{h}, {mb:.0f} MB)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pack class-folder datasets into mmap shards")
+    ap.add_argument("sources", nargs="*", default=SOURCES)
+    ap.add_argument("--sizes", nargs="+", default=[str(s) for s in SIZES],
+                    help="edge lengths, or WxH")
+    ap.add_argument("--out", default=SHARD_ROOT)
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    args = ap.parse_args()
+
+    sizes = [tuple(int(v) for v in s.split("x")) if "x" in s else int(s) for s in args.sizes]
+    t0 = time.perf_counter()
+    for src in args.sources:
+        pack(src, args.out, sizes, args.workers)
+    print(f"🎉 packed in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
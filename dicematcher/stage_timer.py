@@ -0,0 +1,75 @@
+"""
+stage_timer.py
+──────────────
+Opt-in per-stage timing for the recognizer scripts (used by
+bench_recognizers.py).
+
+    from stage_timer import stage, record
+
+    with stage("decode"):
+        img = cv2.imread(path)
+    ...
+    record(path, face, conf)          # one prediction
+
+Nothing is collected unless DICEMATCHER_BENCH_OUT names a file; then, at
+exit, the samples, predictions and peak RSS are written there as JSON.
+Safe to call from batch_infer's worker threads.
+"""
+
+import atexit
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+ENV_VAR = "DICEMATCHER_BENCH_OUT"
+OUT     = os.environ.get(ENV_VAR)
+ENABLED = bool(OUT)
+
+_samples     = defaultdict(list)      # stage → [(seconds, items)]
+_predictions = []                     # [(path, face, conf)]
+_t_first     = None
+
+
+@contextmanager
+def stage(name, items=1):
+    if not ENABLED:
+        yield
+        return
+    global _t_first
+    t = time.perf_counter()
+    if _t_first is None:
+        _t_first = t
+    try:
+        yield
+    finally:
+        _samples[name].append((time.perf_counter() - t, items))
+
+
+def record(path, face, conf=None):
+    """One recognizer decision (face may be None for "unrecognized")."""
+    if ENABLED:
+        _predictions.append((path, face, None if conf is None else float(conf)))
+
+
+def peak_rss_mb():
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / 1024 / 1024
+
+
+def _dump():
+    t_end = time.perf_counter()
+    with open(OUT, "w") as f:
+        json.dump({
+            "loop_seconds": (t_end - _t_first) if _t_first is not None else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": {k: v for k, v in _samples.items()},
+            "predictions": _predictions,
+        }, f)
+
+
+if ENABLED:
+    atexit.register(_dump)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+template_store.py
+─────────────────
+Compact, memory-mapped replacement for the per-side `side_XX.pkl` files.
+
+On disk (inside TEMPLATE_DIR):
+  • templates.<id>.npy  one contiguous (K, H, W) uint8 array
+  • templates.json      small columnar index – side / angle / source per
+                        row, and the name of the array file it describes
+  • templates_ncc.<id>.npy  optional (K, H·W) float32 pre-normalized NCC
+                        matrix (see ncc_matcher.py) for the array with the
+                        same <id>, so it can't be paired with another one
+
+`open_store()` maps the arrays with `np.load(mmap_mode="r")`, so opening
+is near-instant and every detector process on the box shares the same
+page-cache pages instead of unpickling its own copy.  Every write goes to
+a new array file and the index is swapped in last, so a reader always
+sees an index and the array it was written with; a running detector keeps
+its old mapping while a new store is written.
+
+Convert the old pickles once with
+
+    python template_store.py                  # template_data/side_*.pkl
+    python template_store.py other_dir/ 10    # dir, angle step
+"""
+
+import glob, json, os, pickle, sys, time
+import numpy as np
+
+# ───────── config ──────────────────────────────────────────────────
+TEMPLATE_DIR = "template_data"
+ANGLE_STEP   = 10
+
+ARRAY_NAME = "templates.npy"          # stores written before index["array"]
+INDEX_NAME = "templates.json"
+NCC_NAME   = "templates_ncc.npy"      # cache for a legacy ARRAY_NAME store
+VERSION    = 1
+
+
+class TemplateStore:
+    """Read-only view of a template store (arrays are memmaps)."""
+
+    def __init__(self, root, templates, index):
+        self.root       = root
+        self.array_name = index.get("array", ARRAY_NAME)
+        self.templates  = templates                  # (K, H, W) uint8
+        self.side       = np.asarray(index["side"])
+        self.angle      = np.asarray(index["angle"], dtype=int)
+        self.source     = np.asarray(index["source"])
+        self.angle_step = index.get("angle_step", ANGLE_STEP)
+
+    def __len__(self):
+        return len(self.templates)
+
+    @property
+    def sides(self):
+        return sorted(set(self.side.tolist()))
+
+    def side_lists(self):
+        """Legacy {side: [rot, …]} view.  Stores keep each side's rows
+        together, so the lists hold views of the memmap; a side whose rows
+        are scattered is copied."""
+        out = {}
+        for s in self.sides:
+            idx = np.flatnonzero(self.side == s)
+            if idx[-1] - idx[0] + 1 == len(idx):
+                out[s] = list(self.templates[idx[0]:idx[-1] + 1])
+            else:
+                out[s] = list(self.templates[idx])
+        return out
+
+    def matcher(self):
+        """NCCMatcher over every row, reusing the cached NCC matrix if fresh."""
+        from ncc_matcher import NCCMatcher
+        path = os.path.join(self.root, _ncc_name(self.array_name)) if self.root else None
+        K, H, W = self.templates.shape
+        bases = _base_ids(self.side, self.source)
+        if path and os.path.exists(path) and \
+                os.path.getmtime(path) >= os.path.getmtime(os.path.join(self.root, self.array_name)):
+            m = np.load(path, mmap_mode="r")
+            if m.shape == (K, H * W):
+                return NCCMatcher.from_matrix(m, (H, W), self.side, self.angle, bases)
+        matcher = NCCMatcher(self.templates, self.side, self.angle, bases)
+        if path:
+            _atomic_save(path, matcher.matrix)
+        return matcher
+
+
+def _ncc_name(array_name):
+    """templates.<id>.npy → templates_ncc.<id>.npy (legacy: NCC_NAME)."""
+    return "templates_ncc" + array_name[len("templates"):]
+
+
+def _base_ids(sides, sources):
+    """Index of each row's source image within its side (NCCMatcher.base)."""
+    seen, out = {}, []
+    for s, src in zip(sides.tolist(), sources.tolist()):
+        ids = seen.setdefault(s, {})
+        out.append(ids.setdefault(src, len(ids)))
+    return np.asarray(out)
+
+
+def _atomic_save(path, arr):
+    tmp = path + ".tmp.npy"
+    np.save(tmp, np.ascontiguousarray(arr))
+    os.replace(tmp, path)
+
+
+def write_store(root, templates, sides, angles, sources, angle_step=ANGLE_STEP):
+    """Write a store atomically; `templates` is (K, H, W) uint8 or a list.
+
+    The array goes to a fresh templates.<id>.npy and the index naming it
+    replaces the old one last; older arrays are removed afterwards."""
+    os.makedirs(root, exist_ok=True)
+    arr = np.asarray(templates, dtype=np.uint8)
+    if arr.ndim != 3 or not (len(arr) == len(sides) == len(angles) == len(sources)):
+        raise ValueError("need (K, H, W) templates and one side/angle/source per row")
+    array_name = f"templates.{time.time_ns():x}.npy"
+    index = {
+        "version":    VERSION,
+        "array":      array_name,
+        "shape":      list(arr.shape),
+        "angle_step": angle_step,
+        "side":       [str(s) for s in sides],
+        "angle":      [int(a) for a in angles],
+        "source":     [str(s) for s in sources],
+    }
+    _atomic_save(os.path.join(root, array_name), arr)
+    tmp = os.path.join(root, INDEX_NAME + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, os.path.join(root, INDEX_NAME))
+    # old arrays (still mapped by running readers until they exit) and the
+    # cached NCC matrices, which belong to old arrays
+    stale = glob.glob(os.path.join(root, "templates.*.npy")) + \
+        glob.glob(os.path.join(root, "templates_ncc.*.npy")) + \
+        [os.path.join(root, ARRAY_NAME), os.path.join(root, NCC_NAME)]
+    for path in stale:
+        if os.path.basename(path) != array_name and not path.endswith(".tmp.npy"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def open_store(root=TEMPLATE_DIR, retries=3):
+    """Memory-map a store written by write_store()."""
+    for attempt in range(retries):
+        with open(os.path.join(root, INDEX_NAME)) as f:
+            index = json.load(f)
+        if index.get("version") != VERSION:
+            raise ValueError(f"unsupported template store version {index.get('version')}")
+        name = index.get("array", ARRAY_NAME)
+        try:
+            templates = np.load(os.path.join(root, name), mmap_mode="r")
+            break
+        except FileNotFoundError:
+            if attempt == retries - 1:     # a writer replaced it under us – reread the index
+                raise
+    if list(templates.shape) != index["shape"]:
+        raise ValueError(f"{root}: index does not match {name}")
+    return TemplateStore(root, templates, index)
+
+
+def read_pickles(root=TEMPLATE_DIR, angle_step=ANGLE_STEP):
+    """Load legacy side_XX.pkl files → (templates, sides, angles, sources)."""
+    n = len(range(0, 360, angle_step))
+    tmpls, sides, angles, sources = [], [], [], []
+    for pkl_path in sorted(glob.glob(os.path.join(root, "side_*.pkl"))):
+        side = os.path.splitext(os.path.basename(pkl_path))[0]
+        with open(pkl_path, "rb") as f:
+            rots = pickle.load(f)
+        for i, rot in enumerate(rots):
+            tmpls.append(rot)
+            sides.append(side)
+            angles.append((i % n) * angle_step)
+            sources.append(f"{side}.pkl#{i // n}")   # original path is not kept
+    return tmpls, sides, angles, sources
+
+
+def load_templates(root=TEMPLATE_DIR, angle_step=ANGLE_STEP):
+    """open_store(), falling back to in-memory conversion of old pickles."""
+    if os.path.exists(os.path.join(root, INDEX_NAME)):
+        return open_store(root)
+    tmpls, sides, angles, sources = read_pickles(root, angle_step)
+    if not tmpls:
+        raise FileNotFoundError(f"no template store or side_*.pkl in {root}")
+    print(f"[!] {root}: using legacy .pkl templates – "
+          f"run `python template_store.py {root}` to convert")
+    index = {"side": sides, "angle": angles, "source": sources, "angle_step": angle_step}
+    return TemplateStore(None, np.stack(tmpls), index)
+
+
+def convert_pickles(root=TEMPLATE_DIR, angle_step=ANGLE_STEP):
+    tmpls, sides, angles, sources = read_pickles(root, angle_step)
+    if not tmpls:
+        raise SystemExit(f"[!] no side_*.pkl files in {root}")
+    write_store(root, np.stack(tmpls), sides, angles, sources, angle_step)
+    return len(tmpls)
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else TEMPLATE_DIR
+    step = int(sys.argv[2]) if len(sys.argv) > 2 else ANGLE_STEP
+    n = convert_pickles(root, step)
+    store = open_store(root)
+    print(f"💾 Wrote {n} templates {store.templates.shape[1:]} for "
+          f"{', '.join(store.sides)} → {os.path.join(root, store.array_name)}")
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# tf_pipeline.py
+# —————————————————————————————————————————
+# tf.data replacement for ImageDataGenerator.flow_from_directory.
+#
+#   • each JPEG is decoded + resized once, then cached (RAM or a cache file)
+#   • augmentation runs on whole batches as graph ops – one projective
+#     transform for rotation / shift / zoom, plus flips and brightness –
+#     with the same knobs ImageDataGenerator takes
+#   • batches are prefetched while the model trains on the previous one
+#
+# Class indices are built exactly like flow_from_directory (sorted
+# subfolder names), so models trained either way stay interchangeable.
+#
+#   train_ds, class_indices, n = make_dataset(TRAIN_DIR, IMG_SIZE, BATCH_SIZE,
+#                                             augment=AUG, training=True)
+#
+#   train_ds, class_indices, n = make_shard_dataset(open_shard("shards", TRAIN_DIR, IMG_SIZE[::-1]),
+#                                                   BATCH_SIZE, augment=AUG, training=True)
+#   (IMG_SIZE is Keras (h, w) here; shards take (w, h))
+#
+#   python tf_pipeline.py new_dataset/train --size 150 --batch 30   # epoch-time bench
+
+import argparse
+import math
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from shards import list_directory
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+# ─── augmentation ─────────────────────────────────────────────────────────────
+
+def _range(v, around=0.0):
+    """ImageDataGenerator's float-or-pair convention → (lo, hi)."""
+    if v is None:
+        return None
+    if isinstance(v, (int, float)):
+        return (around - v, around + v) if v else None
+    return tuple(float(x) for x in v)
+
+
+def _affine_batch(images, augment):
+    """Random rotation/shift/zoom for a (B, H, W, C) float batch, one op."""
+    b = tf.shape(images)[0]
+    h = tf.cast(tf.shape(images)[1], tf.float32)
+    w = tf.cast(tf.shape(images)[2], tf.float32)
+    zeros, ones = tf.zeros([b]), tf.ones([b])
+
+    rot = augment.get("rotation_range") or 0
+    theta = tf.random.uniform([b], -rot, rot) * (math.pi / 180.0)
+    ws = augment.get("width_shift_range") or 0.0
+    hs = augment.get("height_shift_range") or 0.0
+    tx = tf.random.uniform([b], -ws, ws) * w
+    ty = tf.random.uniform([b], -hs, hs) * h
+    zr = _range(augment.get("zoom_range"), around=1.0)
+    if zr:
+        # independent x/y zoom, like keras (zx, zy drawn separately)
+        zx = tf.random.uniform([b], zr[0], zr[1])
+        zy = tf.random.uniform([b], zr[0], zr[1])
+    else:
+        zx = zy = ones
+
+    # output → input mapping about the image centre: T(c)·R·Shift·Z·T(-c)
+    cos, sin = tf.cos(theta), tf.sin(theta)
+    a0, a1 = cos * zx, -sin * zy
+    b0, b1 = sin * zx, cos * zy
+    cx, cy = (w - 1) / 2.0, (h - 1) / 2.0
+    a2 = cx - a0 * cx - a1 * cy + cos * tx - sin * ty
+    b2 = cy - b0 * cx - b1 * cy + sin * tx + cos * ty
+    transforms = tf.stack([a0, a1, a2, b0, b1, b2, zeros, zeros], axis=1)
+    return tf.raw_ops.ImageProjectiveTransformV3(
+        images=images, transforms=transforms,
+        output_shape=tf.shape(images)[1:3], fill_value=0.0,
+        interpolation="BILINEAR", fill_mode="NEAREST")     # keras default fill
+
+
+def augment_batch(images, augment):
+    """Vectorised ImageDataGenerator-style augmentation on a float batch."""
+    if any(augment.get(k) for k in ("rotation_range", "width_shift_range",
+                                    "height_shift_range", "zoom_range")):
+        images = _affine_batch(images, augment)
+    b = tf.shape(images)[0]
+    if augment.get("horizontal_flip"):
+        flip = tf.random.uniform([b, 1, 1, 1]) < 0.5
+        images = tf.where(flip, tf.reverse(images, axis=[2]), images)
+    if augment.get("vertical_flip"):
+        flip = tf.random.uniform([b, 1, 1, 1]) < 0.5
+        images = tf.where(flip, tf.reverse(images, axis=[1]), images)
+    br = _range(augment.get("brightness_range"))
+    if br:
+        factor = tf.random.uniform([b, 1, 1, 1], br[0], br[1])
+        images = tf.clip_by_value(images * factor, 0.0, 255.0)
+    return images
+
+
+# ─── dataset ──────────────────────────────────────────────────────────────────
+
+def make_dataset(directory, img_size, batch_size, augment=None, training=False,
+                 preprocess=None, cache="", shuffle=None, seed=None):
+    """(dataset, class_indices, n_images) yielding (float32 images, one-hot).
+
+    img_size   (h, w), as passed to flow_from_directory's target_size
+    augment    ImageDataGenerator kwargs (rotation_range, zoom_range, …)
+    preprocess e.g. mobilenet_v2.preprocess_input, applied after augmentation
+    cache      "" keeps decoded images in RAM; a path caches them on disk
+    """
+    paths, labels, class_indices = list_directory(directory)
+    n_classes = len(class_indices)
+    shuffle = training if shuffle is None else shuffle
+    h, w = img_size
+
+    def load(path, label):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3,
+                                 expand_animations=False)
+        # flow_from_directory resizes with PIL "nearest" by default
+        img = tf.image.resize(img, (h, w), method="nearest")
+        img = tf.cast(img, tf.uint8)
+        img.set_shape((h, w, 3))
+        return img, label
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, labels))
+    ds = ds.map(load, num_parallel_calls=AUTOTUNE)
+    ds = ds.cache(cache)                       # decoded once, reused every epoch
+    if shuffle:
+        ds = ds.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = _finish(ds, n_classes, augment, training, preprocess)
+    return ds, class_indices, len(paths)
+
+
+def make_shard_dataset(shard, batch_size, augment=None, training=False,
+                       preprocess=None, shuffle=None, seed=None):
+    """make_dataset() fed from a pre-decoded shards.Shard instead of JPEGs."""
+    n, n_classes = len(shard), len(shard.classes)
+    shuffle = training if shuffle is None else shuffle
+    h, w = shard.size
+    rng = np.random.default_rng(seed)
+
+    def batches():
+        if not shuffle:
+            for _, x, y in shard.batches(batch_size):   # contiguous mmap slices
+                yield x, y
+            return
+        order = rng.permutation(n)
+        for s in range(0, n, batch_size):
+            idx = np.sort(order[s:s + batch_size])      # sorted → sequential reads
+            yield shard.images[idx], shard.labels[idx]
+
+    ds = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((None, h, w, 3), tf.uint8),
+        tf.TensorSpec((None,), tf.int32)))
+    ds = _finish(ds, n_classes, augment, training, preprocess)
+    return ds, shard.classes, n
+
+
+def _finish(ds, n_classes, augment, training, preprocess):
+    """uint8 batches → augmented, preprocessed float batches + one-hot, prefetched."""
+    def finish(images, label):
+        images = tf.cast(images, tf.float32)
+        if training and augment:
+            images = augment_batch(images, augment)
+        if preprocess is not None:
+            images = preprocess(images)
+        return images, tf.one_hot(label, n_classes)
+
+    return ds.map(finish, num_parallel_calls=AUTOTUNE).prefetch(AUTOTUNE)
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Prints wall time and images/s for every epoch."""
+
+    def __init__(self, n_images, label=""):
+        super().__init__()
+        self.n_images = n_images
+        self.label = label
+        self.times = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._t0 = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        dt = time.perf_counter() - self._t0
+        self.times.append(dt)
+        print(f"⏱  {self.label} epoch {epoch + 1}: {dt:.1f}s "
+              f"({self.n_images / dt:.0f} img/s)")
+
+
+# ─── input-pipeline bench ─────────────────────────────────────────────────────
+
+def _time_epoch(batches, steps):
+    t0 = time.perf_counter()
+    for _, _ in zip(range(steps), batches):
+        pass
+    return time.perf_counter() - t0
+
+
+def main():
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    ap = argparse.ArgumentParser(description="Epoch time: flow_from_directory vs tf.data")
+    ap.add_argument("directory", nargs="?", default="new_dataset/train")
+    ap.add_argument("--size", type=int, default=150)
+    ap.add_argument("--batch", type=int, default=30)
+    ap.add_argument("--epochs", type=int, default=2)
+    args = ap.parse_args()
+
+    # train_cnn_new.py's settings
+    augment = dict(rotation_range=360, width_shift_range=0.10, height_shift_range=0.10,
+                   zoom_range=(0.70, 1.10), brightness_range=(0.70, 1.20))
+    size = (args.size, args.size)
+
+    gen = ImageDataGenerator(**augment).flow_from_directory(
+        args.directory, target_size=size, color_mode="rgb",
+        batch_size=args.batch, class_mode="categorical", shuffle=True)
+    ds, class_indices, n = make_dataset(args.directory, size, args.batch,
+                                        augment=augment, training=True)
+    if class_indices != gen.class_indices:
+        raise SystemExit(f"class indices differ: {class_indices} vs {gen.class_indices}")
+    steps = math.ceil(n / args.batch)
+    print(f"{n} images, {len(class_indices)} classes, {steps} steps/epoch")
+
+    for name, batches in (("ImageDataGenerator", gen), ("tf.data", ds)):
+        for e in range(args.epochs):
+            dt = _time_epoch(iter(batches), steps)
+            note = "  (decode + cache)" if name == "tf.data" and e == 0 else ""
+            print(f"⏱  {name:18s} epoch {e + 1}: {dt:6.2f}s  {n / dt:7.0f} img/s{note}")
+
+
+if __name__ == "__main__":
+    main()
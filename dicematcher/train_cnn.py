@@ -2,12 +2,14 @@
 import os
 import numpy as np
 import tensorflow as tf
-import matplotlib.pyplot as plt
 from tensorflow.keras import layers, models, optimizers
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+from run_config import apply_overrides
+from shards import open_shard
+from tf_pipeline import EpochTimer, make_dataset, make_shard_dataset
 
 # =====================
 #   CONFIGURABLE HYPERPARAMETERS
@@ -27,13 +29,15 @@ VERTICAL_FLIP        = False
 OPTIMIZER_NAME       = "adam"
 LEARNING_RATE        = 1e-4           # often lower for finetuning
 MODEL_PATH           = "dice_mobilenetv2.h5"
+PIPELINE             = "keras"        # "keras" (ImageDataGenerator) or "tfdata" (cached, parallel;
+                                      #  opt-in until checked for parity with the Keras path)
+SHARD_DIR            = None           # e.g. "shards" → train from pre-decoded tensors (shards.py)
+apply_overrides(globals())
 
 # =====================
 #   DATA GENERATORS
 # =====================
-# We load as RGB so that grayscale crops are automatically duplicated into 3‐channels
-train_datagen = ImageDataGenerator(
-    preprocessing_function=preprocess_input,  # MobileNetV2-style normalization
+AUG = dict(
     rotation_range=ROTATION_RANGE,
     width_shift_range=WIDTH_SHIFT_RANGE,
     height_shift_range=HEIGHT_SHIFT_RANGE,
@@ -41,28 +45,54 @@ train_datagen = ImageDataGenerator(
     brightness_range=BRIGHTNESS_RANGE,
     horizontal_flip=HORIZONTAL_FLIP,
     vertical_flip=VERTICAL_FLIP,
-    validation_split=0.0  # we'll do separate folders
-)
-val_datagen = ImageDataGenerator(
-    preprocessing_function=preprocess_input
 )
 
-train_gen = train_datagen.flow_from_directory(
-    TRAIN_DIR,
-    target_size=IMG_SIZE,
-    color_mode="rgb",
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-    shuffle=True
-)
-val_gen = val_datagen.flow_from_directory(
-    VAL_DIR,
-    target_size=IMG_SIZE,
-    color_mode="rgb",
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-    shuffle=False
-)
+if SHARD_DIR and PIPELINE != "tfdata":
+    print(f"⚠️ SHARD_DIR is only read by the tfdata pipeline; PIPELINE={PIPELINE!r} ignores it")
+
+if PIPELINE == "tfdata" and SHARD_DIR:
+    # pre-decoded tensors (python shards.py --sizes 256): no JPEG decode at all
+    # (IMG_SIZE here is Keras (h, w); shards take cv2's (w, h))
+    train_gen, class_indices, n_train = make_shard_dataset(
+        open_shard(SHARD_DIR, TRAIN_DIR, IMG_SIZE[::-1]), BATCH_SIZE, augment=AUG, training=True,
+        preprocess=preprocess_input)
+    val_gen, _, _ = make_shard_dataset(
+        open_shard(SHARD_DIR, VAL_DIR, IMG_SIZE[::-1]), BATCH_SIZE, preprocess=preprocess_input)
+elif PIPELINE == "tfdata":
+    # decode once + cache, batched augmentation, prefetch (see tf_pipeline.py)
+    train_gen, class_indices, n_train = make_dataset(
+        TRAIN_DIR, IMG_SIZE, BATCH_SIZE, augment=AUG, training=True,
+        preprocess=preprocess_input)
+    val_gen, _, _ = make_dataset(VAL_DIR, IMG_SIZE, BATCH_SIZE,
+                                 preprocess=preprocess_input)
+else:
+    # We load as RGB so that grayscale crops are automatically duplicated into 3‐channels
+    train_datagen = ImageDataGenerator(
+        preprocessing_function=preprocess_input,  # MobileNetV2-style normalization
+        validation_split=0.0,  # we'll do separate folders
+        **AUG
+    )
+    val_datagen = ImageDataGenerator(
+        preprocessing_function=preprocess_input
+    )
+
+    train_gen = train_datagen.flow_from_directory(
+        TRAIN_DIR,
+        target_size=IMG_SIZE,
+        color_mode="rgb",
+        batch_size=BATCH_SIZE,
+        class_mode="categorical",
+        shuffle=True
+    )
+    val_gen = val_datagen.flow_from_directory(
+        VAL_DIR,
+        target_size=IMG_SIZE,
+        color_mode="rgb",
+        batch_size=BATCH_SIZE,
+        class_mode="categorical",
+        shuffle=False
+    )
+    class_indices, n_train = train_gen.class_indices, train_gen.samples
 
 # =====================
 #   BUILD TRANSFER LEARNING MODEL
@@ -81,7 +111,7 @@ model = models.Sequential([
     layers.GlobalAveragePooling2D(),
     layers.Dense(64, activation="relu"),
     layers.Dropout(0.3),
-    layers.Dense(train_gen.num_classes, activation="softmax")
+    layers.Dense(len(class_indices), activation="softmax")
 ])
 
 # =====================
@@ -106,7 +136,8 @@ model.summary()
 # =====================
 callbacks = [
     EarlyStopping(monitor="val_accuracy", patience=15, restore_best_weights=True),
-    ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=3)
+    ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=3),
+    EpochTimer(n_train, PIPELINE),
 ]
 
 # =====================
@@ -146,6 +177,8 @@ ft_history = model.fit(
 model.save(MODEL_PATH)
 print(f"Model saved to {MODEL_PATH}")
 
+import matplotlib.pyplot as plt   # only needed once training is done
+
 plt.figure()
 plt.plot(history.history['val_accuracy'] + ft_history.history['val_accuracy'], 
          label='Validation Accuracy')
@@ -3,10 +3,12 @@
 import os
 import numpy as np
 import tensorflow as tf
-import matplotlib.pyplot as plt
 from tensorflow.keras import layers, models, optimizers
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau, ModelCheckpoint
+from run_config import apply_overrides
+from shards import open_shard
+from tf_pipeline import EpochTimer, make_dataset, make_shard_dataset
 
 # ==============================================================
 #                  CONFIGURABLE HYPER-PARAMETERS
@@ -31,35 +33,61 @@ AUG_VFLIP            = False
 MODEL_BEST_PATH      = "best_dice_cnn.h5"  # Checkpoint
 MODEL_FINAL_PATH     = "dice_cnn_custom.h5"
 
+PIPELINE             = "keras"             # "keras" (ImageDataGenerator) or "tfdata" (cached, parallel;
+                                           #  opt-in until checked for parity with the Keras path)
+SHARD_DIR            = None                # e.g. "shards" → train from pre-decoded tensors (shards.py)
+apply_overrides(globals())
+
 # ==============================================================
 #                         DATA PIPELINE
 # ==============================================================
-train_datagen = ImageDataGenerator(
+AUG = dict(
     rotation_range=AUG_ROT,
     width_shift_range=AUG_WIDTH_SHIFT,
     height_shift_range=AUG_HEIGHT_SHIFT,
     zoom_range=AUG_ZOOM,
-    brightness_range=AUG_BRIGHTNESS
-)
-val_datagen = ImageDataGenerator()     # no augmentation for validation
-
-train_gen = train_datagen.flow_from_directory(
-    TRAIN_DIR,
-    target_size=IMG_SIZE,
-    color_mode="rgb",
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-    shuffle=True
-)
-val_gen = val_datagen.flow_from_directory(
-    VAL_DIR,
-    target_size=IMG_SIZE,
-    color_mode="rgb",
-    batch_size=BATCH_SIZE,
-    class_mode="categorical",
-    shuffle=False
+    brightness_range=AUG_BRIGHTNESS,
+    horizontal_flip=AUG_HFLIP,
+    vertical_flip=AUG_VFLIP,
 )
 
+if SHARD_DIR and PIPELINE != "tfdata":
+    print(f"⚠️ SHARD_DIR is only read by the tfdata pipeline; PIPELINE={PIPELINE!r} ignores it")
+
+if PIPELINE == "tfdata" and SHARD_DIR:
+    # pre-decoded tensors (python shards.py --sizes 150): no JPEG decode at all
+    # (IMG_SIZE here is Keras (h, w); shards take cv2's (w, h))
+    train_gen, class_indices, n_train = make_shard_dataset(
+        open_shard(SHARD_DIR, TRAIN_DIR, IMG_SIZE[::-1]), BATCH_SIZE, augment=AUG, training=True)
+    val_gen, _, _ = make_shard_dataset(
+        open_shard(SHARD_DIR, VAL_DIR, IMG_SIZE[::-1]), BATCH_SIZE)
+elif PIPELINE == "tfdata":
+    # decode once + cache, batched augmentation, prefetch (see tf_pipeline.py)
+    train_gen, class_indices, n_train = make_dataset(
+        TRAIN_DIR, IMG_SIZE, BATCH_SIZE, augment=AUG, training=True)
+    val_gen, _, _ = make_dataset(VAL_DIR, IMG_SIZE, BATCH_SIZE)
+else:
+    train_datagen = ImageDataGenerator(**AUG)
+    val_datagen = ImageDataGenerator()     # no augmentation for validation
+
+    train_gen = train_datagen.flow_from_directory(
+        TRAIN_DIR,
+        target_size=IMG_SIZE,
+        color_mode="rgb",
+        batch_size=BATCH_SIZE,
+        class_mode="categorical",
+        shuffle=True
+    )
+    val_gen = val_datagen.flow_from_directory(
+        VAL_DIR,
+        target_size=IMG_SIZE,
+        color_mode="rgb",
+        batch_size=BATCH_SIZE,
+        class_mode="categorical",
+        shuffle=False
+    )
+    class_indices, n_train = train_gen.class_indices, train_gen.samples
+
 # ==============================================================
 #                   CUSTOM CNN ARCHITECTURE
 #   (exactly the block-stack from the notebook)
@@ -82,7 +110,7 @@ model = models.Sequential([
     layers.MaxPooling2D((2,2)),
 
     layers.Flatten(),
-    layers.Dense(train_gen.num_classes, activation="softmax")
+    layers.Dense(len(class_indices), activation="softmax")
 ])
 
 model.summary()
@@ -100,7 +128,8 @@ callbacks = [
     EarlyStopping(monitor="val_accuracy", patience=12, restore_best_weights=True),
     ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=3),
     ModelCheckpoint(MODEL_BEST_PATH, monitor="val_accuracy",
-                    save_best_only=True, verbose=1)
+                    save_best_only=True, verbose=1),
+    EpochTimer(n_train, PIPELINE),
 ]
 
 # ==============================================================
@@ -119,6 +148,8 @@ history = model.fit(
 model.save(MODEL_FINAL_PATH)
 print(f"✓ Final model saved to {MODEL_FINAL_PATH}")
 
+import matplotlib.pyplot as plt   # only needed once training is done
+
 plt.figure()
 plt.plot(history.history["val_accuracy"], label="Validation Accuracy")
 plt.title("Validation Accuracy vs Epochs")
@@ -1,10 +1,16 @@
-from flask import Flask, request, redirect, send_from_directory, render_template_string
+from flask import Flask, request, redirect, send_from_directory, send_file, render_template_string, jsonify, abort
 from pathlib import Path
-import mimetypes, os
+from bisect import insort
+import hashlib, itertools, mimetypes, os, tempfile, threading, time
 
 app = Flask(__name__)
 UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "/uploads"))
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+THUMB_DIR = Path(os.getenv("THUMB_DIR", "/tmp/thumbs"))   # outside the shared volume
+THUMB_MAX = int(os.getenv("THUMB_MAX", "2000"))           # cached thumbnails kept (LRU)
+POLL_SEC = float(os.getenv("INDEX_POLL_SEC", "1.0"))      # fallback when no inotify
+RESCAN_SEC = float(os.getenv("INDEX_RESCAN_SEC", "60"))   # safety-net rescan under inotify
+RECENT_N = 12
 
 HTML = """
 <!doctype html>
@@ -15,6 +21,12 @@ HTML = """
 {% else %}
   <p><em>No image yet.</em></p>
 {% endif %}
+{% if recent %}
+<h2>Recent</h2>
+{% for name in recent %}
+  <a href="{{ url_for('uploaded_file', filename=name) }}"><img src="{{ url_for('thumbnail', filename=name) }}" alt="{{ name }}" loading="lazy"></a>
+{% endfor %}
+{% endif %}
 <hr>
 <h2>Upload new image</h2>
 <form method="post" enctype="multipart/form-data" action="/upload">
@@ -23,13 +35,222 @@ HTML = """
 </form>
 """
 
+
+def _indexable(name):
+    # skip dotfiles and half-written "*.tmp" files from atomic writers
+    return not name.startswith(".") and not name.endswith(".tmp")
+
+
+class UploadIndex:
+    """Files in UPLOAD_DIR ordered by mtime, kept current incrementally.
+
+    Uploads through this app are added directly; files written by other
+    containers on the shared volume are picked up by inotify (watchdog, if
+    installed, with a full rescan every RESCAN_SEC as a safety net) or by
+    a poller that only rescans when the directory's own mtime changes.
+    Queries never touch the filesystem.
+
+    _order is append-mostly: replacing or removing a file only forgets its
+    slot, and the dead pair is skipped by queries and dropped when it
+    reaches the tail or at the next compaction, so the rewrite of a
+    <seq>.jpg preview costs O(1) however many files there are.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._lock = threading.Lock()
+        self._entries = {}   # name → (mtime_ns, size)
+        self._order = []     # sorted [(mtime_ns, slot, name)], newest last; may hold dead pairs
+        self._slot = {}      # name → slot of its live pair in _order
+        self._slots = itertools.count()
+        self._dir_mtime = None
+        self.rescan()
+
+    # ─── updates ────────────────────────────────────────────────
+    def _live(self, item):
+        return self._slot.get(item[2]) == item[1]
+
+    def _remove_locked(self, name):
+        if self._entries.pop(name, None) is not None:
+            del self._slot[name]
+            while self._order and not self._live(self._order[-1]):
+                self._order.pop()
+            if len(self._order) > 2 * len(self._entries) + 64:
+                self._order = [it for it in self._order if self._live(it)]
+
+    def add(self, name):
+        if not _indexable(name):
+            return
+        try:
+            st = (self.root / name).stat()
+        except FileNotFoundError:
+            return self.discard(name)
+        with self._lock:
+            self._remove_locked(name)
+            self._entries[name] = (st.st_mtime_ns, st.st_size)
+            item = (st.st_mtime_ns, next(self._slots), name)
+            self._slot[name] = item[1]
+            if not self._order or self._order[-1][0] <= st.st_mtime_ns:
+                self._order.append(item)                       # usual case: newest
+            else:
+                insort(self._order, item)
+
+    def discard(self, name):
+        with self._lock:
+            self._remove_locked(name)
+
+    def rescan(self, force=True):
+        try:
+            dir_mtime = self.root.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if not force and dir_mtime == self._dir_mtime:
+            return                                  # nothing added/removed/renamed
+        self._dir_mtime = dir_mtime
+        seen = {}
+        with os.scandir(self.root) as it:
+            for e in it:
+                if e.is_file() and _indexable(e.name):
+                    st = e.stat()
+                    seen[e.name] = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            if seen == self._entries:
+                return
+            if not self._entries:                   # first scan: build in one go
+                self._entries = seen
+                self._order = sorted((m, next(self._slots), n) for n, (m, _) in seen.items())
+                self._slot = {n: slot for _, slot, n in self._order}
+                return
+            # merge: the listing predates anything add()/discard() did since,
+            # so only the differences are re-checked, each with a fresh stat
+            changed = [n for n, v in seen.items() if self._entries.get(n) != v]
+            changed += [n for n in self._entries if n not in seen]
+        for name in changed:
+            self.add(name)                          # discards it if it's gone
+
+    # ─── queries ────────────────────────────────────────────────
+    def latest(self):
+        with self._lock:
+            return self._order[-1][2] if self._order else None   # the tail is always live
+
+    def recent(self, n=RECENT_N, offset=0):
+        out = []
+        with self._lock:
+            for item in reversed(self._order):
+                if not self._live(item):
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                out.append(item[2])
+                if len(out) == n:
+                    break
+        return out
+
+    def stat(self, name):
+        with self._lock:
+            return self._entries.get(name)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def start_watching(index: UploadIndex):
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        Observer = None
+    if Observer is not None:
+        class Handler(FileSystemEventHandler):
+            def on_created(self, ev):
+                if not ev.is_directory:
+                    index.add(Path(ev.src_path).name)
+            on_modified = on_created
+            def on_deleted(self, ev):
+                index.discard(Path(ev.src_path).name)
+            def on_moved(self, ev):
+                index.discard(Path(ev.src_path).name)
+                index.add(Path(ev.dest_path).name)
+        obs = Observer()
+        obs.schedule(Handler(), str(index.root), recursive=False)
+        obs.daemon = True
+        obs.start()
+
+    def poll():
+        # with inotify: a slow safety net for missed events (every upload
+        # moves the dir mtime, so a fast poll would rescan all the time)
+        while True:
+            time.sleep(RESCAN_SEC if Observer is not None else POLL_SEC)
+            index.rescan(force=False)
+            if Observer is None:
+                # dir mtime doesn't move when an existing file is rewritten
+                for name in index.recent(2):
+                    st = index.stat(name)
+                    try:
+                        if st and (index.root / name).stat().st_mtime_ns != st[0]:
+                            index.add(name)
+                    except FileNotFoundError:
+                        index.discard(name)
+    threading.Thread(target=poll, daemon=True, name="upload-index").start()
+
+
+index = UploadIndex(UPLOAD_DIR)
+start_watching(index)
+
+
 def latest_image():
-    pics = sorted(UPLOAD_DIR.glob("*"), key=lambda p: p.stat().st_mtime, reverse=True)
-    return pics[0].name if pics else None
+    return index.latest()
+
+
+_thumb_writes = itertools.count(1)
+_prune_lock = threading.Lock()
+
+
+def _prune_thumbs():
+    """Delete the least recently used thumbnails beyond THUMB_MAX (hits
+    touch their file, so mtime order is use order)."""
+    if not _prune_lock.acquire(blocking=False):
+        return                                      # another request is on it
+    try:
+        with os.scandir(THUMB_DIR) as it:
+            files = sorted((e.stat().st_mtime_ns, e.path) for e in it if e.name.endswith(".jpg"))
+        for _, path in files[:max(0, len(files) - THUMB_MAX)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    finally:
+        _prune_lock.release()
+
+
+def _cache_policy(resp, filename):
+    # <seq>.jpg previews are overwritten in place → always revalidate;
+    # timestamped archive files never change → let the browser keep them
+    if Path(filename).stem.isdigit():
+        resp.headers["Cache-Control"] = "no-cache"
+    else:
+        resp.headers["Cache-Control"] = "public, max-age=86400"
+    return resp
+
 
 @app.route("/")
-def index():
-    return render_template_string(HTML, image=latest_image())
+def index_page():
+    latest = latest_image()
+    st = index.stat(latest) if latest else None
+    resp = app.make_response(render_template_string(
+        HTML, image=latest, recent=index.recent(RECENT_N, offset=1)))
+    resp.set_etag(hashlib.sha1(f"{latest}:{st}:{len(index)}".encode()).hexdigest())
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
+
+
+@app.route("/recent")
+def recent():
+    n = min(max(request.args.get("n", RECENT_N, type=int), 1), 500)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    return jsonify(total=len(index), offset=offset, images=index.recent(n, offset))
+
 
 @app.route("/upload", methods=["POST"])
 def upload():
@@ -39,12 +260,51 @@ def upload():
     if not file.mimetype.startswith("image/"):
         return "Only images, please.", 400
     ext = mimetypes.guess_extension(file.mimetype) or ".jpg"
-    fname = f"cam_{int(Path().stat().st_mtime_ns)}{ext}"
+    fname = f"cam_{time.time_ns()}{ext}"
     file.save(UPLOAD_DIR / fname)
+    index.add(fname)
     return redirect("/")
 
+
 @app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    resp = send_from_directory(UPLOAD_DIR, filename)
-    resp.headers["Cache-Control"] = "no-store"
-    return resp
\ No newline at end of file
+    # conditional GET: ETag + Last-Modified → 304 when unchanged
+    resp = send_from_directory(UPLOAD_DIR, filename, conditional=True, etag=True)
+    return _cache_policy(resp, filename)
+
+
+@app.route("/thumb/<path:filename>")
+def thumbnail(filename):
+    st = index.stat(filename)
+    if st is None:
+        abort(404)
+    width = min(max(request.args.get("w", 160, type=int), 16), 1024)
+    try:
+        from PIL import Image
+    except ImportError:
+        return redirect(f"/uploads/{filename}")
+    # cache key includes the full name and mtime, so a rewritten preview
+    # gets a fresh thumb; the stale one ages out via _prune_thumbs
+    THUMB_DIR.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha1(f"{filename}:{st[0]}:{width}".encode()).hexdigest()
+    thumb = THUMB_DIR / f"{key}.jpg"
+    try:
+        os.utime(thumb)                             # hit: mark as recently used
+    except FileNotFoundError:
+        with Image.open(UPLOAD_DIR / filename) as img:
+            img.draft("RGB", (width, width))          # JPEG: decode at reduced scale
+            img = img.convert("RGB")
+            img.thumbnail((width, width))
+            # private temp file: concurrent misses for one thumb don't collide
+            fd, tmp = tempfile.mkstemp(dir=THUMB_DIR, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    img.save(f, format="JPEG", quality=80)
+                os.replace(tmp, thumb)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        if next(_thumb_writes) % max(1, THUMB_MAX // 10) == 0:
+            _prune_thumbs()
+    resp = send_file(thumb, mimetype="image/jpeg", conditional=True, etag=True)
+    return _cache_policy(resp, filename)
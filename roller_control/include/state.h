@@ -14,3 +14,4 @@ extern RunState state;
 
 extern int  seq;         // current roll index
 extern int  totalRolls;  // target # of rolls (from server)
+extern bool recapturePending;  // server asked for this seq's photo again
@@ -11,6 +11,7 @@ RunState state = DISCONNECTED;
 int    seq           = 0;
 int    totalRolls    = 10;
 bool   finishedSent  = false;
+bool   recapturePending = false;
 int    warmupCount   = 0;
 
 static constexpr uint8_t  MOTOR_SPEED = 200;
@@ -111,8 +112,14 @@ void loop() {
       setLED(true);
       Serial.printf("🔄 SPINNING %d/%d\n", seq, totalRolls);
 
-      // spin → coast
-      spin(MOTOR_SPEED, SPIN_MS, CW);
+      if (recapturePending) {
+        // server rejected the last photo: same roll, take it again
+        recapturePending = false;
+        Serial.printf("📷 RECAPTURE %d\n", seq);
+      } else {
+        // spin → coast
+        spin(MOTOR_SPEED, SPIN_MS, CW);
+      }
 
       delay(settleMs);
       auto frame = captureFrame();
@@ -67,6 +67,20 @@ static void handleWsEvent(WStype_t type, uint8_t* payload, size_t length) {
       } else if (strcmp(cmd, "stop") == 0) {
         state = FINISHED;
         Serial.println("↪ state=FINISHED");
+
+      } else if (strcmp(cmd, "recapture") == 0) {
+        // Quality gate rejected the photo of `seq`.  Only honoured for the
+        // roll just uploaded – once the die has been spun again it's gone.
+        int again = doc["seq"] | -1;
+        if (again > 0 && again == seq - 1 && (state == SPINNING || state == FINISHED)) {
+          seq              = again;
+          recapturePending = true;
+          finishedSent     = false;
+          state            = SPINNING;
+          Serial.printf("↪ recapture seq=%d\n", again);
+        } else {
+          Serial.printf("⚠️ stale recapture seq=%d (at %d)\n", again, seq);
+        }
       }
       break;
     }
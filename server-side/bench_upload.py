@@ -0,0 +1,105 @@
+# bench_upload.py
+#
+# Load test for a running roll server: fires concurrent /upload requests
+# while a WebSocket client keeps pinging, and reports
+#   • upload latency (p50 / p95 / max) and throughput
+#   • WS round-trip latency (ws_hello → ready) during the load
+#
+# A blocked event loop shows up as WS round trips as long as an upload.
+#
+#   python server_test.py                                  # or uvicorn …
+#   python bench_upload.py --url http://localhost:80 --uploads 200 -c 16
+#
+# Needs httpx + websockets: pip install -r requirements-bench.txt
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+
+import httpx
+import websockets
+
+
+def pct(xs, p):
+    if not xs:
+        return float("nan")
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+
+def summary(name, xs):
+    print(f"{name:<14} n={len(xs):<5} p50={pct(xs, 50)*1e3:7.1f} ms  "
+          f"p95={pct(xs, 95)*1e3:7.1f} ms  p99={pct(xs, 99)*1e3:7.1f} ms  "
+          f"max={max(xs, default=float('nan'))*1e3:7.1f} ms")
+
+
+async def ws_pinger(url, stop, rtts):
+    async with websockets.connect(url) as ws:
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            await ws.send("ws_hello")
+            while True:                     # skip step_ok broadcasts
+                msg = json.loads(await ws.recv())
+                if msg.get("evt") == "ready":
+                    break
+            rtts.append(time.perf_counter() - t0)
+            await asyncio.sleep(0.01)
+
+
+async def uploader(client, url, body, seqs, lat, errors):
+    for seq in seqs:
+        t0 = time.perf_counter()
+        r = await client.post(url, params={"seq": seq}, content=body,
+                              headers={"Content-Type": "image/jpeg"})
+        if r.status_code == 200:
+            lat.append(time.perf_counter() - t0)
+        else:
+            errors.append(r.status_code)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:80")
+    ap.add_argument("--image", default=str(Path(__file__).parent / "test_images" / "d6_01.jpg"))
+    ap.add_argument("--uploads", type=int, default=200)
+    ap.add_argument("-c", "--concurrency", type=int, default=16)
+    ap.add_argument("--seq-base", type=int, default=10_000,
+                    help="first seq number (keeps bench previews apart from real ones)")
+    args = ap.parse_args()
+
+    body = Path(args.image).read_bytes()
+    ws_url = args.url.replace("http", "ws", 1).rstrip("/") + "/ws"
+    seqs = list(range(args.seq_base, args.seq_base + args.uploads))
+    shards = [seqs[i::args.concurrency] for i in range(args.concurrency)]
+
+    # idle baseline for WS
+    idle, stop = [], asyncio.Event()
+    task = asyncio.create_task(ws_pinger(ws_url, stop, idle))
+    await asyncio.sleep(1.0)
+    stop.set(); await task
+
+    lat, errors, loaded = [], [], []
+    stop = asyncio.Event()
+    task = asyncio.create_task(ws_pinger(ws_url, stop, loaded))
+    t0 = time.perf_counter()
+    async with httpx.AsyncClient(timeout=60) as client:
+        await asyncio.gather(*(uploader(client, args.url.rstrip("/") + "/upload",
+                                        body, s, lat, errors) for s in shards))
+    wall = time.perf_counter() - t0
+    stop.set(); await task
+
+    print(f"\n=== Upload benchmark ({len(body)/1024:.0f} KiB frame, "
+          f"{args.concurrency} concurrent) ===")
+    summary("upload", lat)
+    summary("ws rtt idle", idle)
+    summary("ws rtt load", loaded)
+    print(f"throughput     {len(lat) / wall:.1f} uploads/s   errors={len(errors)}")
+    if idle and loaded:
+        print(f"ws slowdown    ×{statistics.median(loaded) / statistics.median(idle):.1f} (median)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
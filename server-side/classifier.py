@@ -0,0 +1,142 @@
+# classifier.py
+#
+# Warm in-process die-face classifier for the roll server.
+#
+# The model is loaded once at startup.  Uploads that arrive within
+# BATCH_WINDOW_MS of each other (several rigs rolling at once) are grouped
+# into one micro-batch and run through a single predict call on a
+# dedicated inference thread, so the event loop never blocks on the model.
+#
+#     clf = DiceClassifier("dice_cnn_custom_978.h5")
+#     await clf.start()                   # load + warm up, off the loop
+#     x = clf.prepare(jpeg_bytes)         # worker thread: decode + resize
+#     face, conf = await clf.classify(x)  # event loop: joins a micro-batch
+
+import asyncio
+import io
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+MODEL_PATH      = os.getenv("CLASSIFIER_MODEL", "dice_cnn_custom_978.h5")   # or exported .tflite/.onnx
+DICEMATCHER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dicematcher")
+BATCH_WINDOW_MS = 5      # how long the first request waits for company
+MAX_BATCH       = 16     # flush early once this many are queued
+
+
+class DiceClassifier:
+    def __init__(self, model_path=MODEL_PATH, window_ms=BATCH_WINDOW_MS,
+                 max_batch=MAX_BATCH):
+        self.model_path = model_path
+        self.window     = window_ms / 1000.0
+        self.max_batch  = max_batch
+        self.model      = None
+        self.size       = None            # (w, h) the model expects
+        self.error      = None            # why the classifier is disabled
+        self._queue     = None
+        self._task      = None
+        # TF models aren't meant to be driven from several threads at once
+        self._infer     = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infer")
+
+    @property
+    def ready(self):
+        return self.model is not None
+
+    # ─── lifecycle ───────────────────────────────────────────────
+    def _load(self):
+        if self.model_path.endswith((".tflite", ".onnx")):
+            # exported by dicematcher/export_model.py – no TensorFlow import
+            if DICEMATCHER_DIR not in sys.path:
+                sys.path.append(DICEMATCHER_DIR)
+            from lite_runtime import load_model
+            model = load_model(self.model_path)
+        else:
+            import tensorflow as tf        # heavy – only when enabled
+            model = tf.keras.models.load_model(self.model_path)
+        _, h, w, c = model.input_shape
+        model.predict_on_batch(np.zeros((1, h, w, c), "float32"))   # warm-up
+        return model, (w, h)
+
+    async def start(self):
+        if not os.path.exists(self.model_path):
+            self.error = f"model not found: {self.model_path}"
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            self.model, self.size = await loop.run_in_executor(self._infer, self._load)
+        except ImportError as ex:
+            self.error = f"model runtime unavailable: {ex}"
+            return False
+        except Exception as ex:            # corrupt / incompatible file, failed warm-up
+            self.error = f"model failed to load: {type(ex).__name__}: {ex}"
+            return False
+        self._queue = asyncio.Queue()
+        self._task  = asyncio.create_task(self._batcher())
+        return True
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            # nobody will serve what is still queued – don't leave callers hanging
+            while not self._queue.empty():
+                _, fut = self._queue.get_nowait()
+                fut.cancel()
+        self._infer.shutdown(wait=False)
+
+    # ─── per-upload ──────────────────────────────────────────────
+    def prepare(self, jpeg: bytes):
+        """Cropped JPEG → (h, w, 3) uint8 model input.  Thread-safe, no TF."""
+        img = Image.open(io.BytesIO(jpeg))
+        w, h = self.size
+        shrink = min(img.size[0] / w, img.size[1] / h)
+        if shrink >= 2:
+            img.draft("RGB", (math.ceil(img.size[0] / shrink),
+                              math.ceil(img.size[1] / shrink)))
+        return np.asarray(img.convert("RGB").resize((w, h), Image.BILINEAR))
+
+    async def classify(self, x):
+        """(face 1..N, confidence) for one prepared input."""
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((x, fut))
+        return await fut
+
+    # ─── micro-batching ──────────────────────────────────────────
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        items = []
+        try:
+            while True:
+                items = [await self._queue.get()]
+                deadline = loop.time() + self.window
+                while len(items) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        items.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+                batch = np.stack([x for x, _ in items]).astype("float32")   # 0-255 scale
+                try:
+                    preds = await loop.run_in_executor(self._infer, self.model.predict_on_batch, batch)
+                except Exception as ex:
+                    for _, fut in items:
+                        if not fut.done():
+                            fut.set_exception(ex)
+                    continue
+                for (_, fut), p in zip(items, np.asarray(preds)):
+                    if not fut.done():
+                        fut.set_result((int(p.argmax() + 1), float(p.max())))
+        except asyncio.CancelledError:
+            for _, fut in items:           # the batch being collected / predicted
+                fut.cancel()
+            raise
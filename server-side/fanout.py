@@ -0,0 +1,149 @@
+# fanout.py
+#
+# Non-blocking WebSocket fan-out: every client gets its own bounded
+# outgoing queue and writer task, so one slow browser tab or stalled ESP32
+# socket can't hold up step_ok / control commands for everyone else.
+#
+# Per-message policies (keyed by the message's "evt" or "cmd"):
+#   "evict"    – must be delivered; a client whose queue is full is dropped
+#   "coalesce" – replaces a still-queued message of the same kind (only the
+#                latest matters, e.g. a status snapshot); evicts if full.
+#                Not for step_ok: each one carries a roll's face / conf
+#   "drop"     – best effort; skipped for a client whose queue is full
+#
+# A client is also evicted when a single send takes longer than
+# send_timeout (dead TCP peer).
+
+import asyncio
+from collections import deque
+from typing import Any, Dict
+
+SEND_QUEUE_SIZE = 64      # messages buffered per client
+SEND_TIMEOUT    = 5.0     # seconds one send_json may take
+DEFAULT_POLICY  = "evict"
+EVENT_POLICY: Dict[str, str] = {}     # kind → policy; anything else is DEFAULT_POLICY
+
+
+def _kind(msg: Dict[str, Any]):
+    return msg.get("evt") or msg.get("cmd")
+
+
+class ClientChannel:
+    """Bounded outgoing queue + writer task for one WebSocket."""
+
+    def __init__(self, ws, on_dead, maxsize=SEND_QUEUE_SIZE, send_timeout=SEND_TIMEOUT):
+        self.ws           = ws
+        self.maxsize      = maxsize
+        self.send_timeout = send_timeout
+        self.dropped      = 0
+        self._q           = deque()               # [kind, msg]
+        self._wake        = asyncio.Event()
+        self._on_dead     = on_dead
+        self._task        = asyncio.create_task(self._writer())
+
+    def __len__(self):
+        return len(self._q)
+
+    def offer(self, msg: Dict[str, Any], policy: str) -> bool:
+        """Queue without waiting; False means the client must be evicted."""
+        kind = _kind(msg)
+        if policy == "coalesce":
+            for entry in self._q:
+                if entry[0] == kind:
+                    entry[1] = msg
+                    return True
+        if len(self._q) >= self.maxsize:
+            if policy == "drop":
+                self.dropped += 1
+                return True
+            return False
+        self._q.append([kind, msg])
+        self._wake.set()
+        return True
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self._q:
+                    self._wake.clear()
+                    await self._wake.wait()
+                _, msg = self._q.popleft()
+                await asyncio.wait_for(self.ws.send_json(msg), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._on_dead(self)
+
+    def close(self):
+        self._task.cancel()
+
+
+class Fanout:
+    """Set of ClientChannels with per-event drop/coalesce policies."""
+
+    def __init__(self, maxsize=SEND_QUEUE_SIZE, send_timeout=SEND_TIMEOUT,
+                 policies=None, default_policy=DEFAULT_POLICY):
+        self.maxsize        = maxsize
+        self.send_timeout   = send_timeout
+        self.policies       = dict(EVENT_POLICY if policies is None else policies)
+        self.default_policy = default_policy
+        self.channels: Dict[Any, ClientChannel] = {}
+        self.evicted        = 0
+
+    def __len__(self):
+        return len(self.channels)
+
+    def add(self, ws) -> ClientChannel:
+        ch = ClientChannel(ws, self._evict, self.maxsize, self.send_timeout)
+        self.channels[ws] = ch
+        return ch
+
+    def remove(self, ws):
+        ch = self.channels.pop(ws, None)
+        if ch is not None:
+            ch.close()
+
+    def send(self, ws, msg: Dict[str, Any]):
+        """Queue a message for one client (e.g. the handshake reply)."""
+        ch = self.channels.get(ws)
+        if ch is not None and not ch.offer(msg, self.policies.get(_kind(msg), self.default_policy)):
+            self._evict(ch)
+
+    def publish(self, msg: Dict[str, Any]):
+        """Queue a message for every client; never waits on a socket."""
+        policy = self.policies.get(_kind(msg), self.default_policy)
+        for ch in list(self.channels.values()):
+            if not ch.offer(msg, policy):
+                self._evict(ch)
+
+    def send_to_host(self, host: str, msg: Dict[str, Any]) -> int:
+        """Queue a message for the clients connected from `host` (e.g. one
+        rig); returns how many there were."""
+        policy = self.policies.get(_kind(msg), self.default_policy)
+        n = 0
+        for ch in list(self.channels.values()):
+            client = getattr(ch.ws, "client", None)
+            if client is not None and client.host == host:
+                n += 1
+                if not ch.offer(msg, policy):
+                    self._evict(ch)
+        return n
+
+    def queue_depths(self):
+        return [len(ch) for ch in self.channels.values()]
+
+    def _evict(self, ch: ClientChannel):
+        if self.channels.get(ch.ws) is not ch:
+            return
+        self.remove(ch.ws)
+        self.evicted += 1
+        print(f"⚠️ WS client evicted (queue {len(ch)}/{self.maxsize})")
+        # closing may itself stall on a dead peer – don't wait for it
+        asyncio.get_running_loop().create_task(self._close(ch.ws))
+
+    @staticmethod
+    async def _close(ws):
+        try:
+            await asyncio.wait_for(ws.close(), 1.0)
+        except Exception:
+            pass
@@ -0,0 +1,236 @@
+# metrics.py
+#
+# Dependency-free Prometheus text exposition for the roll server, plus an
+# on-demand sampling profiler.
+#
+#   STAGE = Histogram("roll_stage_seconds", "…", labelnames=("stage",))
+#   with STAGE.time("decode"):
+#       ...
+#   UPLOAD_BYTES.inc(len(data))
+#   REGISTRY.render()          # → text/plain; version=0.0.4
+#
+# Recording is a perf_counter pair, a bisect and two adds under a lock –
+# cheap enough to leave on.  The profiler is a separate thread that only
+# exists while it is switched on, so it costs nothing when off.
+
+import bisect
+import collections
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# seconds; covers sub-ms preview links up to multi-second stalls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        out = []
+        for m in self.metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m.samples())
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    """Incremented directly, or read at scrape time from a monotonic `fn`."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, fn: Optional[Callable[[], float]] = None,
+                 registry: Registry = REGISTRY):
+        self.name, self.help, self.fn = name, help, fn
+        self._value = 0.0
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, n: float = 1):
+        with self._lock:
+            self._value += n
+
+    @property
+    def value(self):
+        return self.fn() if self.fn is not None else self._value
+
+    def samples(self):
+        return [f"{self.name} {_fmt(self.value)}"]
+
+
+class Gauge:
+    """Set directly, or computed at scrape time from `fn`."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Optional[Callable[[], float]] = None,
+                 registry: Registry = REGISTRY):
+        self.name, self.help, self.fn = name, help, fn
+        self._value = 0.0
+        registry.register(self)
+
+    def set(self, v: float):
+        self._value = v
+
+    def inc(self, n: float = 1):
+        self._value += n          # event loop only
+
+    def dec(self, n: float = 1):
+        self._value -= n
+
+    def samples(self):
+        v = self.fn() if self.fn is not None else self._value
+        return [f"{self.name} {_fmt(v)}"]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        self.name, self.help = name, help
+        self.labelnames = tuple(labelnames)
+        self.bounds = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}   # labels → [counts, sum, n]
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t, *labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            series = {k: (list(c), total, n) for k, (c, total, n) in self._series.items()}
+        for labels, (counts, total, n) in sorted(series.items()):
+            cum = 0
+            for bound, c in zip(self.bounds + (float("inf"),), counts):
+                cum += c
+                le = 'le="%s"' % _fmt(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cum}")
+            lbl = _labels(self.labelnames, labels)
+            out.append(f"{self.name}_sum{lbl} {_fmt(total)}")
+            out.append(f"{self.name}_count{lbl} {n}")
+        return out
+
+
+class RateMeter:
+    """Events per second over a sliding window (e.g. frames/s)."""
+
+    def __init__(self, window: float = 10.0):
+        self.window = window
+        self._t = collections.deque()
+
+    def mark(self):
+        now = time.monotonic()
+        self._t.append(now)
+        while self._t and self._t[0] < now - self.window:
+            self._t.popleft()
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        while self._t and self._t[0] < now - self.window:
+            self._t.popleft()
+        return len(self._t) / self.window
+
+
+# ─── sampling profiler ───────────────────────────────────────────────────────
+
+class SamplingProfiler:
+    """Folded-stack sampler over every thread (flamegraph.pl / speedscope input)."""
+
+    def __init__(self):
+        self.interval = 0.01
+        self.samples = collections.Counter()     # written by the sampler thread
+        self.started_at = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval: float = 0.01):
+        if self.running:
+            return
+        self.interval = interval
+        with self._lock:
+            self.samples.clear()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+        self._thread.start()
+
+    def stop(self):
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for t in threading.enumerate():
+                names[t.ident] = t.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    # function granularity (first line) so samples aggregate
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:"
+                                 f"{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                with self._lock:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.samples.values())
+
+    def folded(self) -> str:
+        with self._lock:
+            top = self.samples.most_common()
+        return "\n".join(f"{k} {v}" for k, v in top) + "\n"
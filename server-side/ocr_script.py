@@ -1,8 +1,299 @@
-import easyocr
+# ocr_script.py
+#
+# Long-running OCR worker for the `ocr-processor` service.
+#
+#   • builds one easyocr.Reader at startup (that's most of the old per-image cost)
+#   • watches the shared uploads volume for new frames and queues them
+#   • reads them in batches (readtext_batched when available)
+#   • records every result in SQLite so restarts resume where they stopped
+#   • serves throughput / latency counters at http://:OCR_METRICS_PORT/metrics
+#
+# Config is by environment (see docker-compose.yml):
+#   WATCH_DIR, OCR_DB, OCR_BATCH, OCR_BATCH_WAIT, OCR_POLL_SEC, OCR_METRICS_PORT,
+#   OCR_LANGS, OCR_GPU, OCR_MAX_ATTEMPTS
+#
+#   python ocr_script.py                 # run the worker
+#   python ocr_script.py some/image.jpg  # one-off read (old behaviour)
+
+import json
 import os
-import cv2
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+WATCH_DIR    = Path(os.getenv("WATCH_DIR", "/uploads"))
+OCR_DB       = os.getenv("OCR_DB", str(WATCH_DIR / ".ocr_results.db"))
+BATCH_SIZE   = int(os.getenv("OCR_BATCH", "8"))
+BATCH_WAIT   = float(os.getenv("OCR_BATCH_WAIT", "0.25"))   # s to wait for a fuller batch
+POLL_SEC     = float(os.getenv("OCR_POLL_SEC", "0.5"))
+METRICS_PORT = int(os.getenv("OCR_METRICS_PORT", "9100"))
+LANGS        = os.getenv("OCR_LANGS", "en").split(",")
+USE_GPU      = os.getenv("OCR_GPU", "0") == "1"
+IMAGE_EXTS   = {".jpg", ".jpeg", ".png", ".bmp"}
+MAX_ATTEMPTS = int(os.getenv("OCR_MAX_ATTEMPTS", "3"))     # reads of a frame that keeps failing
+
+
+def wanted(name: str) -> bool:
+    p = Path(name)
+    return (p.suffix.lower() in IMAGE_EXTS
+            and not name.startswith(".")
+            and not p.stem.isdigit())          # <seq>.jpg previews duplicate the archive
+
+
+# ─── metrics ──────────────────────────────────────────────────────────────────
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.processed = self.failed = self.batches = 0
+        self.ocr_seconds = 0.0           # time inside the reader
+        self.latency_seconds = 0.0       # file seen → result stored
+        self.latency_max = 0.0
+        self.queue_depth = lambda: 0
+
+    def record_batch(self, n_ok, n_fail, ocr_s, latencies):
+        with self.lock:
+            self.batches += 1
+            self.processed += n_ok
+            self.failed += n_fail
+            self.ocr_seconds += ocr_s
+            self.latency_seconds += sum(latencies)
+            self.latency_max = max([self.latency_max, *latencies])
+
+    def render(self) -> str:
+        with self.lock:
+            up = time.time() - self.started
+            samples = [
+                ("ocr_processed_total", "counter", "Frames read", self.processed),
+                ("ocr_failed_total", "counter", "Failed reads (retries included)", self.failed),
+                ("ocr_batches_total", "counter", "Reader calls", self.batches),
+                ("ocr_reader_seconds_total", "counter", "Time inside the reader",
+                 round(self.ocr_seconds, 3)),
+                ("ocr_latency_seconds_total", "counter", "Sum of file seen → result stored",
+                 round(self.latency_seconds, 3)),
+                ("ocr_latency_seconds_max", "gauge", "Slowest file seen → result stored",
+                 round(self.latency_max, 3)),
+                ("ocr_images_per_second", "gauge", "Frames read per second since start",
+                 round(self.processed / up if up else 0, 3)),
+                ("ocr_queue_depth", "gauge", "Frames waiting to be read", self.queue_depth()),
+                ("ocr_uptime_seconds", "gauge", "Seconds since the worker started", round(up)),
+            ]
+        lines = []
+        for name, kind, help, value in samples:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics: Metrics, port: int):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    srv = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True, name="metrics").start()
+
+
+# ─── result store ─────────────────────────────────────────────────────────────
+
+class ResultDB:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS ocr_results (
+            name   TEXT PRIMARY KEY,
+            mtime  REAL,
+            text   TEXT,
+            digits TEXT,
+            conf   REAL,
+            raw    TEXT,
+            ms     REAL,
+            error  TEXT,
+            done_at REAL,
+            attempts INTEGER DEFAULT 1)""")
+        try:                                  # databases from before retries
+            self.db.execute("ALTER TABLE ocr_results ADD COLUMN attempts INTEGER DEFAULT 1")
+        except sqlite3.OperationalError:
+            pass
+        self.db.commit()
+
+    def done(self):
+        """Frames that need no further read: succeeded, or out of attempts."""
+        return {r[0] for r in self.db.execute(
+            "SELECT name FROM ocr_results WHERE error IS NULL OR attempts >= ?",
+            (MAX_ATTEMPTS,))}
+
+    def failures(self):
+        """name → attempts so far, for frames whose last read failed."""
+        return dict(self.db.execute(
+            "SELECT name, attempts FROM ocr_results WHERE error IS NOT NULL"))
+
+    def store(self, rows):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO ocr_results "
+            "(name, mtime, text, digits, conf, raw, ms, error, done_at, attempts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+
+# ─── watcher ──────────────────────────────────────────────────────────────────
+
+def _stat(path: Path):
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def watch(root: Path, jobs: "queue.Queue", done: set):
+    """Queue every new frame in `root` once (poll, rescans on dir change).
+
+    A frame is queued only after its size and mtime held still for one
+    poll, so a writer that isn't atomic never hands the reader half a JPEG."""
+    seen = set(done)
+    settling = {}                # name → (size, mtime_ns) at the last poll
+    last_mtime = None
+    while True:
+        try:
+            mtime = root.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime is not None and mtime != last_mtime:
+            last_mtime = mtime
+            with os.scandir(root) as it:
+                for e in it:
+                    if e.is_file() and wanted(e.name) and e.name not in seen:
+                        seen.add(e.name)
+                        settling[e.name] = None
+        for name in sorted(settling):
+            st = _stat(root / name)
+            if st is None:
+                del settling[name]
+                seen.discard(name)           # gone; queue it if it comes back
+            elif st == settling[name]:
+                del settling[name]
+                jobs.put((name, time.time()))
+            else:
+                settling[name] = st
+        time.sleep(POLL_SEC)
+
+
+# ─── worker ───────────────────────────────────────────────────────────────────
+
+def summarize(result):
+    """easyocr [(bbox, text, conf), …] → (text, digits, best conf, raw json)."""
+    texts = [t for _, t, _ in result]
+    conf = max((float(c) for _, _, c in result), default=None)
+    text = " ".join(texts)
+    digits = "".join(re.findall(r"\d", text))
+    raw = json.dumps([[[list(map(float, pt)) for pt in box], t, float(c)]
+                      for box, t, c in result])
+    return text, digits, conf, raw
+
+
+def next_batch(jobs: "queue.Queue"):
+    batch = [jobs.get()]
+    deadline = time.time() + BATCH_WAIT
+    while len(batch) < BATCH_SIZE:
+        timeout = deadline - time.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(jobs.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return batch
+
+
+def read_batch(reader, paths):
+    """One result list per path; falls back to per-image reads."""
+    if hasattr(reader, "readtext_batched") and len(paths) > 1:
+        try:
+            return reader.readtext_batched([str(p) for p in paths], batch_size=len(paths))
+        except Exception:
+            pass                                # e.g. mixed sizes – go one by one
+    return [reader.readtext(str(p)) for p in paths]
+
+
+def run_worker():
+    import easyocr
+    t0 = time.time()
+    reader = easyocr.Reader(LANGS, gpu=USE_GPU)
+    print(f"🔤 easyocr reader ready in {time.time() - t0:.1f}s ({','.join(LANGS)})")
+
+    db = ResultDB(OCR_DB)
+    tries = db.failures()                # name → failed reads so far
+    jobs: "queue.Queue" = queue.Queue()
+    metrics = Metrics()
+    metrics.queue_depth = jobs.qsize
+    serve_metrics(metrics, METRICS_PORT)
+    threading.Thread(target=watch, args=(WATCH_DIR, jobs, db.done()),
+                     daemon=True, name="watch").start()
+    print(f"👀 watching {WATCH_DIR} → {OCR_DB}  (metrics on :{METRICS_PORT}/metrics)")
+
+    while True:
+        batch = next_batch(jobs)
+        paths = [WATCH_DIR / name for name, _ in batch]
+        t = time.time()
+        try:
+            results, err = read_batch(reader, paths), None
+        except Exception as ex:            # unreadable frame in the batch
+            results, err = None, ex
+        ocr_s = time.time() - t
+
+        rows, lat, fail = [], [], 0
+        now = time.time()
+        for i, ((name, seen_at), path) in enumerate(zip(batch, paths)):
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                mtime = None
+            if results is None:
+                try:
+                    res = reader.readtext(str(path))
+                except Exception as ex:
+                    n = tries[name] = tries.get(name, 0) + 1
+                    rows.append((name, mtime, None, None, None, None, None, str(ex), now, n))
+                    fail += 1
+                    if n < MAX_ATTEMPTS and mtime is not None:
+                        jobs.put((name, seen_at))     # back of the queue
+                    continue
+            else:
+                res = results[i]
+            text, digits, conf, raw = summarize(res)
+            rows.append((name, mtime, text, digits, conf, raw,
+                         ocr_s / len(batch) * 1000, None, now, tries.pop(name, 0) + 1))
+            lat.append(now - seen_at)
+        db.store(rows)
+        metrics.record_batch(len(batch) - fail, fail, ocr_s, lat)
+        if err is not None:
+            print(f"⚠️ batch read failed ({err}); retried one by one")
+        print(f"✓ {len(batch)} frame(s) in {ocr_s * 1000:.0f} ms "
+              f"(queue {jobs.qsize()})")
+
 
-image ="/home/jake/fair_roller/ocr-processor/test_images/d6_04.jpg"
-reader = easyocr.Reader(['en'], gpu=False)
-result = reader.readtext(image)
-print(result)
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        import easyocr
+        reader = easyocr.Reader(LANGS, gpu=USE_GPU)
+        for path in sys.argv[1:]:
+            print(path, reader.readtext(path))
+    else:
+        run_worker()
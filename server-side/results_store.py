@@ -0,0 +1,202 @@
+# results_store.py
+#
+# Durable, indexed record of runs and rolls (SQLite, WAL mode).
+#
+#   runs        one row per /start – rig, sides, config snapshot, total
+#   rolls       (run_id, rig, seq) → frame path, predicted face, confidence
+#   face_counts (run_id, face) → n, updated in the same transaction as the
+#               roll, so fairness stats never need a scan
+#
+# stats(run_id) reads `sides` counters and derives chi-square, its p-value
+# and per-face z-scores: O(sides) no matter how many rolls the run has.
+
+import json
+import math
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+DB_PATH = "results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    rig        TEXT,
+    sides      INTEGER NOT NULL,
+    started_at REAL    NOT NULL,
+    config     TEXT,
+    total      INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS rolls (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    rig    TEXT    NOT NULL,
+    seq    INTEGER NOT NULL,
+    ts     REAL    NOT NULL,
+    path   TEXT,
+    face   INTEGER,
+    conf   REAL,
+    PRIMARY KEY (run_id, rig, seq)
+);
+CREATE INDEX IF NOT EXISTS rolls_by_ts ON rolls(ts);
+CREATE TABLE IF NOT EXISTS face_counts (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    face   INTEGER NOT NULL,
+    n      INTEGER NOT NULL,
+    PRIMARY KEY (run_id, face)
+);
+"""
+
+
+# ─── chi-square tail without scipy ───────────────────────────────────────────
+
+def _gammaincc(a: float, x: float) -> float:
+    """Regularized upper incomplete gamma Q(a, x) (Numerical Recipes 6.2)."""
+    if x <= 0:
+        return 1.0
+    lg = math.lgamma(a)
+    if x < a + 1:                              # series for P, then 1 - P
+        term = total = 1.0 / a
+        ap = a
+        for _ in range(1000):
+            ap += 1
+            term *= x / ap
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - total * math.exp(-x + a * math.log(x) - lg))
+    b = x + 1 - a                              # continued fraction for Q
+    c = 1 / 1e-300
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1e-300 if abs(d) < 1e-300 else d
+        c = b + an / c
+        c = 1e-300 if abs(c) < 1e-300 else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return math.exp(-x + a * math.log(x) - lg) * h
+
+
+def chi2_sf(x: float, dof: int) -> float:
+    return _gammaincc(dof / 2.0, x / 2.0)
+
+
+def fairness(counts: Dict[int, int], sides: int) -> Dict[str, Any]:
+    """Goodness-of-fit of face counts against a fair `sides`-sided die."""
+    total = sum(counts.values())
+    out = {"total": total, "sides": sides,
+           "counts": {f: counts.get(f, 0) for f in range(1, sides + 1)}}
+    if total == 0 or sides < 2:
+        return {**out, "chi2": None, "dof": sides - 1, "p_value": None, "z": {}}
+    p = 1.0 / sides
+    exp = total * p
+    sd = math.sqrt(total * p * (1 - p))
+    chi2 = sum((n - exp) ** 2 / exp for n in out["counts"].values())
+    return {**out,
+            "expected": exp,
+            "chi2": chi2,
+            "dof": sides - 1,
+            "p_value": chi2_sf(chi2, sides - 1),
+            "z": {f: (n - exp) / sd for f, n in out["counts"].items()},
+            "max_abs_z": max(abs(n - exp) / sd for n in out["counts"].values())}
+
+
+# ─── store ───────────────────────────────────────────────────────────────────
+
+class ResultsStore:
+    """Thread-safe; call from worker threads, not the event loop."""
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")   # durable at checkpoint, fast commits
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ─── runs ───────────────────────────────────────────────────
+    def start_run(self, sides: int, rig: Optional[str] = None,
+                  config: Optional[Dict[str, Any]] = None) -> int:
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO runs (rig, sides, started_at, config) VALUES (?, ?, ?, ?)",
+                (rig, sides, time.time(), json.dumps(config or {})))
+            return cur.lastrowid
+
+    def latest_run(self) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute("SELECT MAX(run_id) FROM runs").fetchone()
+        return row[0]
+
+    def runs(self, limit: int = 20):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT run_id, rig, sides, started_at, total FROM runs "
+                "ORDER BY run_id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(("run_id", "rig", "sides", "started_at", "total"), r)) for r in rows]
+
+    # ─── rolls ──────────────────────────────────────────────────
+    def record_roll(self, run_id: int, rig: str, seq: int, path: str,
+                    face: Optional[int], conf: Optional[float]):
+        """Insert (or replace a re-uploaded) roll and update the counters."""
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                old = db.execute("SELECT face FROM rolls WHERE run_id=? AND rig=? AND seq=?",
+                                 (run_id, rig, seq)).fetchone()
+                if old is None:
+                    db.execute("UPDATE runs SET total = total + 1 WHERE run_id=?", (run_id,))
+                elif old[0] is not None:
+                    db.execute("UPDATE face_counts SET n = n - 1 WHERE run_id=? AND face=?",
+                               (run_id, old[0]))
+                db.execute("INSERT OR REPLACE INTO rolls (run_id, rig, seq, ts, path, face, conf) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (run_id, rig, seq, time.time(), path, face, conf))
+                if face is not None:
+                    db.execute("INSERT INTO face_counts (run_id, face, n) VALUES (?, ?, 1) "
+                               "ON CONFLICT(run_id, face) DO UPDATE SET n = n + 1",
+                               (run_id, face))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def roll(self, run_id: int, rig: str, seq: int):
+        with self._lock:
+            r = self._db.execute("SELECT ts, path, face, conf FROM rolls "
+                                 "WHERE run_id=? AND rig=? AND seq=?",
+                                 (run_id, rig, seq)).fetchone()
+        return None if r is None else dict(zip(("ts", "path", "face", "conf"), r))
+
+    # ─── stats ──────────────────────────────────────────────────
+    def counts(self, run_id: int) -> Dict[int, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT face, n FROM face_counts WHERE run_id=?",
+                                    (run_id,)).fetchall()
+        return {f: n for f, n in rows}
+
+    def stats(self, run_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:                    # total and face counts from one moment
+            row = self._db.execute("SELECT sides, total FROM runs WHERE run_id=?",
+                                   (run_id,)).fetchone()
+            rows = self._db.execute("SELECT face, n FROM face_counts WHERE run_id=?",
+                                    (run_id,)).fetchall()
+        if row is None:
+            return None
+        sides, total = row
+        out = fairness({f: n for f, n in rows}, sides)
+        out["run_id"] = run_id
+        out["unclassified"] = total - out["total"]
+        return out
@@ -1,14 +1,31 @@
 # server_test.py
 
 from fastapi import FastAPI, WebSocket, Request, Query, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from classifier import DICEMATCHER_DIR, DiceClassifier
+from fanout import Fanout
+from metrics import REGISTRY, Counter, Gauge, Histogram, RateMeter, SamplingProfiler
+from results_store import ResultsStore
+import asyncio
 import io
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(DICEMATCHER_DIR)      # numpy-only helpers shared with dicematcher/
+from frame_quality import WIDTH as QUALITY_WIDTH, QualityGate, downscale
 
 app = FastAPI()
 
@@ -26,7 +43,7 @@ async def serve_index():
 
 # ─── In-memory state ──────────────────────────────────────────────────────────
 
-clients: set[WebSocket] = set()  # active WS clients
+clients = Fanout()                # active WS clients, one send queue each
 
 config: Dict[str, Any] = {       # dynamic run configuration
     "sides":        6,           # number of die faces
@@ -41,6 +58,111 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 
 CROP_RATIO = 0.75  # fraction of short edge to keep for center-square crop
 
+# How the center crop is produced:
+#   "lossless" – jpegtran cuts the JPEG on MCU boundaries in the DCT domain:
+#                no decode, no re-encode, no generation loss.  Needs the
+#                `jpegtran` binary (libjpeg-turbo-progs); falls back to "full".
+#   "draft"    – libjpeg scaled decode (1/2, 1/4, 1/8) so the crop is just
+#                ≥ DRAFT_MIN_SIDE px – enough for the 150/256 px classifiers.
+#   "full"     – full-resolution decode + crop + encode.
+CROP_MODE      = "lossless"
+DRAFT_MIN_SIDE = 256
+SAVE_QUALITY   = 90    # PIL quality (1–95) for re-encoded crops; config's
+                       # jpeg_quality is the camera's 0–63 scale, not PIL's
+JPEGTRAN       = shutil.which("jpegtran")
+
+
+@app.on_event("startup")
+async def check_crop_mode():
+    if CROP_MODE == "lossless" and JPEGTRAN is None:
+        print("⚠️ jpegtran not found (apt install libjpeg-turbo-progs): "
+              "lossless crops fall back to a full decode + re-encode")
+
+# Frame-quality gate (dicematcher/frame_quality.py): blur, motion against
+# the rig's previous frame and exposure, measured on a 1/8-scale grey
+# decode before any crop or classifier work.
+#   "off"       – not checked
+#   "flag"      – every frame is processed; the metrics ride along in
+#                 step_ok and the upload response
+#   "reject"    – bad frames are dropped: not archived, classified or recorded
+#   "recapture" – as "reject", and the rig is sent {"cmd": "recapture"} over
+#                 its WS to photograph that seq again; after MAX_RECAPTURES
+#                 tries the frame is kept (flagged)
+QUALITY_GATE   = os.getenv("QUALITY_GATE", "flag")
+MAX_RECAPTURES = 2
+RECAPTURE_TTL  = 120.0   # s a rig has to send the new shot before its count is dropped
+MAX_PENDING    = 1024    # (rig, seq) counts kept at most, oldest dropped first
+quality_gate   = QualityGate()
+# (rig, seq) → [recaptures requested, time of the first]; insertion order is
+# age order, so pruning only ever looks at the front
+recaptures: Dict[tuple, list] = {}
+
+
+def _prune_recaptures(now: float):
+    """Forget seqs whose rig never sent the recapture (or sent too late)."""
+    while recaptures:
+        key, (_, first) = next(iter(recaptures.items()))
+        if now - first < RECAPTURE_TTL and len(recaptures) < MAX_PENDING:
+            break
+        del recaptures[key]
+
+# Warm model that classifies every upload as it lands (see classifier.py);
+# disabled with a log line if the model file or tensorflow is missing.
+classifier = DiceClassifier()
+
+
+@app.on_event("startup")
+async def load_classifier():
+    if await classifier.start():
+        print(f"🧠 Classifier ready: {classifier.model_path} {classifier.size}")
+    else:
+        print(f"⚠️ Classifier disabled ({classifier.error})")
+
+
+@app.on_event("shutdown")
+async def stop_classifier():
+    await classifier.stop()
+
+# Durable run/roll record with incremental fairness stats (SQLite WAL)
+RESULTS_DB  = os.getenv("RESULTS_DB", "results.db")
+results     = ResultsStore(RESULTS_DB)
+current_run: Optional[int] = results.latest_run()   # survives restarts mid-run
+run_lock    = asyncio.Lock()      # one run, even when several first uploads race
+
+# Decode/crop/encode/write runs here, never on the event loop.  PIL drops
+# the GIL while decoding/encoding, so threads give real parallelism.
+PROC_WORKERS  = min(4, os.cpu_count() or 1)
+MAX_INFLIGHT  = 2 * PROC_WORKERS   # uploads admitted to the pool at once
+proc_pool     = ThreadPoolExecutor(max_workers=PROC_WORKERS, thread_name_prefix="upload")
+proc_slots    = asyncio.Semaphore(MAX_INFLIGHT)
+
+# ─── Metrics (Prometheus text at /metrics) ────────────────────────────────────
+
+STAGE         = Histogram("roll_stage_seconds", "Upload hot-path time per stage",
+                          labelnames=("stage",))
+UPLOADS       = Counter("roll_uploads_total", "Frames received on /upload")
+UPLOAD_BYTES  = Counter("roll_upload_bytes_total", "Request body bytes received on /upload")
+STORED_BYTES  = Counter("roll_stored_bytes_total", "Cropped JPEG bytes written to uploads/")
+CROP_FALLBACK = Counter("roll_crop_fallbacks_total", "Lossless crops that fell back to decoding")
+REJECTED      = Counter("roll_frames_rejected_total", "Frames dropped by the quality gate")
+RECAPTURED    = Counter("roll_recaptures_total", "Recapture commands sent to rigs")
+INFLIGHT      = Gauge("roll_uploads_inflight", "Uploads admitted and not yet answered")
+upload_rate   = RateMeter(window=10.0)
+Gauge("roll_upload_fps", "Frames/s over the last 10 s", fn=upload_rate.rate)
+Gauge("ws_clients", "Connected WebSocket clients", fn=lambda: len(clients))
+Gauge("ws_send_queue_depth_max", "Deepest per-client send queue",
+      fn=lambda: max(clients.queue_depths(), default=0))
+Gauge("ws_send_queue_depth_sum", "Messages queued across all clients",
+      fn=lambda: sum(clients.queue_depths()))
+Counter("ws_evictions_total", "WS clients dropped for full queues / stalled sends",
+        fn=lambda: clients.evicted)
+
+# Sampling profiler – a thread that exists only while switched on
+# (PROFILER=1 at startup, or POST /debug/profiler?on=true)
+profiler = SamplingProfiler()
+if os.getenv("PROFILER") == "1":
+    profiler.start()
+
 # ─── WebSocket endpoint ──────────────────────────────────────────────────────
 
 @app.websocket("/ws")
@@ -52,62 +174,251 @@ async def websocket_endpoint(ws: WebSocket):
         while True:
             msg = await ws.receive_text()
             print(f"← WS recv: {msg}")
-            # Only handle the initial handshake
+            # Only handle the initial handshake (sent through the client's
+            # queue so it never races its writer task)
             if msg == "ws_hello":
-                await ws.send_json({"evt": "ready"})
+                clients.send(ws, {"evt": "ready"})
             # otherwise ignore – we broadcast events separately
     except Exception as ex:
         print("⚠️ WS disconnected:", ex)
     finally:
-        clients.discard(ws)
+        clients.remove(ws)
 
 
 # ─── Broadcast helper ─────────────────────────────────────────────────────────
 
 async def broadcast(cmd: Dict[str, Any]):
-    dead = []
-    for ws in clients:
-        try:
-            await ws.send_json(cmd)
-        except:
-            dead.append(ws)
-    for ws in dead:
-        clients.discard(ws)
+    # queues per client and returns at once – slow sockets are the
+    # writer tasks' problem (see fanout.py for drop/coalesce/evict rules)
+    clients.publish(cmd)
 
 # ─── Upload endpoint with center‐crop ─────────────────────────────────────────
 
-# server_test.py
+def _publish_preview(src: Path, preview: Path):
+    """Point <seq>.jpg at the archive file without encoding it again."""
+    tmp = preview.with_name(preview.name + ".tmp")
+    try:
+        tmp.unlink(missing_ok=True)
+        os.link(src, tmp)                 # same bytes, no copy
+    except OSError:
+        shutil.copyfile(src, tmp)         # e.g. filesystem without hard links
+    os.replace(tmp, preview)              # atomic swap for readers
 
-@app.post("/upload")
-async def upload_image(request: Request, seq: int = Query(...)):
-    data = await request.body()
-    if not data:
-        raise HTTPException(status_code=400, detail="No data received")
 
-    # decode and crop (as before)
-    img = Image.open(io.BytesIO(data))
+def _mcu_size(img):
+    """MCU width/height in px from the JPEG's max sampling factors."""
+    layers = getattr(img, "layer", None) or [(0, 1, 1, 0)]
+    return 8 * max(l[1] for l in layers), 8 * max(l[2] for l in layers)
+
+
+def _crop_lossless(data: bytes, img):
+    """Center-square crop in the DCT domain, or None if not possible."""
+    if JPEGTRAN is None or img.format != "JPEG":
+        return None
+    w, h = img.size
+    side = int(min(w, h) * CROP_RATIO)
+    # jpegtran can only start a crop on an MCU boundary: snap the corner
+    # up/left, keeping the square inside the frame
+    mx, my = _mcu_size(img)
+    left = (w - side) // 2 // mx * mx
+    top  = (h - side) // 2 // my * my
+    try:
+        with STAGE.time("jpegtran"):
+            out = subprocess.run(
+                [JPEGTRAN, "-copy", "none", "-crop", f"{side}x{side}+{left}+{top}"],
+                input=data, capture_output=True, check=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return (out, side) if out else None
+
+
+def _crop_decoded(img, min_side: int = 0):
+    """Decode (optionally at reduced scale), center-crop, encode once."""
+    if min_side and img.format == "JPEG":
+        w, h = img.size
+        shrink = min(w, h) * CROP_RATIO / min_side
+        if shrink >= 2:
+            # libjpeg picks the largest 1/2^n scale that stays ≥ this size
+            img.draft("RGB", (math.ceil(w / shrink), math.ceil(h / shrink)))
     w, h = img.size
     side = int(min(w, h) * CROP_RATIO)
     left = (w - side) // 2
     top  = (h - side) // 2
-    cropped = img.crop((left, top, left + side, top + side))
+    with STAGE.time("decode"):
+        cropped = img.crop((left, top, left + side, top + side))   # decodes
 
-    # 1) save the timestamped archive
-    ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-    fn = UPLOAD_DIR / f"{ts}_seq{seq}_{side}x{side}.jpg"
-    with open(fn, "wb") as f:
-        cropped.save(f, format="JPEG", quality=config["jpeg_quality"])
-    print(f"← Saved cropped seq={seq} → {fn} ({side}×{side})")
+    buf = io.BytesIO()
+    with STAGE.time("encode"):
+        cropped.save(buf, format="JPEG", quality=SAVE_QUALITY)
+    return buf.getvalue(), side
+
+
+def _check_quality(data: bytes, rig_id: str):
+    """Quality verdict from a reduced-scale grey decode of the frame."""
+    img = Image.open(io.BytesIO(data))
+    w, h = img.size
+    # JPEG: libjpeg decodes straight to 1/2–1/8 scale, luma only
+    img.draft("L", (QUALITY_WIDTH, max(1, h * QUALITY_WIDTH // w)))
+    small = downscale(np.asarray(img.convert("L")))
+    # sharpness over the square that gets cropped and classified, where the die is
+    sh, sw = small.shape
+    side = min(sw, sh) * CROP_RATIO
+    roi = ((sw - side) / 2, (sh - side) / 2, side, side)
+    return quality_gate.check(small, rig_id, roi=roi)
+
+
+def _process_upload(data: bytes, seq: int, rig_id: str, t_admit: float, enforce: bool):
+    """Quality check, crop, write the archive and the preview (runs in
+    proc_pool).  A frame that fails the gate while `enforce` is set comes
+    back as (verdict, None, None, None) without being written."""
+    STAGE.observe(time.perf_counter() - t_admit, "pool_wait")
+    verdict = None
+    if QUALITY_GATE != "off":
+        with STAGE.time("quality"):
+            verdict = _check_quality(data, rig_id)
+        if enforce and not verdict.ok:
+            return verdict, None, None, None
+
+    img = Image.open(io.BytesIO(data))    # header only – no pixels decoded yet
+    res = _crop_lossless(data, img) if CROP_MODE == "lossless" else None
+    if res is None:
+        if CROP_MODE == "lossless":
+            CROP_FALLBACK.inc()
+        res = _crop_decoded(img, DRAFT_MIN_SIDE if CROP_MODE == "draft" else 0)
+    jpeg, side = res
+
+    with STAGE.time("write"):
+        # 1) save the timestamped archive
+        ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        fn = UPLOAD_DIR / f"{ts}_seq{seq}_{side}x{side}.jpg"
+        # dotfile until complete: the OCR worker and image host skip those
+        tmp = fn.with_name(f".{fn.name}.tmp")
+        tmp.write_bytes(jpeg)
+        os.replace(tmp, fn)
+
+        # 2) the simple preview file named <seq>.jpg shares those bytes
+        _publish_preview(fn, UPLOAD_DIR / f"{seq}.jpg")
+    STORED_BYTES.inc(len(jpeg))
+
+    # 3) model input for the classifier, prepared here off the event loop
+    x = None
+    if classifier.ready:
+        with STAGE.time("prepare"):
+            x = classifier.prepare(jpeg)
+    return verdict, fn, side, x
+
+
+def _rounded(metrics: Dict[str, Any]):
+    return {k: None if v is None else round(v, 3) for k, v in metrics.items()}
+
+
+async def _reject_frame(seq: int, rig_id: str, host: Optional[str], verdict, retry: bool):
+    """Report a frame the gate dropped and, if allowed, ask its rig for another."""
+    REJECTED.inc()
+    quality = _rounded(verdict.metrics)
+    print(f"🚫 seq={seq} rejected: {', '.join(verdict.reasons)}")
+    await broadcast({"evt": "frame_rejected", "seq": seq,
+                     "reasons": verdict.reasons, "quality": quality})
+    sent = False
+    if retry:
+        now = time.monotonic()
+        _prune_recaptures(now)
+        recaptures.setdefault((rig_id, seq), [0, now])[0] += 1
+        # queued before the HTTP reply, so it's waiting for the rig's next wsLoop()
+        sent = host is not None and clients.send_to_host(
+            host, {"cmd": "recapture", "seq": seq}) > 0
+        if sent:
+            RECAPTURED.inc()
+        else:
+            print(f"⚠️ no WS connection from {host}; can't ask for seq={seq} again")
+    return {"status": "rejected", "seq": seq, "reasons": verdict.reasons,
+            "quality": quality, "recapture": sent}
+
+
+async def _ensure_run() -> int:
+    """The current run id, creating the run on first use."""
+    global current_run
+    async with run_lock:
+        if current_run is None:
+            current_run = await asyncio.get_running_loop().run_in_executor(
+                proc_pool, results.start_run, config["sides"], None, dict(config))
+        return current_run
+
+
+@app.post("/upload")
+async def upload_image(request: Request, seq: int = Query(...),
+                       rig: Optional[str] = Query(None)):
+    t_start = time.perf_counter()
+    INFLIGHT.inc()
+    try:
+        return await _handle_upload(request, seq, rig, t_start)
+    finally:
+        INFLIGHT.dec()
+        STAGE.observe(time.perf_counter() - t_start, "total")
 
-    # 2) also save a simple preview file named <seq>.jpg
-    preview_fn = UPLOAD_DIR / f"{seq}.jpg"
-    with open(preview_fn, "wb") as f2:
-        cropped.save(f2, format="JPEG", quality=config["jpeg_quality"])
 
-    # 3) broadcast the step_ok to all WS clients
-    await broadcast({"evt": "step_ok", "seq": seq})
+async def _handle_upload(request: Request, seq: int, rig: Optional[str], t_start: float):
+    data = await request.body()
+    t = time.perf_counter()
+    STAGE.observe(t - t_start, "receive")
+    if not data:
+        raise HTTPException(status_code=400, detail="No data received")
+    UPLOADS.inc()
+    UPLOAD_BYTES.inc(len(data))
+    upload_rate.mark()
+
+    host = request.client.host if request.client else None
+    rig_id = rig or host or "unknown"
+    # seq 0 (the rig's VERIFY_DIE test shot) is only ever flagged
+    retry = (QUALITY_GATE == "recapture" and seq > 0
+             and recaptures.get((rig_id, seq), [0])[0] < MAX_RECAPTURES)
+    enforce = retry or (QUALITY_GATE == "reject" and seq > 0)
+
+    # bounded: extra uploads wait here instead of piling up in the pool
+    async with proc_slots:
+        t_admit = time.perf_counter()
+        STAGE.observe(t_admit - t, "admission")
+        loop = asyncio.get_running_loop()
+        verdict, fn, side, x = await loop.run_in_executor(
+            proc_pool, _process_upload, data, seq, rig_id, t_admit, enforce)
+    if fn is None:
+        return await _reject_frame(seq, rig_id, host, verdict, retry)
+    recaptures.pop((rig_id, seq), None)   # kept, incl. the final try: done with it
+    print(f"← Saved cropped seq={seq} → {fn} ({side}×{side})")
 
-    return {"status": "ok", "filename": str(fn)}
+    # 4) classify (micro-batched with uploads from other rigs)
+    result = {}
+    if verdict is not None:
+        result["quality"] = _rounded(verdict.metrics)
+        if not verdict.ok:
+            result["quality_issues"] = verdict.reasons
+            print(f"⚠️ seq={seq} kept despite: {', '.join(verdict.reasons)}")
+    if x is not None:
+        try:
+            with STAGE.time("classify"):
+                face, conf = await classifier.classify(x)
+        except (Exception, asyncio.CancelledError) as ex:
+            if asyncio.current_task().cancelling():
+                raise                       # the request itself is going away
+            # the frame is already archived: record it unclassified and still
+            # send step_ok, or the rig re-rolls this seq forever
+            print(f"⚠️ seq={seq} not classified: {ex!r}")
+        else:
+            result.update(face=face, conf=round(conf, 4))
+            print(f"🎲 seq={seq} → face {face} ({conf:.2f})")
+
+    # 5) record the roll (seq 0 is the rig's VERIFY_DIE test shot)
+    if seq > 0:
+        run_id = await _ensure_run()
+        with STAGE.time("record"):
+            await loop.run_in_executor(proc_pool, results.record_roll, run_id, rig_id,
+                                       seq, str(fn), result.get("face"), result.get("conf"))
+
+    # 6) broadcast the step_ok to all WS clients
+    with STAGE.time("broadcast"):
+        await broadcast({"evt": "step_ok", "seq": seq, **result})
+
+    return {"status": "ok", "filename": str(fn), **result}
 
 # ─── Config endpoints ─────────────────────────────────────────────────────────
 
@@ -128,10 +439,14 @@ async def set_config(updates: Dict[str, Any]):
 
 @app.post("/start")
 async def start_run():
+    global current_run
+    async with run_lock:
+        current_run = await asyncio.get_running_loop().run_in_executor(
+            proc_pool, results.start_run, config["sides"], None, dict(config))
     cmd = {"cmd": "start", **config}
     await broadcast(cmd)
     print("→ cmd_start sent:", cmd)
-    return {"status": "started", "cmd": cmd}
+    return {"status": "started", "run_id": current_run, "cmd": cmd}
 
 @app.post("/pause")
 async def pause_run():
@@ -151,6 +466,46 @@ async def stop_run():
     print("→ cmd_stop sent")
     return {"status": "stopped"}
 
+# ─── Results endpoints ────────────────────────────────────────────────────────
+
+@app.get("/runs")
+def list_runs(limit: int = Query(20, ge=1, le=1000)):
+    return results.runs(limit)
+
+@app.get("/runs/{run_id}/stats")
+def run_stats(run_id: int):
+    stats = results.stats(run_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No run {run_id}")
+    return stats
+
+@app.get("/stats")
+def current_stats():
+    if current_run is None:
+        raise HTTPException(status_code=404, detail="No run yet")
+    return results.stats(current_run)
+
+# ─── Metrics / profiling endpoints ────────────────────────────────────────────
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # on the event loop, like the fanout / run state the gauges read
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/debug/profiler")
+def toggle_profiler(on: bool = Query(...), interval_ms: float = Query(10.0, gt=0)):
+    if on:
+        profiler.start(interval_ms / 1000.0)
+    else:
+        profiler.stop()
+    return {"running": profiler.running, "interval_ms": profiler.interval * 1000,
+            "samples": profiler.total()}
+
+@app.get("/debug/profiler", response_class=PlainTextResponse)
+async def profiler_stacks():
+    # folded stacks: pipe into flamegraph.pl or load in speedscope
+    return PlainTextResponse(profiler.folded())
+
 # ─── Main ─────────────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
@@ -75,9 +75,17 @@
     // When a step completes, load the preview
     if (msg.evt === 'step_ok' && typeof msg.seq === 'number') {
       stateEl.textContent = `Rolling… seq ${msg.seq}`;
+      if (typeof msg.face === 'number') {
+        stateEl.textContent += ` → face ${msg.face} (${(msg.conf * 100).toFixed(0)}%)`;
+      }
       // Preview file is saved by server as "<seq>.jpg"
       preview.src = `/uploads/${msg.seq}.jpg?` + Date.now();
     }
+
+    // Quality gate dropped a frame (blur / motion / exposure)
+    if (msg.evt === 'frame_rejected' && typeof msg.seq === 'number') {
+      stateEl.textContent = `seq ${msg.seq} rejected: ${msg.reasons.join(', ')}`;
+    }
   };
 
   ws.onclose = () => {